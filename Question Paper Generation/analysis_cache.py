@@ -0,0 +1,200 @@
+"""Per-chunk topic analysis results for incremental re-analysis.
+
+Content is compacted and cut into chunks whose boundaries depend only on
+the text around them, so adding a chapter to a course only creates new
+chunks where the text changed.  Topics found for each chunk are stored
+under the chunk's content hash; re-analysing an updated corpus only needs
+the model for chunks that are not in the store yet.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+
+from werkzeug.utils import secure_filename
+
+from text_compaction import CHARS_PER_TOKEN, estimate_tokens, iter_compacted_lines
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to an in-process lock only
+    fcntl = None
+
+# Target chunk size in tokens; chunks are at least a quarter and at most twice this
+CHUNK_TOKENS = 1000
+
+IMPORTANCE_RANK = {'High': 3, 'Medium': 2, 'Low': 1}
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.?!])\s+')
+
+
+# --- Chunking ---
+def _split_long_line(line, max_tokens):
+    """Split a line longer than max_tokens at sentence (or word) boundaries."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    current = ''
+    for sentence in _SENTENCE_SPLIT_RE.split(line):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, chunk_tokens=CHUNK_TOKENS):
+    """Compact text and cut it into content-defined chunks.
+
+    A chunk ends after a line when a hash of that line falls below a
+    threshold proportional to the line's size, so boundaries are decided by
+    the text itself rather than by its offset in the document.
+    """
+    min_tokens = chunk_tokens // 4
+    max_tokens = chunk_tokens * 2
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for line in iter_compacted_lines(text):
+        pieces = [line] if estimate_tokens(line) <= max_tokens else _split_long_line(line, max_tokens)
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+
+            current.append(piece)
+            current_tokens += tokens
+
+            threshold = min(tokens / chunk_tokens, 1.0) * 0xFFFFFFFF
+            if current_tokens >= min_tokens and zlib.crc32(piece.encode('utf-8')) <= threshold:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def chunk_hash(chunk):
+    """Return the content hash used as the store key for a chunk."""
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+# --- Topic Store ---
+class ChunkTopicStore:
+    """Topics per chunk hash, persisted as one JSON file per subject and shared by all workers."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock_path = os.path.join(folder, 'topics.lock')
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize writers within this process and, where fcntl exists, across workers."""
+        with self._lock:
+            with open(self.lock_path, 'a') as handle:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _path(self, subject):
+        name = secure_filename(subject.strip().lower()) or 'general'
+        return os.path.join(self.folder, f"{name}.json")
+
+    def _read(self, subject):
+        try:
+            with open(self._path(subject), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def get_many(self, subject, hashes):
+        """Return {hash: topics} for the hashes that are already stored."""
+        # Files are replaced atomically, so reading needs no lock
+        stored = self._read(subject)
+        return {h: stored[h] for h in hashes if h in stored}
+
+    def put_many(self, subject, results):
+        """Store {hash: topics} results for a subject."""
+        if not results:
+            return
+        # Read-modify-write of the subject file, so hold the lock across both
+        with self._locked():
+            stored = self._read(subject)
+            stored.update(results)
+            path = self._path(subject)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, path)
+
+
+# --- Merging ---
+def _topic_key(name):
+    return ' '.join(str(name).lower().split())
+
+
+def _merge_list(target, values):
+    seen = {_topic_key(v) for v in target}
+    for value in values or []:
+        key = _topic_key(value)
+        if key and key not in seen:
+            seen.add(key)
+            target.append(value)
+
+
+def merge_topics(topic_lists):
+    """Merge per-chunk topic lists into one list, combining duplicate topics.
+
+    Topics with the same name (ignoring case and spacing) are combined:
+    subtopics and question types are unioned and the highest importance
+    wins.  The result is ordered by importance, then by how many chunks
+    mention the topic.
+    """
+    merged = {}
+    mentions = {}
+    for topics in topic_lists:
+        for topic in topics:
+            if not isinstance(topic, dict) or not topic.get('topic'):
+                continue
+            key = _topic_key(topic['topic'])
+            mentions[key] = mentions.get(key, 0) + 1
+            if key not in merged:
+                merged[key] = {
+                    "topic": topic['topic'],
+                    "subtopics": [],
+                    "importance": topic.get('importance', 'Medium'),
+                    "question_types": [],
+                }
+            entry = merged[key]
+            _merge_list(entry['subtopics'], topic.get('subtopics'))
+            _merge_list(entry['question_types'], topic.get('question_types'))
+            if IMPORTANCE_RANK.get(topic.get('importance'), 0) > IMPORTANCE_RANK.get(entry['importance'], 0):
+                entry['importance'] = topic['importance']
+
+    ordered = sorted(
+        merged.items(),
+        key=lambda item: (-IMPORTANCE_RANK.get(item[1]['importance'], 0), -mentions[item[0]])
+    )
+    return [entry for _, entry in ordered]
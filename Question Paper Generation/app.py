@@ -2,50 +2,191 @@ from flask import Flask, request, jsonify, send_file
 import os
 import json
 import uuid
-from datetime import datetime
 import google.generativeai as genai
 from werkzeug.utils import secure_filename
-import requests
-import time
 import io
 import re
 import random
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pdf2image import convert_from_path
 import pytesseract
 from PyPDF2 import PdfReader
-import pandas as pd
-from fpdf import FPDF
-import textwrap
-import markdown
-import pdfkit
-from bs4 import BeautifulSoup
+from json_stream import iter_json_text
+from text_compaction import compact_text, estimate_tokens
+from analysis_cache import ChunkTopicStore, chunk_text, chunk_hash, merge_topics, CHUNK_TOKENS
+from model_client import ModelClient, HttpModel, PRIORITY_INTERACTIVE
+from context_cache import (ContextCache, ContextCacheUnavailable, GeminiContextBackend, HttpContextBackend,
+                           is_cache_missing_error)
+from question_validation import validate_questions, QUESTION_TYPES, DIFFICULTIES
+from past_papers import parse_past_paper, derive_topics, assign_topics
+from corpus_store import CorpusStore, page_separator
+from document_model import build_document, render as render_document, render_error, MIME_TYPES as EXPORT_FORMATS
+from html_renderer import HtmlRenderer, RendererBusy, RenderTimeout
+from paper_store import PaperStore, PaperConflict, PaperEditError
+from request_profiler import RequestProfiler
+from topic_coverage import coverage_report, gap_chunks, redundant_questions, summarize as summarize_coverage
 
 # --- Basic App Configuration ---
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Uploads, stores and caches live here, whatever the working directory (load tests point it elsewhere)
+DATA_DIR = os.environ.get('APP_DATA_DIR') or APP_DIR
+
 def init_app():
     app = Flask(__name__, static_folder='static')
     app.secret_key = os.urandom(24)
-    app.config['UPLOAD_FOLDER'] = 'uploads/'
+    app.config['UPLOAD_FOLDER'] = os.path.join(DATA_DIR, 'uploads')
+    app.config['OUTPUT_FOLDER'] = os.path.join(DATA_DIR, 'temp_outputs')
+    app.config['ANALYSIS_CACHE_FOLDER'] = os.path.join(DATA_DIR, 'analysis_cache')
+    app.config['CORPUS_STORE_FOLDER'] = os.path.join(DATA_DIR, 'corpus_store')
+    app.config['PAPER_STORE_FOLDER'] = os.path.join(DATA_DIR, 'paper_store')
+    # Earlier versions of a paper that can still be fetched or exported
+    app.config['PAPER_KEEP_VERSIONS'] = int(os.environ.get('PAPER_KEEP_VERSIONS', 20))
+    # On-demand request profiling for admins (see request_profiler.py); disabled without ADMIN_TOKEN
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN', '')
+    app.config['PROFILE_FOLDER'] = os.path.join(DATA_DIR, 'profiles')
+    app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 50))
+    # Upper bound on model calls per analysis; chunks left over are picked up by the next re-analysis
+    app.config['ANALYSIS_MAX_BATCHES'] = int(os.environ.get('ANALYSIS_MAX_BATCHES', 8))
     app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB max file size
+    # HTML-to-PDF worker pool (see html_renderer.py)
+    app.config['HTML_PDF_WORKERS'] = int(os.environ.get('HTML_PDF_WORKERS', 2))
+    app.config['HTML_PDF_QUEUE_SIZE'] = int(os.environ.get('HTML_PDF_QUEUE_SIZE', 8))
+    app.config['HTML_PDF_TIMEOUT'] = float(os.environ.get('HTML_PDF_TIMEOUT', 60))
+    # Chunk size in tokens for coverage scoring of a generated paper against its source
+    app.config['COVERAGE_CHUNK_TOKENS'] = int(os.environ.get('COVERAGE_CHUNK_TOKENS', 500))
+    app.config['MODEL_NAME'] = os.environ.get('GEMINI_MODEL', 'gemini-1.5-pro')
+    # HTTP endpoint used instead of the Gemini API (e.g. fake_model_server.py for load tests)
+    app.config['MODEL_BACKEND_URL'] = os.environ.get('MODEL_BACKEND_URL', '')
+    # Client-side limits for model calls (see model_client.py)
+    app.config['MODEL_MAX_CONCURRENCY'] = int(os.environ.get('MODEL_MAX_CONCURRENCY', 16))
+    app.config['MODEL_MAX_RETRIES'] = int(os.environ.get('MODEL_MAX_RETRIES', 4))
+    app.config['MODEL_CALL_TIMEOUT'] = float(os.environ.get('MODEL_CALL_TIMEOUT', 120))
+    app.config['MODEL_RATE_LIMIT'] = int(os.environ.get('MODEL_RATE_LIMIT', 0))  # calls per minute, 0 = no limit
+    # Model-side caching of the content sent with generation prompts (see context_cache.py): auto, gemini, http or off
+    app.config['CONTEXT_CACHE'] = os.environ.get('CONTEXT_CACHE', 'auto').lower()
+    app.config['CONTEXT_CACHE_FOLDER'] = os.path.join(DATA_DIR, 'context_cache')
+    app.config['CONTEXT_CACHE_TTL'] = int(os.environ.get('CONTEXT_CACHE_TTL', 3600))
+    app.config['CONTEXT_CACHE_MIN_TOKENS'] = int(os.environ.get('CONTEXT_CACHE_MIN_TOKENS', 0))  # 0 = the model's minimum
+    # Smallest content each model family caches. Generation content is capped at the generation token
+    # budget, so with a minimum above that budget generation prompts always carry their content inline.
+    app.config['CONTEXT_CACHE_MODEL_MIN_TOKENS'] = {
+        'default': 4096,
+        'gemini-1.5': 32768,
+    }
+    # Prompt token budgets per model and stage; override with ANALYSIS_TOKEN_BUDGET / GENERATION_TOKEN_BUDGET.
+    # Flash models cost a fraction of Pro per input token, so they get more content for a similar spend.
+    app.config['PROMPT_TOKEN_BUDGETS'] = {
+        'default': {'analysis': 4000, 'generation': 6000},
+        'gemini-1.5-flash': {'analysis': 8000, 'generation': 12000},
+    }
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs('temp_outputs', exist_ok=True)
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
     return app
 
 app = init_app()
 
 # --- API Configuration ---
+API_KEY_MISSING = "The GOOGLE_API_KEY environment variable is not set (or set MODEL_BACKEND_URL)."
+
+class MissingApiKeyModel:
+    """Stands in for the model when no API key is set, so the app still imports; every call fails."""
+
+    def generate_content(self, prompt, **kwargs):
+        raise ValueError(API_KEY_MISSING)
+
 def configure_api():
     """Configure Gemini API and ensure environment variables are set."""
+    # Load tests point the app at a fake model server instead of Gemini
+    if app.config['MODEL_BACKEND_URL']:
+        print(f"Using model backend at {app.config['MODEL_BACKEND_URL']}")
+        return HttpModel(app.config['MODEL_BACKEND_URL']), genai
+    
     GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
     
     if not GOOGLE_API_KEY:
-        raise ValueError("The GOOGLE_API_KEY environment variable is not set.")
+        # Local-only work (past paper parsing, exports, stored papers) does not need the model
+        print(f"Warning: {API_KEY_MISSING} Model calls will fail.")
+        return MissingApiKeyModel(), genai
     
     genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-pro')
+    model = genai.GenerativeModel(app.config['MODEL_NAME'])
     return model, genai 
 
 model, genai = configure_api()
 
+def model_setting(table):
+    """The entry of a per-model table for MODEL_NAME: the longest matching name, else 'default'."""
+    # Longest matching entry, so versioned names such as 'gemini-1.5-flash-002' find their family
+    model_name = app.config['MODEL_NAME']
+    matches = [name for name in table if name != 'default' and model_name.startswith(name)]
+    return table[max(matches, key=len) if matches else 'default']
+
+def configure_context_cache():
+    """Pick the context caching backend for the model in use, or None to send content inline."""
+    setting = app.config['CONTEXT_CACHE']
+    if setting == 'off' or isinstance(model, MissingApiKeyModel):
+        return None
+    try:
+        if app.config['MODEL_BACKEND_URL'] and setting in ('auto', 'http'):
+            return HttpContextBackend(app.config['MODEL_BACKEND_URL'])
+        if not app.config['MODEL_BACKEND_URL'] and setting in ('auto', 'gemini'):
+            return GeminiContextBackend(genai, app.config['MODEL_NAME'])
+    except ContextCacheUnavailable as e:
+        print(f"Context caching disabled: {str(e)}")
+        return None
+    print(f"Context caching disabled: CONTEXT_CACHE={setting} does not match the model backend")
+    return None
+
+def context_cache_min_tokens():
+    """Smallest generation content to cache: CONTEXT_CACHE_MIN_TOKENS, else the model's own minimum."""
+    if app.config['CONTEXT_CACHE_MIN_TOKENS']:
+        return app.config['CONTEXT_CACHE_MIN_TOKENS']
+    minimums = app.config['CONTEXT_CACHE_MODEL_MIN_TOKENS']
+    # An HTTP backend has no minimum of its own
+    return minimums['default'] if app.config['MODEL_BACKEND_URL'] else model_setting(minimums)
+
+# All model calls go through this client for rate limiting, retries and coalescing
+model_client = ModelClient(
+    model,
+    max_concurrency=app.config['MODEL_MAX_CONCURRENCY'],
+    max_retries=app.config['MODEL_MAX_RETRIES'],
+    timeout=app.config['MODEL_CALL_TIMEOUT'],
+    rate_limit=app.config['MODEL_RATE_LIMIT']
+)
+
+# Generation content registered with the model once per upload, shared by all workers
+context_cache = ContextCache(
+    app.config['CONTEXT_CACHE_FOLDER'],
+    configure_context_cache(),
+    ttl=app.config['CONTEXT_CACHE_TTL'],
+    min_tokens=context_cache_min_tokens()
+)
+
+# Per-chunk topic results, keyed by chunk content hash
+analysis_store = ChunkTopicStore(app.config['ANALYSIS_CACHE_FOLDER'])
+
+# Extracted text of uploads, memory-mapped and shared by all workers
+corpus_store = CorpusStore(app.config['CORPUS_STORE_FOLDER'])
+
+# Generated papers (versioned) and question banks parsed from uploads
+paper_store = PaperStore(app.config['PAPER_STORE_FOLDER'], keep_versions=app.config['PAPER_KEEP_VERSIONS'])
+
+# Profiles requests flagged with X-Profile by an admin
+request_profiler = RequestProfiler(
+    app.config['PROFILE_FOLDER'],
+    admin_token=app.config['ADMIN_TOKEN'],
+    keep=app.config['PROFILE_KEEP']
+)
+
+# Bounded pool for /api/convert-html-to-pdf
+html_renderer = HtmlRenderer(
+    workers=app.config['HTML_PDF_WORKERS'],
+    queue_size=app.config['HTML_PDF_QUEUE_SIZE'],
+    timeout=app.config['HTML_PDF_TIMEOUT'],
+    wkhtmltopdf=os.environ.get('WKHTMLTOPDF_PATH', '')
+)
+
 # --- File Processing Functions ---
 def process_file(file_path):
     """Extract text content from a file based on its extension."""
@@ -90,105 +231,334 @@ def extract_text_from_pdf(pdf_path):
 def extract_text_from_json(json_path):
     """Extract text from JSON files."""
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Handle different JSON structures
-        if isinstance(data, dict):
-            # If it's a dictionary, concatenate all text values
-            text = ""
-            for key, value in data.items():
-                if isinstance(value, dict) and "text" in value:
-                    if isinstance(value["text"], list):
-                        text += "\n".join(value["text"]) + "\n\n"
-                    else:
-                        text += str(value["text"]) + "\n\n"
-                elif isinstance(value, str):
-                    text += value + "\n\n"
-            return text
-        elif isinstance(data, list):
-            # If it's a list, try to extract text from each item
-            return "\n\n".join([str(item) for item in data])
+        # Stream the document page by page so large corpora never load whole
+        parts = []
+        current_source = None
+        for i, (source, text) in enumerate(iter_json_text(json_path)):
+            if i > 0:
+                parts.append(page_separator(current_source, source))
+            parts.append(text)
+            current_source = source
+        return "".join(parts)
     except Exception as e:
         return f"Error processing JSON file: {str(e)}"
 
+def iter_file_pages(file_path):
+    """Yield (source, text) pages of a file: per page for JSON corpora, else the whole text."""
+    if os.path.splitext(file_path)[1].lower() == '.json':
+        try:
+            yield from iter_json_text(file_path)
+        except Exception as e:
+            yield os.path.basename(file_path), f"Error processing JSON file: {str(e)}"
+    else:
+        yield os.path.basename(file_path), process_file(file_path)
+
+def load_document(file_path, name=None):
+    """Return the stored text of an uploaded file, extracting it into the corpus store if needed.
+
+    Documents are stored under name, the file's base name by default.
+    """
+    name = name or os.path.basename(file_path)
+    info = corpus_store.info(name)
+    if info is None or info['stored_at'] < os.path.getmtime(file_path):
+        return corpus_store.put(name, iter_file_pages(file_path))
+    return corpus_store.get(name)
+
+def ingest_past_papers(document):
+    """Split past exam papers in a stored document into bank questions without the model.
+
+    JSON corpora are parsed per source document (e.g. per original PDF).
+    Returns {"questions": [...], "papers": n, "leftover": text}, where leftover
+    holds course material and the parts of papers that could not be read as
+    questions.
+    """
+    documents = []
+    for source, text in document.iter_pages():
+        if documents and documents[-1][0] == source and not isinstance(source, int):
+            documents[-1][1].append(text)
+        else:
+            documents.append((source, [text]))
+    documents = [(str(source), "\n".join(pages)) for source, pages in documents]
+    
+    questions = []
+    leftovers = []
+    papers = 0
+    for source, text in documents:
+        result = parse_past_paper(text, source)
+        if result['is_past_paper']:
+            papers += 1
+            questions.extend(result['questions'])
+        if result['leftover'].strip():
+            leftovers.append(result['leftover'])
+    
+    return {"questions": questions, "papers": papers, "leftover": "\n\n".join(leftovers)}
+
+# --- Prompt Compaction ---
+def get_token_budget(stage):
+    """Return the prompt token budget for a stage ('analysis' or 'generation')."""
+    env_budget = os.environ.get(f"{stage.upper()}_TOKEN_BUDGET")
+    if env_budget:
+        return int(env_budget)
+    return model_setting(app.config['PROMPT_TOKEN_BUDGETS'])[stage]
+
+def log_compaction(stage, stats):
+    print(f"Compacted {stage} prompt: {stats['prompt_tokens']} tokens "
+          f"(saved {stats['tokens_saved']} of {stats['source_tokens']}, truncated: {stats['truncated']})")
+
+def prepare_prompt_content(text, stage):
+    """Compact text to fit the token budget of a stage and log the savings."""
+    content, stats = compact_text(text, get_token_budget(stage))
+    log_compaction(stage, stats)
+    return content, stats
+
+# --- Cached Generation Context ---
+def _generation_prefix(content, budget):
+    prompt_content, compaction = compact_text(content, budget)
+    return f"""
+    CONTENT:
+    {prompt_content}
+    
+""", compaction
+
+def generation_context(content):
+    """The CONTENT part of generation prompts, and its compaction stats.
+    
+    It depends only on the text, so every generation from one upload starts
+    with the same prefix and the model can cache it.  The model only caches
+    content of its minimum size (32768 tokens on Gemini 1.5), far above the
+    generation budget, so with context caching on, material that can fill
+    the minimum is compacted to that size instead: it is sent once per
+    upload and read from the cache at the cached rate afterwards.  Smaller
+    material keeps the generation budget and goes inline.
+    """
+    budget = get_token_budget('generation')
+    minimum = context_cache.min_tokens
+    if context_cache.enabled and minimum > budget:
+        prefix, compaction = _generation_prefix(content, minimum)
+        # compact_text() budgets a token per joining newline; top up once (2% over) to reach the minimum
+        tokens = estimate_tokens(prefix)
+        if compaction['truncated'] and tokens < minimum:
+            prefix, compaction = _generation_prefix(content, minimum * minimum * 51 // (50 * max(tokens, 1)))
+        if estimate_tokens(prefix) >= minimum:
+            log_compaction('generation (cached)', compaction)
+            return prefix, compaction
+    prefix, compaction = _generation_prefix(content, budget)
+    log_compaction('generation', compaction)
+    return prefix, compaction
+
+def register_generation_context(content):
+    """Cache the generation prefix of an upload on the model side; True if it is cached."""
+    if not context_cache.enabled:
+        return False
+    entry, reason = context_cache.register(generation_context(content)[0])
+    if entry is None:
+        if reason == 'below minimum':
+            reason += f" (the material compacts to less than the {context_cache.min_tokens} tokens the model caches)"
+        print(f"Generation context not cached: {reason}")
+    return entry is not None
+
+def generate_with_context(prefix, instructions, priority=PRIORITY_INTERACTIVE):
+    """Call the model with prefix + instructions, sending only the instructions when prefix is cached.
+    
+    Returns (response, report), report being the context_cache.report() of
+    the call. If the backend no longer has the cached prefix, the call is
+    repeated with the prefix inline; any other error is raised as is.
+    """
+    entry, reason = context_cache.lookup(prefix)
+    if entry is not None:
+        try:
+            response = model_client.generate(instructions, priority=priority, model=context_cache.model(entry))
+            return response, context_cache.report(entry, response=response)
+        except Exception as e:
+            # Bad requests, quota and outages would fail the inline call just the same, at full price
+            if not is_cache_missing_error(e):
+                raise
+            print(f"Cached context is gone ({str(e)}); sending the content inline")
+            context_cache.invalidate(entry)
+            reason = 'cache rejected'
+    response = model_client.generate(prefix + instructions, priority=priority)
+    return response, context_cache.report(None, reason)
+
 # --- Question Generation Functions ---
-def analyze_content(text, subject_name):
-    """Analyze the content to identify topics and potential question areas."""
+def extract_json_content(result):
+    """Pull the JSON payload out of a raw model response."""
+    json_content = None
+    
+    # Check if response contains JSON enclosed in ```json ... ```
+    json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
+    if json_match:
+        json_content = json_match.group(1).strip()
+        
+    # If not found in code blocks, try to find JSON array directly
+    if not json_content:
+        json_match = re.search(r'\[\s*{.*}\s*\]', result, re.DOTALL)
+        if json_match:
+            json_content = json_match.group(0).strip()
+    
+    # If still not found, use the entire response
+    if not json_content:
+        json_content = result.strip()
+    
+    # Clean the JSON content
+    json_content = json_content.replace('\n', ' ')
+    json_content = re.sub(r'```.*?```', '', json_content, flags=re.DOTALL)
+    return json_content
+
+def analyze_chunk_batch(batch, subject_name, priority=PRIORITY_INTERACTIVE):
+    """Ask the model for the topics of each chunk in a batch of (hash, chunk) pairs.
+
+    Returns ({hash: topics}, fallback_topics). Fallback topics are recovered
+    from a response that could not be parsed per chunk and are not stored.
+    """
+    chunk_ids = {f"c{i + 1}": h for i, (h, _) in enumerate(batch)}
+    labelled = "\n\n".join(f"[CHUNK c{i + 1}]\n{chunk}" for i, (_, chunk) in enumerate(batch))
+    
     prompt = f"""
     CONTENT:
-    {text[:10000]}  # Limit to prevent token overflow
+    {labelled}
     
-    Based on the above content from the subject '{subject_name}', identify the main topics and subtopics that could be tested in an exam.
-    Return the result as a JSON array of objects with the following structure:
+    Based on the above content from the subject '{subject_name}', identify the main topics and subtopics that could be tested in an exam, separately for each chunk.
+    Return the result as a JSON array with one entry per chunk and the following structure:
     [
         {{
-            "topic": "Main topic name",
-            "subtopics": ["Subtopic 1", "Subtopic 2", ...],
-            "importance": "High/Medium/Low",
-            "question_types": ["MCQ", "Short Answer", "Essay", ...]
+            "chunk_id": "c1",
+            "topics": [
+                {{
+                    "topic": "Main topic name",
+                    "subtopics": ["Subtopic 1", "Subtopic 2", ...],
+                    "importance": "High/Medium/Low",
+                    "question_types": ["MCQ", "Short Answer", "Essay", ...]
+                }}
+            ]
         }}
     ]
     
     Ensure the response is valid JSON. Focus on extracting meaningful topics that appear to be significant in the content.
     """
     
+    response = model_client.generate(prompt, priority=priority)
+    result = response.text
+    
+    print(f"Raw response from Gemini API: {result[:100]}...")
+    
+    json_content = extract_json_content(result)
     try:
-        response = model.generate_content(prompt)
-        result = response.text
+        entries = json.loads(json_content)
+    except json.JSONDecodeError as e:
+        print(f"JSON decoding error: {str(e)}")
+        print(f"Attempted to parse: {json_content[:100]}...")
         
-        print(f"Raw response from Gemini API: {result[:100]}...")
+        # Recover topic names with a regex so this response is not wasted
+        topic_matches = re.findall(r'topic["\']?\s*:\s*["\']([^"\']+)["\']', result, re.IGNORECASE)
+        return {}, [{"topic": topic, "subtopics": [], "importance": "Medium", "question_types": ["MCQ", "Short Answer"]} for topic in topic_matches]
+    
+    results = {}
+    fallback_topics = []
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        chunk_id = str(entry.get('chunk_id', ''))
+        if chunk_id in chunk_ids and isinstance(entry.get('topics'), list):
+            results[chunk_ids[chunk_id]] = entry['topics']
+        elif 'topic' in entry:
+            # A plain topic list cannot be attributed to a chunk
+            fallback_topics.append(entry)
+    return results, fallback_topics
+
+def analyze_content(text, subject_name, priority=PRIORITY_INTERACTIVE):
+    """Analyze the content to identify topics and potential question areas.
+
+    Topics are stored per chunk content hash, so re-analysing an updated
+    document only sends new or changed chunks to the model.
+    """
+    try:
+        budget = get_token_budget('analysis')
+        chunks = chunk_text(text, min(CHUNK_TOKENS, max(budget // 2, 1)))
+        hashes = [chunk_hash(chunk) for chunk in chunks]
+        known = analysis_store.get_many(subject_name, hashes)
         
-        # Try to extract JSON from the response
-        json_content = None
+        # Identical chunks only need to be analysed once
+        pending = [(h, chunk) for h, chunk in dict(zip(hashes, chunks)).items() if h not in known]
         
-        # Check if response contains JSON enclosed in ```json ... ```
-        json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
-        if json_match:
-            json_content = json_match.group(1).strip()
-            
-        # If not found in code blocks, try to find JSON array directly
-        if not json_content:
-            json_match = re.search(r'\[\s*{.*}\s*\]', result, re.DOTALL)
-            if json_match:
-                json_content = json_match.group(0).strip()
+        # Group new chunks into prompts that fit the analysis budget
+        batches = []
+        batch, batch_tokens = [], 0
+        for h, chunk in pending:
+            tokens = estimate_tokens(chunk)
+            if batch and batch_tokens + tokens > budget:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append((h, chunk))
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
         
-        # If still not found, use the entire response
-        if not json_content:
-            json_content = result.strip()
+        new_results = {}
+        fallback_topics = []
+        prompt_tokens = 0
+        max_batches = app.config['ANALYSIS_MAX_BATCHES']
+        skipped_tokens = sum(estimate_tokens(chunk) for batch in batches[max_batches:] for _, chunk in batch)
+        batches = batches[:max_batches]
+        error = None
+        # Batches go out together; model_client keeps the calls within its concurrency limit
+        task = request_profiler.bind(analyze_chunk_batch)
+        with ThreadPoolExecutor(max_workers=max(len(batches), 1)) as pool:
+            futures = {pool.submit(task, batch, subject_name, priority): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    results, fallback = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                # Store after every call so a failed analysis keeps its progress
+                analysis_store.put_many(subject_name, results)
+                new_results.update(results)
+                fallback_topics.extend(fallback)
+                prompt_tokens += sum(estimate_tokens(chunk) for _, chunk in futures[future])
+        if error is not None:
+            raise error
         
-        # Clean the JSON content
-        json_content = json_content.replace('\n', ' ')
-        json_content = re.sub(r'```.*?```', '', json_content, flags=re.DOTALL)
+        topics = merge_topics([known.get(h) or new_results.get(h) or [] for h in hashes] + [fallback_topics])
         
-        # Final fallback - if we can't get valid JSON, create a minimal structure
-        try:
-            topics = json.loads(json_content)
-        except json.JSONDecodeError as e:
-            print(f"JSON decoding error: {str(e)}")
-            print(f"Attempted to parse: {json_content[:100]}...")
-            
-            # Create a default topic structure using regex to extract topic names
-            topic_matches = re.findall(r'topic["\']?\s*:\s*["\']([^"\']+)["\']', result, re.IGNORECASE)
-            
-            if topic_matches:
-                topics = [{"topic": topic, "subtopics": [], "importance": "Medium", "question_types": ["MCQ", "Short Answer"]} for topic in topic_matches]
-            else:
-                # Create a single generic topic
-                topics = [{
-                    "topic": f"{subject_name} Concepts",
-                    "subtopics": [],
-                    "importance": "Medium",
-                    "question_types": ["MCQ", "Short Answer", "Essay"]
-                }]
+        if not topics:
+            # Create a single generic topic
+            topics = [{
+                "topic": f"{subject_name} Concepts",
+                "subtopics": [],
+                "importance": "Medium",
+                "question_types": ["MCQ", "Short Answer", "Essay"]
+            }]
+        
+        total_tokens = estimate_tokens(text)
+        # Chunks beyond the batch cap were not analysed: they are skipped, not saved
+        source_tokens = max(total_tokens - skipped_tokens, 0)
+        analyzed = sum(1 for h, _ in pending if h in new_results)
+        compaction = {
+            'token_budget': budget,
+            'total_tokens': total_tokens,
+            'source_tokens': source_tokens,
+            'prompt_tokens': prompt_tokens,
+            'tokens_saved': max(source_tokens - prompt_tokens, 0),
+            'skipped_tokens': skipped_tokens,
+            'truncated': skipped_tokens > 0,
+        }
+        incremental = {
+            'chunks_total': len(set(hashes)),
+            'chunks_reused': len(set(known)),
+            'chunks_analyzed': analyzed,
+            'chunks_pending': len(pending) - analyzed,
+            'model_calls': len(batches),
+        }
+        print(f"Analysis: {incremental['chunks_reused']} chunks reused, {analyzed} analysed, "
+              f"{prompt_tokens} prompt tokens ({compaction['tokens_saved']} saved, {skipped_tokens} skipped)")
         
-        return {"success": True, "topics": topics}
+        return {"success": True, "topics": topics, "compaction": compaction, "incremental": incremental}
         
     except Exception as e:
         print(f"Error analyzing content: {str(e)}")
         return {"success": False, "error": f"Failed to analyze content: {str(e)}"}
 
-def generate_questions(content, params):
+def generate_questions(content, params, priority=PRIORITY_INTERACTIVE):
     """Generate questions based on content and specified parameters."""
     subject = params.get('subject', 'General')
     topics = params.get('topics', [])
@@ -199,11 +569,8 @@ def generate_questions(content, params):
     topics_str = ", ".join(topics) if topics else "all covered topics"
     question_types_str = ", ".join(question_types)
     
-    prompt = f"""
-    CONTENT:
-    {content[:15000]}  # Limit to prevent token overflow
-    
-    Generate {num_questions} exam questions for the subject '{subject}' covering {topics_str}.
+    prefix, compaction = generation_context(content)
+    instructions = f"""    Generate {num_questions} exam questions for the subject '{subject}' covering {topics_str}.
     Questions should be at {difficulty} difficulty level.
     
     Include the following types of questions: {question_types_str}.
@@ -235,37 +602,22 @@ def generate_questions(content, params):
     """
     
     try:
-        response = model.generate_content(prompt)
+        response, context = generate_with_context(prefix, instructions, priority)
         result = response.text
         
         print(f"Raw questions response from Gemini API: {result[:100]}...")
         
-        # Try to extract JSON from the response
-        json_content = None
-        
-        # Check if response contains JSON enclosed in ```json ... ```
-        json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
-        if json_match:
-            json_content = json_match.group(1).strip()
-            
-        # If not found in code blocks, try to find JSON array directly
-        if not json_content:
-            json_match = re.search(r'\[\s*{.*}\s*\]', result, re.DOTALL)
-            if json_match:
-                json_content = json_match.group(0).strip()
-        
-        # If still not found, use the entire response
-        if not json_content:
-            json_content = result.strip()
-            
-        # Clean the JSON content
-        json_content = json_content.replace('\n', ' ')
-        json_content = re.sub(r'```.*?```', '', json_content, flags=re.DOTALL)
+        json_content = extract_json_content(result)
         
         # Parse the JSON
+        parsed = True
         try:
             questions = json.loads(json_content)
+            if isinstance(questions, dict):
+                questions = questions.get('questions', [questions])
+            questions = [q for q in questions if isinstance(q, dict)]
         except json.JSONDecodeError as e:
+            parsed = False
             print(f"JSON decoding error for questions: {str(e)}")
             print(f"Attempted to parse: {json_content[:100]}...")
             
@@ -284,14 +636,14 @@ def generate_questions(content, params):
                 })
         
         # Ensure each question has a unique ID
+        seen_ids = set()
         for i, q in enumerate(questions):
-            if 'id' not in q or not q['id']:
+            if 'id' not in q or not q['id'] or str(q['id']) in seen_ids:
                 q['id'] = f"q_{str(uuid.uuid4())[:8]}"
+            q['id'] = str(q['id'])
+            seen_ids.add(q['id'])
                 
             # Ensure required fields exist
-            if 'options' not in q and q.get('type') == 'MCQ':
-                q['options'] = ["Option A", "Option B", "Option C", "Option D"]
-            
             if 'correct_answer' not in q:
                 q['correct_answer'] = "See explanation" if 'explanation' in q else ""
                 
@@ -304,11 +656,94 @@ def generate_questions(content, params):
             if 'topic' not in q:
                 q['topic'] = topics[0] if topics else subject
         
-        return {"success": True, "questions": questions}
+        # Check every question locally and send only the broken ones back for repair
+        validation = None
+        if parsed:
+            questions, validation = validate_and_repair_questions(questions, params, priority)
+        
+        return {"success": True, "questions": questions, "compaction": compaction, "validation": validation,
+                "context_cache": context}
     except Exception as e:
         print(f"Error generating questions: {str(e)}")
         return {"success": False, "error": f"Failed to generate questions: {str(e)}"}
 
+def repair_questions(failing, params, priority=PRIORITY_INTERACTIVE):
+    """Ask the model to fix only the questions that failed validation.
+
+    failing is a list of (question, problems) pairs. Returns the repaired
+    questions keyed by id.
+    """
+    subject = params.get('subject', 'General')
+    question_types = params.get('question_types') or list(QUESTION_TYPES)
+    items = [{"question": q, "problems": problems} for q, problems in failing]
+    
+    prompt = f"""
+    The following exam questions for the subject '{subject}' failed validation. Each entry lists the question and its problems:
+    {json.dumps(items, ensure_ascii=False)}
+    
+    Fix each question so that none of the listed problems remain:
+    1. MCQs need 4 distinct, non-empty options and a "correct_answer" that is exactly one of the options
+    2. The "type" field must be one of: {", ".join(question_types)}
+    3. Keep the same "id", "topic" and "difficulty", and change as little of the question as possible
+    4. If a question duplicates another question, write a different question on the same topic
+    
+    Return only the fixed questions as a JSON array of question objects with the same fields as the input questions.
+    Ensure the response is valid JSON.
+    """
+    
+    response = model_client.generate(prompt, priority=priority)
+    result = response.text
+    
+    print(f"Raw repair response from Gemini API: {result[:100]}...")
+    
+    repaired = json.loads(extract_json_content(result))
+    if not isinstance(repaired, list):
+        return {}
+    
+    fixed = {}
+    for position, q in enumerate(repaired):
+        if not isinstance(q, dict):
+            continue
+        # Fall back to response order if the model dropped or changed the id
+        q_id = str(q.get('id', ''))
+        if q_id not in {original['id'] for original, _ in failing} and position < len(failing):
+            q_id = failing[position][0]['id']
+        q['id'] = q_id
+        fixed[q_id] = q
+    return fixed
+
+def validate_and_repair_questions(questions, params, priority=PRIORITY_INTERACTIVE):
+    """Validate questions locally and repair the failing ones in one batched model call.
+
+    Questions still failing after the repair are dropped. Returns
+    (questions, report).
+    """
+    allowed_types = params.get('question_types') or list(QUESTION_TYPES)
+    difficulty = params.get('difficulty', 'Medium')
+    default_difficulty = difficulty if difficulty in DIFFICULTIES else 'Medium'
+    
+    failures = validate_questions(questions, allowed_types, default_difficulty)
+    report = {"checked": len(questions), "failed": len(failures), "repaired": 0, "dropped": 0}
+    if not failures:
+        return questions, report
+    
+    print(f"{len(failures)} of {len(questions)} questions failed validation; requesting repair")
+    try:
+        repaired = repair_questions([(questions[i], problems) for i, problems in failures], params, priority)
+    except Exception as e:
+        print(f"Error repairing questions: {str(e)}")
+        repaired = {}
+    
+    for i, _ in failures:
+        if questions[i]['id'] in repaired:
+            questions[i] = repaired[questions[i]['id']]
+    
+    # Re-check the whole batch: a repaired question may now duplicate another one
+    still_failing = {i for i, _ in validate_questions(questions, allowed_types, default_difficulty)}
+    report['repaired'] = sum(1 for i, _ in failures if i not in still_failing)
+    report['dropped'] = len(still_failing)
+    return [q for i, q in enumerate(questions) if i not in still_failing], report
+
 def select_questions_from_bank(question_bank, params):
     """Select questions from an existing question bank based on parameters."""
     topics = params.get('topics', [])
@@ -322,7 +757,7 @@ def select_questions_from_bank(question_bank, params):
     if topics:
         filtered_questions = [q for q in filtered_questions if q.get('topic') in topics]
     
-    if difficulty != 'Any':
+    if difficulty not in ('Any', 'Mixed'):
         filtered_questions = [q for q in filtered_questions if q.get('difficulty') == difficulty]
     
     if question_types:
@@ -349,327 +784,132 @@ def combine_questions(generated_questions, selected_questions, num_total):
     
     return all_questions
 
-# --- Output Generation Functions ---
-def generate_pdf(questions, exam_title, include_answers=False):
-    """Generate a PDF file with the questions."""
-    try:
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Set up fonts
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, exam_title, 0, 1, "C")
-        
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 10, f"Date: {datetime.now().strftime('%Y-%m-%d')}", 0, 1, "R")
-        pdf.ln(5)
-        
-        # Add questions
-        current_topic = None
-        current_type = None
-        
-        for i, q in enumerate(questions):
-            # Skip any invalid question
-            if not isinstance(q, dict):
-                continue
-                
-            # Safety check to ensure q is a dictionary with required fields
-            q_text = q.get('text', 'Question text missing')
-            q_topic = q.get('topic', 'General')
-            q_type = q.get('type', 'General')
-            q_difficulty = q.get('difficulty', 'Medium')
-            
-            # Add topic header if it changes
-            if q_topic != current_topic:
-                current_topic = q_topic
-                pdf.set_font("Arial", "B", 14)
-                pdf.cell(0, 10, f"Topic: {current_topic}", 0, 1)
-                pdf.ln(2)
-            
-            # Add question type header if it changes
-            if q_type != current_type:
-                current_type = q_type
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 10, f"Section: {current_type} Questions", 0, 1)
-                pdf.ln(2)
-            
-            # Add question
-            pdf.set_font("Arial", "B", 11)
-            pdf.cell(0, 10, f"Question {i+1} ({q_difficulty} Difficulty)", 0, 1)
-            
-            pdf.set_font("Arial", "", 10)
-            # Split the question text into multiple lines to fit within the PDF width
-            # Ensure text is not None before processing
-            if q_text:
-                wrapped_text = textwrap.fill(q_text, width=85)
-                for line in wrapped_text.split('\n'):
-                    pdf.cell(0, 8, line, 0, 1)
-            else:
-                pdf.cell(0, 8, "Question text not available", 0, 1)
-            
-            # Add options for MCQs
-            if q_type == 'MCQ' and 'options' in q and isinstance(q.get('options'), list):
-                pdf.ln(2)
-                for j, option in enumerate(q.get('options', [])):
-                    if option is None:
-                        option = "Option text not available"
-                    option_letter = chr(65 + j)  # A, B, C, D...
-                    option_text = f"{option_letter}. {option}"
-                    wrapped_option = textwrap.fill(option_text, width=80)
-                    for line in wrapped_option.split('\n'):
-                        pdf.cell(0, 8, line, 0, 1)
-                    pdf.ln(1)
-            
-            # Add answer section if requested
-            if include_answers:
-                pdf.ln(2)
-                pdf.set_font("Arial", "B", 10)
-                pdf.cell(0, 8, "Answer:", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                
-                # Get answer and ensure it's not None
-                answer_text = q.get('correct_answer', '')
-                if answer_text is None:
-                    answer_text = "Answer not available"
-                    
-                # Convert to string if it's not already
-                if not isinstance(answer_text, str):
-                    answer_text = str(answer_text)
-                
-                wrapped_answer = textwrap.fill(answer_text, width=85)
-                for line in wrapped_answer.split('\n'):
-                    pdf.cell(0, 8, line, 0, 1)
-                
-                if 'explanation' in q and q.get('explanation'):
-                    pdf.ln(2)
-                    pdf.set_font("Arial", "I", 10)
-                    pdf.cell(0, 8, "Explanation:", 0, 1)
-                    
-                    # Get explanation and ensure it's not None
-                    explanation_text = q.get('explanation', '')
-                    if explanation_text is None:
-                        explanation_text = "Explanation not available"
-                        
-                    # Convert to string if it's not already
-                    if not isinstance(explanation_text, str):
-                        explanation_text = str(explanation_text)
-                    
-                    wrapped_explanation = textwrap.fill(explanation_text, width=85)
-                    for line in wrapped_explanation.split('\n'):
-                        pdf.cell(0, 8, line, 0, 1)
-            
-            pdf.ln(5)
-        
-        # Save to a temporary file
-        output_path = f"temp_outputs/exam_{str(uuid.uuid4())[:8]}.pdf"
-        pdf.output(output_path)
-        return output_path
-        
-    except Exception as e:
-        print(f"PDF generation error: {str(e)}")
-        # Create a simple error PDF
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "Error Generating PDF", 0, 1, "C")
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 10, "An error occurred while generating the PDF.", 0, 1)
-        pdf.cell(0, 10, f"Error: {str(e)}", 0, 1)
-        
-        error_path = f"temp_outputs/error_{str(uuid.uuid4())[:8]}.pdf"
-        pdf.output(error_path)
-        return error_path
+# --- Topic Coverage ---
+def assess_coverage(content, questions):
+    """Chunk the source content and score how the questions cover it."""
+    chunks = chunk_text(content, app.config['COVERAGE_CHUNK_TOKENS'])
+    return chunks, coverage_report(chunks, questions)
+
+def fill_coverage_gaps(chunks, questions, report, params, priority=PRIORITY_INTERACTIVE):
+    """Generate questions for uncovered sections, replacing questions from over-covered ones.
+    
+    Only the uncovered chunks are sent to the model. The paper keeps its
+    requested size: each new question replaces a question from the section
+    with the most questions.
+    """
+    num_total = params['num_questions']
+    shortfall = max(0, num_total - len(questions))
+    removable = redundant_questions(report, max(1, num_total // 3))
+    gaps = gap_chunks(report, len(removable) + shortfall)
+    gap_fill = {"gap_sections": len(report['uncovered_sections']), "generated": 0, "replaced": 0}
+    if not gaps:
+        return questions, report, gap_fill
+    
+    gap_content = "\n\n".join(chunks[i] for i in gaps)
+    gen_result = generate_questions(gap_content, {**params, 'topics': [], 'num_questions': len(gaps)}, priority)
+    if not gen_result.get('success'):
+        gap_fill['error'] = gen_result.get('error')
+        return questions, report, gap_fill
+    
+    new_questions = gen_result['questions'][:len(gaps)]
+    num_to_drop = max(0, len(questions) + len(new_questions) - num_total)
+    dropped = set(removable[:num_to_drop])
+    questions = [q for i, q in enumerate(questions) if i not in dropped] + new_questions
+    
+    gap_fill.update({"generated": len(new_questions), "replaced": len(dropped)})
+    return questions, coverage_report(chunks, questions), gap_fill
+
+# --- Paper Pipeline ---
+def analyze_upload(document, subject_name, priority=PRIORITY_INTERACTIVE):
+    """Find the topics of a stored upload and split its past papers into bank questions.
+    
+    Past papers are parsed locally; only the remaining text goes to the model.
+    Returns the analyze_content() result with "question_bank" and "past_papers"
+    added, or its result unchanged if analysis failed.
+    """
+    past_papers = ingest_past_papers(document)
+    bank_questions = past_papers['questions']
+    
+    if past_papers['leftover'].strip() or not bank_questions:
+        analysis_result = analyze_content(past_papers['leftover'] if bank_questions else document, subject_name, priority)
+        if not analysis_result['success']:
+            return analysis_result
+    else:
+        analysis_result = {"success": True, "topics": []}
+    
+    topics = analysis_result.get('topics', [])
+    if bank_questions:
+        topics = merge_topics([topics, derive_topics(bank_questions)])
+        assign_topics(bank_questions, topics, f"{subject_name} Concepts")
+    
+    return {
+        **analysis_result,
+        "topics": topics,
+        "question_bank": bank_questions,
+        "past_papers": {"papers": past_papers['papers'], "questions": len(bank_questions)}
+    }
+
+def build_paper(content, question_bank, params, fill_gaps=False, priority=PRIORITY_INTERACTIVE):
+    """Assemble a paper from new questions and up to half from the bank, and score its coverage.
+    
+    Returns {"success", "questions", "compaction", "validation", "context_cache",
+    "coverage", "gap_fill"}, or the generate_questions() result if generation failed.
+    """
+    # Calculate how many questions to generate vs. select from bank
+    num_from_bank = min(int(params['num_questions'] / 2), len(question_bank))
+    num_to_generate = params['num_questions'] - num_from_bank
+    
+    # Generate new questions
+    gen_result = {"questions": []} if num_to_generate <= 0 else generate_questions(content, {**params, 'num_questions': num_to_generate}, priority)
+    
+    if not gen_result.get('success', False) and num_to_generate > 0:
+        return gen_result
+    
+    # Select questions from bank
+    selected_questions = [] if num_from_bank <= 0 else select_questions_from_bank(question_bank, {**params, 'num_questions': num_from_bank})
+    
+    # Combine questions
+    all_questions = combine_questions(
+        gen_result.get('questions', []), 
+        selected_questions, 
+        params['num_questions']
+    )
+    
+    # Score how evenly the paper covers the material, optionally regenerating for the gaps
+    chunks, coverage = assess_coverage(content, all_questions)
+    gap_fill = None
+    if fill_gaps and coverage['uncovered_sections']:
+        all_questions, coverage, gap_fill = fill_coverage_gaps(chunks, all_questions, coverage, params, priority)
+    
+    return {
+        "success": True,
+        "questions": all_questions,
+        "compaction": gen_result.get('compaction'),
+        "validation": gen_result.get('validation'),
+        "context_cache": gen_result.get('context_cache'),
+        "coverage": coverage,
+        "gap_fill": gap_fill
+    }
 
-def generate_html(questions, exam_title, include_answers=False):
-    """Generate an HTML file with the questions."""
+# --- Output Generation Functions ---
+def export_document(document, format_type, include_answers=False):
+    """Render a prepared paper in one format; on failure, an error document in that format."""
     try:
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>{exam_title}</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                h1 {{ text-align: center; }}
-                h2 {{ margin-top: 20px; color: #2c3e50; }}
-                h3 {{ color: #3498db; }}
-                .question {{ margin-bottom: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 5px; }}
-                .difficulty {{ font-size: 0.9em; color: #7f8c8d; }}
-                .options {{ margin-left: 20px; }}
-                .answer {{ margin-top: 10px; padding: 10px; background-color: #f8f9fa; display: {'' if include_answers else 'none'}; }}
-                .explanation {{ font-style: italic; margin-top: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h1>{exam_title}</h1>
-            <p style="text-align: right;">Date: {datetime.now().strftime('%Y-%m-%d')}</p>
-        """
-        
-        current_topic = None
-        current_type = None
-        
-        for i, q in enumerate(questions):
-            # Skip any invalid question
-            if not isinstance(q, dict):
-                continue
-                
-            # Safety check to ensure q is a dictionary with required fields
-            q_text = q.get('text', 'Question text missing')
-            q_topic = q.get('topic', 'General')
-            q_type = q.get('type', 'General')
-            q_difficulty = q.get('difficulty', 'Medium')
-            
-            # Add topic header if it changes
-            if q_topic != current_topic:
-                current_topic = q_topic
-                html += f"<h2>Topic: {current_topic}</h2>"
-            
-            # Add question type header if it changes
-            if q_type != current_type:
-                current_type = q_type
-                html += f"<h3>Section: {current_type} Questions</h3>"
-            
-            # Add question
-            html += f"""
-            <div class="question">
-                <p><strong>Question {i+1}</strong> <span class="difficulty">({q_difficulty} Difficulty)</span></p>
-                <p>{q_text}</p>
-            """
-            
-            # Add options for MCQs
-            if q_type == 'MCQ' and 'options' in q and isinstance(q.get('options'), list):
-                html += '<div class="options">'
-                for j, option in enumerate(q.get('options', [])):
-                    if option is None:
-                        option = "Option text not available"
-                    option_letter = chr(65 + j)  # A, B, C, D...
-                    html += f"<p>{option_letter}. {option}</p>"
-                html += '</div>'
-            
-            # Add answer section
-            answer_text = q.get('correct_answer', '')
-            if answer_text is None:
-                answer_text = "Answer not available"
-                
-            explanation_text = q.get('explanation', '')
-            if explanation_text is None:
-                explanation_text = "Explanation not available"
-                
-            html += f"""
-                <div class="answer">
-                    <p><strong>Answer:</strong> {answer_text}</p>
-            """
-            
-            if explanation_text:
-                html += f'<p class="explanation"><strong>Explanation:</strong> {explanation_text}</p>'
-            
-            html += """
-                </div>
-            </div>
-            """
-        
-        html += """
-        </body>
-        </html>
-        """
-        
-        # Save to a temporary file
-        output_path = f"temp_outputs/exam_{str(uuid.uuid4())[:8]}.html"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        return output_path
-        
+        return render_document(document, format_type, include_answers)
     except Exception as e:
-        print(f"HTML generation error: {str(e)}")
-        # Create a simple error HTML
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Error</title>
-        </head>
-        <body>
-            <h1>Error Generating HTML</h1>
-            <p>An error occurred while generating the HTML document.</p>
-            <p>Error: {str(e)}</p>
-        </body>
-        </html>
-        """
-        
-        error_path = f"temp_outputs/error_{str(uuid.uuid4())[:8]}.html"
-        with open(error_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        return error_path
+        print(f"{format_type.upper()} generation error: {str(e)}")
+        error = render_error(format_type, str(e))
+        return error if isinstance(error, bytes) else error.encode('utf-8')
 
-def generate_markdown(questions, exam_title, include_answers=False):
-    """Generate a Markdown file with the questions."""
-    try:
-        md = f"# {exam_title}\n\nDate: {datetime.now().strftime('%Y-%m-%d')}\n\n"
-        
-        current_topic = None
-        current_type = None
-        
-        for i, q in enumerate(questions):
-            # Skip any invalid question
-            if not isinstance(q, dict):
-                continue
-                
-            # Safety check to ensure q is a dictionary with required fields
-            q_text = q.get('text', 'Question text missing')
-            q_topic = q.get('topic', 'General')
-            q_type = q.get('type', 'General')
-            q_difficulty = q.get('difficulty', 'Medium')
-            
-            # Add topic header if it changes
-            if q_topic != current_topic:
-                current_topic = q_topic
-                md += f"## Topic: {current_topic}\n\n"
-            
-            # Add question type header if it changes
-            if q_type != current_type:
-                current_type = q_type
-                md += f"### Section: {current_type} Questions\n\n"
-            
-            # Add question
-            md += f"**Question {i+1}** ({q_difficulty} Difficulty)\n\n{q_text}\n\n"
-            
-            # Add options for MCQs
-            if q_type == 'MCQ' and 'options' in q and isinstance(q.get('options'), list):
-                for j, option in enumerate(q.get('options', [])):
-                    if option is None:
-                        option = "Option text not available"
-                    option_letter = chr(65 + j)  # A, B, C, D...
-                    md += f"{option_letter}. {option}\n\n"
-            
-            # Add answer section if requested
+def export_bundle(document, base_name, include_answers=False):
+    """Zip the paper in every format, plus an answer key in every format if requested."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for format_type in EXPORT_FORMATS:
+            bundle.writestr(f"{base_name}.{format_type}", export_document(document, format_type, False))
             if include_answers:
-                answer_text = q.get('correct_answer', '')
-                if answer_text is None:
-                    answer_text = "Answer not available"
-                    
-                md += f"**Answer:** {answer_text}\n\n"
-                
-                explanation_text = q.get('explanation', '')
-                if explanation_text is not None and explanation_text:
-                    md += f"*Explanation:* {explanation_text}\n\n"
-            
-            md += "---\n\n"
-        
-        # Save to a temporary file
-        output_path = f"temp_outputs/exam_{str(uuid.uuid4())[:8]}.md"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(md)
-        return output_path
-        
-    except Exception as e:
-        print(f"Markdown generation error: {str(e)}")
-        # Create a simple error markdown
-        md = f"# Error Generating Markdown\n\nAn error occurred while generating the markdown document.\n\nError: {str(e)}\n"
-        
-        error_path = f"temp_outputs/error_{str(uuid.uuid4())[:8]}.md"
-        with open(error_path, 'w', encoding='utf-8') as f:
-            f.write(md)
-        return error_path
+                bundle.writestr(f"{base_name}_answers.{format_type}", export_document(document, format_type, True))
+    return buffer.getvalue()
 
 # --- API Routes ---
 @app.route('/')
@@ -677,6 +917,7 @@ def index():
     return app.send_static_file('index.html')
 
 @app.route('/api/upload', methods=['POST'])
+@request_profiler.profiled
 def upload_file():
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
@@ -690,26 +931,37 @@ def upload_file():
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(filepath)
     
-    # Process the file
-    content = process_file(filepath)
+    # Extract the text once into the shared corpus store
+    document = load_document(filepath)
     
     # Get subject name from form
     subject_name = request.form.get('subject', 'General Subject')
     
-    # Analyze content
-    analysis_result = analyze_content(content, subject_name)
-    
+    # Split past papers into bank questions locally and analyze the rest
+    analysis_result = analyze_upload(document, subject_name)
     if not analysis_result['success']:
         return jsonify(analysis_result), 500
+    bank_questions = analysis_result['question_bank']
+    
+    # Kept server-side so generation requests don't have to send the bank back
+    paper_store.put_bank(filename, bank_questions)
+    
+    # Later generations from this upload send only their instructions along with the cached content
+    context_cached = register_generation_context(document)
     
     return jsonify({
         "success": True,
         "filename": filename,
-        "topics": analysis_result.get('topics', []),
-        "content_preview": content[:500] + "..." if len(content) > 500 else content
+        "topics": analysis_result['topics'],
+        "past_papers": analysis_result['past_papers'],
+        "compaction": analysis_result.get('compaction'),
+        "incremental": analysis_result.get('incremental'),
+        "context_cached": context_cached,
+        "content_preview": document.preview(500) + ("..." if len(document) > 500 else "")
     })
 
 @app.route('/api/generate-questions', methods=['POST'])
+@request_profiler.profiled
 def generate_questions_api():
     data = request.json
     
@@ -740,11 +992,13 @@ def generate_questions_api():
         if not os.path.exists(filepath):
             return jsonify({"error": f"File not found: {filename}"}), 404
     
-    # Process the file and get content
-    content = process_file(filepath)
+    # Read the text from the corpus store instead of extracting the file again
+    content = load_document(filepath)
     
-    # Get existing question bank if provided
-    question_bank = data.get('question_bank', [])
+    # Use the question bank if provided, else the one saved when the file was uploaded
+    question_bank = data.get('question_bank')
+    if question_bank is None:
+        question_bank = paper_store.get_bank(os.path.basename(filepath))
     
     # Get the parameters
     params = {
@@ -755,32 +1009,131 @@ def generate_questions_api():
         'num_questions': int(data.get('num_questions', 10))
     }
     
-    # Calculate how many questions to generate vs. select from bank
-    num_from_bank = min(int(params['num_questions'] / 2), len(question_bank))
-    num_to_generate = params['num_questions'] - num_from_bank
-    
-    # Generate new questions
-    gen_result = {"questions": []} if num_to_generate <= 0 else generate_questions(content, {**params, 'num_questions': num_to_generate})
-    
-    if not gen_result.get('success', False) and num_to_generate > 0:
-        return jsonify(gen_result), 500
-    
-    # Select questions from bank
-    selected_questions = [] if num_from_bank <= 0 else select_questions_from_bank(question_bank, {**params, 'num_questions': num_from_bank})
+    paper_result = build_paper(content, question_bank, params, fill_gaps=bool(data.get('fill_gaps')))
+    if not paper_result['success']:
+        return jsonify(paper_result), 500
+    all_questions = paper_result['questions']
     
-    # Combine questions
-    all_questions = combine_questions(
-        gen_result.get('questions', []), 
-        selected_questions, 
-        params['num_questions']
-    )
+    # Save the paper server-side; regenerating an existing paper makes a new version of it
+    meta = {'filename': os.path.basename(filepath), 'params': params}
+    paper = None
+    if data.get('paper_id'):
+        try:
+            paper = paper_store.update(data['paper_id'], [{'op': 'set', 'questions': all_questions}], data.get('base_version'))
+        except PaperConflict as e:
+            return jsonify({"error": str(e)}), 409
+        except PaperEditError as e:
+            return jsonify({"error": str(e)}), 400
+    if paper is None:
+        paper = paper_store.create(all_questions, meta)
     
     return jsonify({
         "success": True,
-        "questions": all_questions
+        "paper_id": paper['paper_id'],
+        "version": paper['version'],
+        "questions": all_questions,
+        "compaction": paper_result['compaction'],
+        "validation": paper_result['validation'],
+        "context_cache": paper_result['context_cache'],
+        "coverage": summarize_coverage(paper_result['coverage']),
+        "gap_fill": paper_result['gap_fill']
     })
 
+def check_edit_questions(edits):
+    """Validate the questions that client edits add or replace; returns a list of problems."""
+    problems = []
+    for edit in edits:
+        if not isinstance(edit, dict):
+            continue
+        if edit.get('op') == 'set' and isinstance(edit.get('questions'), list):
+            new_questions = [q for q in edit['questions'] if isinstance(q, dict)]
+        elif isinstance(edit.get('question'), dict):
+            new_questions = [edit['question']]
+        else:
+            continue
+        for q in new_questions:
+            if not q.get('id'):
+                q['id'] = f"q_{str(uuid.uuid4())[:8]}"
+        for index, issues in validate_questions(new_questions):
+            problems.append({"id": new_questions[index].get('id'), "problems": issues})
+    return problems
+
+@app.route('/api/papers/<paper_id>', methods=['GET'])
+def get_paper(paper_id):
+    try:
+        paper = paper_store.get(paper_id, request.args.get('version'))
+    except PaperEditError as e:
+        return jsonify({"error": str(e)}), 400
+    if paper is None:
+        return jsonify({"error": f"Paper not found: {paper_id}"}), 404
+    return jsonify({"success": True, **paper})
+
+@app.route('/api/papers/<paper_id>/edits', methods=['POST'])
+def edit_paper(paper_id):
+    data = request.json or {}
+    edits = data.get('edits')
+    
+    problems = check_edit_questions(edits) if isinstance(edits, list) else []
+    if problems:
+        return jsonify({"error": "Edited questions failed validation", "problems": problems}), 400
+    
+    try:
+        paper = paper_store.update(paper_id, edits, data.get('base_version'))
+    except PaperConflict as e:
+        return jsonify({"error": str(e)}), 409
+    except PaperEditError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if paper is None:
+        return jsonify({"error": f"Paper not found: {paper_id}"}), 404
+    return jsonify({"success": True, "paper_id": paper_id, "version": paper['version']})
+
+@app.route('/api/papers/<paper_id>/questions/<question_id>/regenerate', methods=['POST'])
+def regenerate_question(paper_id, question_id):
+    data = request.json or {}
+    paper = paper_store.get(paper_id)
+    if paper is None:
+        return jsonify({"error": f"Paper not found: {paper_id}"}), 404
+    
+    old_question = next((q for q in paper['questions'] if str(q.get('id')) == question_id), None)
+    if old_question is None:
+        return jsonify({"error": f"Question not found: {question_id}"}), 404
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], paper['meta'].get('filename', ''))
+    if not os.path.isfile(filepath):
+        return jsonify({"error": "The source file of this paper is no longer available"}), 404
+    
+    # One new question on the same topic and of the same type as the one it replaces
+    params = {**paper['meta'].get('params', {}), 'num_questions': 1}
+    if old_question.get('topic'):
+        params['topics'] = [old_question['topic']]
+    if old_question.get('type') in QUESTION_TYPES:
+        params['question_types'] = [old_question['type']]
+    
+    gen_result = generate_questions(load_document(filepath), params)
+    if not gen_result.get('success') or not gen_result.get('questions'):
+        return jsonify({"error": gen_result.get('error', "No replacement question was generated")}), 500
+    
+    question = gen_result['questions'][0]
+    if any(str(q.get('id')) == str(question['id']) for q in paper['questions']):
+        question['id'] = f"q_{str(uuid.uuid4())[:8]}"
+    
+    try:
+        # Fail rather than overwrite edits made while the question was being generated
+        paper = paper_store.update(
+            paper_id,
+            [{'op': 'replace', 'id': question_id, 'question': question}],
+            data.get('base_version', paper['version'])
+        )
+    except PaperConflict as e:
+        return jsonify({"error": str(e)}), 409
+    except PaperEditError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"success": True, "paper_id": paper_id, "version": paper['version'], "question": question})
+
 @app.route('/api/export', methods=['POST'])
+@request_profiler.profiled
 def export_paper():
     try:
         # Check if the request is JSON or form data
@@ -789,6 +1142,8 @@ def export_paper():
         else:
             # Try to parse form data
             data = {
+                'paper_id': request.form.get('paper_id'),
+                'version': request.form.get('version'),
                 'questions': request.form.get('questions', '[]'),
                 'format': request.form.get('format', 'pdf'),
                 'title': request.form.get('title', 'Exam Paper'),
@@ -802,40 +1157,97 @@ def export_paper():
                     print(f"Failed to parse questions JSON: {str(e)}")
                     return jsonify({"error": f"Invalid question data format: {str(e)}"}), 400
         
-        questions = data.get('questions', [])
+        format_type = data.get('format', 'pdf')
+        
+        # A saved paper is referenced by id (and optionally a version) instead of posting its questions
+        if data.get('paper_id'):
+            try:
+                paper = paper_store.get(data['paper_id'], data.get('version') or None)
+            except PaperEditError as e:
+                return jsonify({"error": str(e)}), 400
+            if paper is None:
+                return jsonify({"error": f"Paper not found: {data['paper_id']}"}), 404
+            questions = paper['questions']
+        else:
+            questions = data.get('questions', [])
         if not questions:
             return jsonify({"error": "No questions provided"}), 400
         
-        format_type = data.get('format', 'pdf')
         exam_title = data.get('title', 'Exam Paper')
         include_answers = data.get('include_answers', False)
         
         print(f"Exporting {len(questions)} questions in {format_type} format")
         print(f"Title: {exam_title}, Include answers: {include_answers}")
         
-        if format_type == 'pdf':
-            output_path = generate_pdf(questions, exam_title, include_answers)
-            mime_type = 'application/pdf'
-        elif format_type == 'html':
-            output_path = generate_html(questions, exam_title, include_answers)
-            mime_type = 'text/html'
-        elif format_type == 'md':
-            output_path = generate_markdown(questions, exam_title, include_answers)
-            mime_type = 'text/markdown'
-        else:
+        if format_type not in EXPORT_FORMATS and format_type != 'zip':
             return jsonify({"error": f"Unsupported format: {format_type}"}), 400
         
+        # Questions are normalized once and shared by every format rendered from them
+        document = build_document(questions, exam_title)
+        base_name = exam_title.replace(' ', '_')
+        
+        if format_type == 'zip':
+            output = export_bundle(document, base_name, include_answers)
+            mime_type = 'application/zip'
+        else:
+            output = export_document(document, format_type, include_answers)
+            mime_type = EXPORT_FORMATS[format_type]
+        
         # Return file for download
         return send_file(
-            output_path,
+            io.BytesIO(output),
             as_attachment=True,
-            download_name=f"{exam_title.replace(' ', '_')}_{format_type}.{format_type}",
+            download_name=f"{base_name}_{format_type}.{format_type}",
             mimetype=mime_type
         )
     except Exception as e:
         print(f"Error in export: {str(e)}")
         return jsonify({"error": f"Failed to generate {format_type}: {str(e)}"}), 500
 
+def admin_check():
+    """Error response unless profiling is enabled and the request carries the admin token."""
+    if not request_profiler.enabled:
+        return jsonify({"error": "Profiling is not enabled"}), 404
+    if not request_profiler.is_admin():
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    error = admin_check()
+    if error:
+        return error
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({"profiles": request_profiler.recent(limit=max(1, min(limit, 200)))})
+
+@app.route('/api/admin/profiles/<request_id>', methods=['GET'])
+def get_profile(request_id):
+    error = admin_check()
+    if error:
+        return error
+    summary = request_profiler.get(request_id)
+    if summary is None:
+        return jsonify({"error": f"Profile not found: {request_id}"}), 404
+    
+    # Raw stats for pstats/snakeviz, or a pstats printout
+    output = request.args.get('format', 'json')
+    if output == 'prof':
+        # The summary can outlive its stats file (pruned or removed by hand)
+        stats_path = request_profiler.stats_path(request_id)
+        if stats_path is None:
+            return jsonify({"error": f"Profile stats not found: {request_id}"}), 404
+        return send_file(stats_path, as_attachment=True,
+                         download_name=f"{request_id}.prof", mimetype='application/octet-stream')
+    if output == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'calls'):
+            return jsonify({"error": f"Unsupported sort: {sort}"}), 400
+        text = request_profiler.stats_text(request_id, sort=sort, limit=request.args.get('limit', 40, type=int))
+        if text is None:
+            return jsonify({"error": f"Profile stats not found: {request_id}"}), 404
+        return app.response_class(text, mimetype='text/plain')
+    return jsonify(summary)
+
 @app.route('/api/convert-html-to-pdf', methods=['POST'])
 def convert_html_to_pdf():
     data = request.json
@@ -845,25 +1257,20 @@ def convert_html_to_pdf():
         return jsonify({"error": "No HTML content provided"}), 400
     
     try:
-        # Save HTML to temporary file
-        html_path = f"temp_outputs/temp_{str(uuid.uuid4())[:8]}.html"
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        # Convert to PDF
-        pdf_path = f"temp_outputs/exam_{str(uuid.uuid4())[:8]}.pdf"
-        pdfkit.from_file(html_path, pdf_path)
-        
-        # Clean up HTML file
-        os.remove(html_path)
+        # Rendered in memory by the worker pool; nothing is written to disk
+        pdf_bytes = html_renderer.render(html_content)
         
         # Return file for download
         return send_file(
-            pdf_path,
+            io.BytesIO(pdf_bytes),
             as_attachment=True,
             download_name=f"exam_paper.pdf",
             mimetype='application/pdf'
         )
+    except RendererBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
+    except RenderTimeout as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": f"Failed to convert HTML to PDF: {str(e)}"}), 500
 
@@ -892,18 +1299,21 @@ def handle_exception(e):
 # Create necessary directories and files if they don't exist
 def ensure_directories():
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs('temp_outputs', exist_ok=True)
-    os.makedirs('static/js', exist_ok=True)
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['ANALYSIS_CACHE_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['CORPUS_STORE_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PAPER_STORE_FOLDER'], exist_ok=True)
+    os.makedirs(os.path.join(app.static_folder, 'js'), exist_ok=True)
     
     # Write main.js to static/js directory if it doesn't exist
-    js_path = os.path.join('static', 'js', 'main.js')
+    js_path = os.path.join(app.static_folder, 'js', 'main.js')
     if not os.path.exists(js_path):
         print("Creating main.js file in static/js directory")
         with open(js_path, 'w', encoding='utf-8') as f:
             f.write('// JavaScript file will be populated')
     
     # Check if index.html exists in static directory
-    index_path = os.path.join('static', 'index.html')
+    index_path = os.path.join(app.static_folder, 'index.html')
     if not os.path.exists(index_path):
         print("WARNING: index.html not found in static directory")
         # Check if it exists in the current directory
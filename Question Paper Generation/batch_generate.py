@@ -0,0 +1,385 @@
+"""Generate papers for a whole set of courses from the command line.
+
+    python batch_generate.py materials/ --output papers/
+    python batch_generate.py courses.json --workers 8 --rate-limit 60 --formats pdf,md --answers
+
+The source is either a directory, where every supported file (.pdf, .json,
+.txt, .md) is one course named after the file, or a manifest listing the
+courses as JSON (a list of objects, or {"courses": [...]}) or CSV with a
+header row:
+
+    [{"name": "dos", "file": "dos/notes.pdf", "subject": "Distributed Operating Systems",
+      "num_questions": 20, "difficulty": "Hard", "question_types": ["MCQ", "Essay"],
+      "topics": [], "title": "DOS End-Semester 2024"}]
+
+Only "file" is required; relative paths are resolved against the
+manifest's folder and missing settings come from the command line.
+
+The same functions as the web app do the work (text extraction, topic
+analysis, generation, export), but without Flask serving anything.  Courses
+run concurrently; all model calls run at batch priority and share one
+--rate-limit.  A call may wait for its turn under that limit, so calls get
+--call-timeout seconds (default 600) rather than the server's 120; a low
+limit then slows the run down instead of failing courses.  Each finished stage of each course is recorded in
+<output>/checkpoint.json, so running the same command again after an
+interruption skips finished courses and picks up the others where they
+stopped.  Papers go to <output>/<course>/, and <output>/summary.json lists
+every course with its status and per-stage timings.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from app import (load_document, analyze_upload, build_paper, export_document, export_bundle,
+                 model_client, EXPORT_FORMATS)
+from document_model import build_document
+from model_client import RateLimiter, PRIORITY_BATCH
+from question_validation import QUESTION_TYPES, DIFFICULTIES
+from topic_coverage import summarize as summarize_coverage
+
+COURSE_EXTENSIONS = ('.pdf', '.json', '.txt', '.md')
+STAGES = ('extract', 'analyze', 'generate', 'export')
+
+
+# --- Courses ---
+def course_settings(entry, defaults, base_dir):
+    """Complete one manifest entry with the command-line defaults."""
+    if not entry.get('file'):
+        raise ValueError(f"Course without a file: {entry!r}")
+    file_path = entry['file']
+    if not os.path.isabs(file_path):
+        file_path = os.path.join(base_dir, file_path)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+
+    question_types = entry.get('question_types') or defaults['question_types']
+    if isinstance(question_types, str):
+        question_types = [t.strip() for t in question_types.split(',') if t.strip()]
+    topics = entry.get('topics') or []
+    if isinstance(topics, str):
+        topics = [t.strip() for t in topics.split(',') if t.strip()]
+
+    return {
+        'name': secure_filename(str(entry.get('name') or stem)) or 'course',
+        'file': os.path.abspath(file_path),
+        'subject': entry.get('subject') or stem.replace('_', ' '),
+        'title': entry.get('title') or f"{entry.get('subject') or stem.replace('_', ' ')} Exam Paper",
+        'params': {
+            'num_questions': int(entry.get('num_questions') or defaults['num_questions']),
+            'difficulty': entry.get('difficulty') or defaults['difficulty'],
+            'question_types': question_types,
+            'topics': topics,
+        },
+    }
+
+
+def load_courses(source, defaults):
+    """Course settings from a directory of materials or a JSON/CSV manifest."""
+    if os.path.isdir(source):
+        entries = [
+            {'file': name}
+            for name in sorted(os.listdir(source))
+            if os.path.splitext(name)[1].lower() in COURSE_EXTENSIONS and os.path.isfile(os.path.join(source, name))
+        ]
+        base_dir = source
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r', encoding='utf-8', newline='') as f:
+            if source.lower().endswith('.csv'):
+                entries = list(csv.DictReader(f))
+            else:
+                entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = entries.get('courses', [])
+
+    courses = []
+    seen = set()
+    for entry in entries:
+        course = course_settings(entry, defaults, base_dir)
+        # Two files with the same name in different folders still get their own output folders
+        name, n = course['name'], 1
+        while course['name'] in seen:
+            n += 1
+            course['name'] = f"{name}_{n}"
+        seen.add(course['name'])
+        courses.append(course)
+    return courses
+
+
+# --- Checkpoint ---
+class Checkpoint:
+    """Per-course progress, rewritten atomically after every stage."""
+
+    def __init__(self, path, restart=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._courses = {}
+        if not restart and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._courses = json.load(f).get('courses', {})
+
+    def get(self, name):
+        with self._lock:
+            return dict(self._courses.get(name, {}))
+
+    def update(self, name, replace=False, **fields):
+        """Merge fields into a course's entry (or replace the entry) and save."""
+        with self._lock:
+            if replace:
+                self._courses[name] = {}
+            self._courses.setdefault(name, {}).update(fields)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'courses': self._courses}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def _fingerprint(course):
+    """What a course's saved progress depends on: its settings and its source file."""
+    return {
+        'file': course['file'],
+        'mtime': os.path.getmtime(course['file']),
+        'subject': course['subject'],
+        'title': course['title'],
+        'params': course['params'],
+    }
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# --- Pipeline ---
+class StopRequested(Exception):
+    """Raised between stages once the run has been interrupted."""
+
+
+class BatchRun:
+    """Runs every course through extract -> analyze -> generate -> export."""
+
+    def __init__(self, output, formats, include_answers=False, fill_gaps=False, restart=False):
+        self.output = output
+        self.formats = formats
+        self.include_answers = include_answers
+        self.fill_gaps = fill_gaps
+        os.makedirs(output, exist_ok=True)
+        self.checkpoint = Checkpoint(os.path.join(output, 'checkpoint.json'), restart)
+        self._stop = threading.Event()
+
+    def run_course(self, course):
+        """Process one course, resuming from its last finished stage; returns its summary entry."""
+        name = course['name']
+        course_dir = os.path.join(self.output, name)
+        os.makedirs(course_dir, exist_ok=True)
+        analysis_path = os.path.join(course_dir, 'analysis.json')
+        questions_path = os.path.join(course_dir, 'questions.json')
+
+        fingerprint = _fingerprint(course)
+        state = self.checkpoint.get(name)
+        stale = state.get('fingerprint') != fingerprint
+        if stale:
+            state = {}
+        # Changing only the export formats re-exports the saved paper
+        export_settings = {'formats': self.formats, 'answers': self.include_answers}
+        if (state.get('status') == 'done' and state.get('export') == export_settings
+                and all(os.path.exists(os.path.join(course_dir, f)) for f in state.get('outputs', []))):
+            return {**state, 'name': name, 'skipped': True}
+        done = set(state.get('stages_done', []))
+        timings = dict(state.get('timings', {}))
+        self.checkpoint.update(name, replace=stale, fingerprint=fingerprint, status='running', stages_done=sorted(done), timings=timings, error=None)
+
+        def start_stage():
+            if self._stop.is_set():
+                raise StopRequested()
+            return time.perf_counter()
+
+        def finish_stage(stage, started, **fields):
+            done.add(stage)
+            timings[stage] = round(time.perf_counter() - started, 3)
+            self.checkpoint.update(name, status=stage, stages_done=sorted(done), timings=timings, **fields)
+
+        try:
+            started = start_stage()
+            document = load_document(course['file'], name=f"batch:{name}")
+            finish_stage('extract', started, chars=len(document))
+
+            if 'analyze' in done and os.path.exists(analysis_path):
+                analysis = _read_json(analysis_path)
+            else:
+                started = start_stage()
+                result = analyze_upload(document, course['subject'], PRIORITY_BATCH)
+                if not result['success']:
+                    raise RuntimeError(result['error'])
+                analysis = {'topics': result['topics'], 'question_bank': result['question_bank']}
+                _write_json(analysis_path, analysis)
+                finish_stage('analyze', started, topics=len(analysis['topics']), bank_questions=len(analysis['question_bank']))
+
+            if 'generate' in done and os.path.exists(questions_path):
+                paper = _read_json(questions_path)
+            else:
+                started = start_stage()
+                params = {**course['params'], 'subject': course['subject']}
+                result = build_paper(document, analysis['question_bank'], params, self.fill_gaps, PRIORITY_BATCH)
+                if not result['success']:
+                    raise RuntimeError(result['error'])
+                paper = {
+                    'questions': result['questions'],
+                    'coverage': summarize_coverage(result['coverage']),
+                    'gap_fill': result['gap_fill'],
+                }
+                _write_json(questions_path, paper)
+                finish_stage('generate', started, questions=len(paper['questions']),
+                             coverage=paper['coverage'].get('coverage'))
+
+            started = start_stage()
+            outputs = self.export(course, paper['questions'], course_dir)
+            finish_stage('export', started, outputs=outputs, export=export_settings)
+
+            timings['total'] = round(sum(timings.get(stage, 0) for stage in STAGES), 3)
+            self.checkpoint.update(name, status='done', timings=timings)
+        except StopRequested:
+            pass
+        except Exception as e:
+            print(f"[{name}] failed: {str(e)}")
+            self.checkpoint.update(name, status='failed', error=str(e), timings=timings)
+        return {**self.checkpoint.get(name), 'name': name, 'skipped': False}
+
+    def export(self, course, questions, course_dir):
+        """Write the paper (and answer key) in every requested format; returns the file names."""
+        document = build_document(questions, course['title'])
+        base_name = secure_filename(course['title'].replace(' ', '_')) or course['name']
+        outputs = []
+        for format_type in self.formats:
+            if format_type == 'zip':
+                files = [(f"{base_name}.zip", export_bundle(document, base_name, self.include_answers))]
+            else:
+                files = [(f"{base_name}.{format_type}", export_document(document, format_type, False))]
+                if self.include_answers:
+                    files.append((f"{base_name}_answers.{format_type}", export_document(document, format_type, True)))
+            for filename, data in files:
+                with open(os.path.join(course_dir, filename), 'wb') as f:
+                    f.write(data)
+                outputs.append(filename)
+        return outputs
+
+    def run(self, courses, workers=4):
+        """Run all courses with up to workers at a time and return the run summary."""
+        started_at = datetime.now().isoformat(timespec='seconds')
+        start = time.perf_counter()
+        results = []
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(self.run_course, course) for course in courses]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                label = 'skipped (already done)' if result['skipped'] else result.get('status')
+                print(f"[{result['name']}] {label} {result.get('timings', {})}")
+        except KeyboardInterrupt:
+            print("Interrupted: waiting for running courses to finish their current stage. "
+                  "Run the same command again to resume.")
+            self._stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+        order = {course['name']: i for i, course in enumerate(courses)}
+        results.sort(key=lambda r: order[r['name']])
+        summary = {
+            'started': started_at,
+            'seconds': round(time.perf_counter() - start, 3),
+            'courses': len(courses),
+            'done': sum(1 for r in results if r.get('status') == 'done'),
+            'failed': sum(1 for r in results if r.get('status') == 'failed'),
+            'skipped': sum(1 for r in results if r['skipped']),
+            'model_calls': model_client.stats(),
+            'results': [
+                {key: r.get(key) for key in ('name', 'status', 'skipped', 'timings', 'chars', 'topics',
+                                             'bank_questions', 'questions', 'coverage', 'outputs', 'error')}
+                for r in results
+            ],
+        }
+        _write_json(os.path.join(self.output, 'summary.json'), summary)
+        return summary
+
+
+def print_summary(summary):
+    print(f"\n{summary['done']} of {summary['courses']} courses done ({summary['skipped']} already done earlier), "
+          f"{summary['failed']} failed, in {summary['seconds']:.1f}s")
+    print(f"{'course':<30}{'status':>8}" + ''.join(f"{stage:>10}" for stage in STAGES) + f"{'total':>10}")
+    for r in summary['results']:
+        timings = r.get('timings') or {}
+        cells = ''.join(f"{timings[stage]:>10.2f}" if stage in timings else f"{'-':>10}" for stage in STAGES + ('total',))
+        print(f"{r['name'][:29]:<30}{r.get('status') or '-':>8}{cells}")
+        if r.get('error'):
+            print(f"    {r['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate question papers for a directory or manifest of courses")
+    parser.add_argument('source', help="directory of course files, or a .json/.csv manifest")
+    parser.add_argument('--output', default='batch_output', help="folder for papers, checkpoint and summary")
+    parser.add_argument('--workers', type=int, default=4, help="courses processed at the same time")
+    parser.add_argument('--rate-limit', type=int, default=30, help="model calls per minute across all courses (0: no limit)")
+    parser.add_argument('--call-timeout', type=float, default=600,
+                        help="seconds one model call may take, including its wait under --rate-limit")
+    parser.add_argument('--questions', type=int, default=10, help="questions per paper")
+    parser.add_argument('--difficulty', default='Medium', choices=DIFFICULTIES + ('Mixed',))
+    parser.add_argument('--types', default='MCQ,Short Answer', help="comma-separated question types")
+    parser.add_argument('--formats', default='pdf', help=f"comma-separated: {', '.join(EXPORT_FORMATS)}, zip")
+    parser.add_argument('--answers', action='store_true', help="also write an answer key")
+    parser.add_argument('--fill-gaps', action='store_true', help="regenerate questions for uncovered sections")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and redo every course")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    unknown = [f for f in formats if f not in EXPORT_FORMATS and f != 'zip']
+    if unknown:
+        parser.error(f"unsupported format(s): {', '.join(unknown)}")
+    question_types = [t.strip() for t in args.types.split(',') if t.strip()]
+    unknown = [t for t in question_types if t not in QUESTION_TYPES]
+    if unknown:
+        parser.error(f"unsupported question type(s): {', '.join(unknown)}")
+
+    defaults = {'num_questions': args.questions, 'difficulty': args.difficulty, 'question_types': question_types}
+    courses = load_courses(args.source, defaults)
+    if not courses:
+        print(f"No courses found in {args.source}")
+        return 1
+    missing = [c['file'] for c in courses if not os.path.isfile(c['file'])]
+    if missing:
+        print("Course files not found:\n  " + "\n  ".join(missing))
+        return 1
+
+    # One limit shared by every course; the server's own MODEL_RATE_LIMIT does not apply here
+    model_client.rate_limiter = RateLimiter(args.rate_limit) if args.rate_limit else None
+    # Calls queue behind the rate limit; with the server's deadline they would fail instead of waiting
+    model_client.timeout = args.call_timeout
+
+    print(f"Generating papers for {len(courses)} courses with {args.workers} workers into {args.output}")
+    run = BatchRun(args.output, formats, args.answers, args.fill_gaps, args.restart)
+    try:
+        summary = run.run(courses, args.workers)
+    except KeyboardInterrupt:
+        return 130
+    print_summary(summary)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
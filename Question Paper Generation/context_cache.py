@@ -0,0 +1,298 @@
+"""Model-side caching of the course content sent with generation prompts.
+
+Every generation prompt for an upload starts with the same compacted
+course content, followed by short instructions.  Instead of sending that
+prefix with each call, it is registered with the model backend once, when
+the file is uploaded, and later generations send only the instructions
+with a reference to the cached content.  The backend then processes the
+prefix once per upload rather than once per generation.
+
+Registrations are recorded as small JSON files keyed by the hash of the
+prefix, so all workers (and restarts) reuse the same cached content.  A
+registration close to its expiry is refreshed when it is next used; one
+that has expired, failed to refresh or that the backend reports missing
+is forgotten, and the caller sends the content inline as before.  Other
+errors of a cached call (bad requests, quota, outages) are the caller's to
+handle: sending the content inline would fail the same way at a higher
+cost.
+
+Backends:
+  GeminiContextBackend  google.generativeai caching (SDK 0.7 or later)
+  HttpContextBackend    the cachedContents endpoints of fake_model_server.py,
+                        used for load tests and local runs without an API key
+"""
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from model_client import HttpModel, HttpModelError
+from text_compaction import estimate_tokens
+
+_KEY_LENGTH = 24
+
+
+class ContextCacheUnavailable(Exception):
+    """Raised when a backend cannot cache content (e.g. the installed SDK has no caching)."""
+
+
+def context_key(prefix):
+    return hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:_KEY_LENGTH]
+
+
+def is_cache_missing_error(exc):
+    """True if exc says the backend no longer has the cached content (expired or deleted)."""
+    code = getattr(exc, 'code', None)
+    if code == 404 or type(exc).__name__ == 'NotFound':
+        return True
+    # Gemini answers an unknown cache name with 403 'CachedContent not found (or permission denied)'
+    return code == 403 and 'cachedcontent not found' in str(exc).lower()
+
+
+def cached_token_count(response):
+    """Prompt tokens the backend reports as read from the cache, or None."""
+    usage = getattr(response, 'usage_metadata', None)
+    count = getattr(usage, 'cached_content_token_count', None)
+    return count or None
+
+
+# --- Backends ---
+class GeminiContextBackend:
+    """Cached content through google.generativeai.caching."""
+
+    name = 'gemini'
+
+    def __init__(self, genai, model_name):
+        try:
+            self._caching = importlib.import_module('google.generativeai.caching')
+        except ImportError:
+            raise ContextCacheUnavailable("the installed google-generativeai has no context caching (0.7 or later needed)")
+        self._genai = genai
+        self.model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+
+    def create(self, text, ttl):
+        cached = self._caching.CachedContent.create(
+            model=self.model_name,
+            display_name=f"qpg-{context_key(text)[:12]}",
+            contents=[text],
+            ttl=datetime.timedelta(seconds=ttl)
+        )
+        return cached.name
+
+    def model(self, name):
+        return self._genai.GenerativeModel.from_cached_content(cached_content=name)
+
+    def refresh(self, name, ttl):
+        self._caching.CachedContent.get(name).update(ttl=datetime.timedelta(seconds=ttl))
+
+    def delete(self, name):
+        self._caching.CachedContent.get(name).delete()
+
+
+class HttpContextBackend:
+    """Cached content on an HTTP model backend (see fake_model_server.py).
+
+    POST {url}cachedContents with {"contents", "ttl"} answers {"name"};
+    PATCH and DELETE on {url}<name> refresh and drop it.  Prompts then go
+    to the same url with {"prompt", "cached_content": name}.
+    """
+
+    name = 'http'
+
+    def __init__(self, url, timeout=30):
+        self.url = url if url.endswith('/') else f"{url}/"
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _request(self, method, path, body=None):
+        response = self._session.request(method, f"{self.url}{path}", json=body, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise HttpModelError(response.status_code, response.text[:200])
+        return response.json()
+
+    def create(self, text, ttl):
+        return self._request('POST', 'cachedContents', {'contents': text, 'ttl': ttl})['name']
+
+    def model(self, name):
+        return HttpModel(self.url, cached_content=name)
+
+    def refresh(self, name, ttl):
+        self._request('PATCH', name, {'ttl': ttl})
+
+    def delete(self, name):
+        self._request('DELETE', name)
+
+
+# --- Registry ---
+class ContextCache:
+    """Registry of content prefixes cached on the model backend, shared by all workers.
+
+    A disabled cache (backend None) answers every lookup with None, so
+    callers need no separate code path.  ttl is the lifetime requested
+    for each registration in seconds; one used within refresh_margin
+    seconds of its expiry gets a fresh ttl.  Prefixes under min_tokens are
+    not cached: the Gemini API refuses prefixes below the model's minimum
+    (see CONTEXT_CACHE_MODEL_MIN_TOKENS in app.py).
+    """
+
+    def __init__(self, folder, backend, ttl=3600, refresh_margin=600, min_tokens=4096, max_entries=64):
+        self.folder = folder
+        self.backend = backend
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self._models = {}
+        self._lock = threading.Lock()
+        self._stats = {'registered': 0, 'refreshed': 0, 'hits': 0, 'inline': 0, 'failures': 0, 'tokens_saved': 0}
+        if self.enabled:
+            os.makedirs(folder, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    # --- Entries ---
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write(self, entry):
+        path = self._path(entry['key'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _forget(self, entry):
+        try:
+            os.remove(self._path(entry['key']))
+        except OSError:
+            pass
+        with self._lock:
+            self._models.pop(entry['name'], None)
+
+    def _prune(self):
+        """Drop expired entries and delete the oldest registrations beyond max_entries."""
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.json'):
+                entry = self._read(name[:-5])
+                if entry is not None:
+                    entries.append(entry)
+        now = time.time()
+        live = sorted((e for e in entries if e['expires'] > now), key=lambda e: e['created'], reverse=True)
+        for entry in [e for e in entries if e['expires'] <= now] + live[self.max_entries:]:
+            self._forget(entry)
+            if entry['expires'] > now:
+                try:
+                    self.backend.delete(entry['name'])
+                except Exception as e:
+                    print(f"Could not delete cached context {entry['name']}: {str(e)}")
+
+    # --- Lookup ---
+    def register(self, prefix):
+        """Cache prefix on the backend unless it already is; returns (entry, reason)."""
+        entry, reason = self.lookup(prefix)
+        if entry is not None or reason != 'not registered':
+            return entry, reason
+
+        tokens = estimate_tokens(prefix)
+        try:
+            name = self.backend.create(prefix, self.ttl)
+        except Exception as e:
+            print(f"Could not cache generation context ({tokens} tokens): {str(e)}")
+            self._count('failures')
+            return None, 'registration failed'
+
+        now = time.time()
+        entry = {'key': context_key(prefix), 'name': name, 'tokens': tokens,
+                 'created': now, 'expires': now + self.ttl, 'backend': self.backend.name}
+        self._write(entry)
+        self._count('registered')
+        print(f"Cached generation context as {name} ({tokens} tokens, {self.ttl}s)")
+        self._prune()
+        return entry, None
+
+    def lookup(self, prefix):
+        """The live registration of prefix, refreshed if it is close to expiry; returns (entry, reason).
+
+        entry is None when the content has to be sent inline, and reason
+        says why ('disabled', 'below minimum', 'not registered', 'expired'
+        or 'refresh failed').
+        """
+        if not self.enabled:
+            return None, 'disabled'
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None, 'below minimum'
+
+        entry = self._read(context_key(prefix))
+        if entry is None:
+            return None, 'not registered'
+        now = time.time()
+        if entry['expires'] <= now + 5:  # too close to call on it safely
+            self._forget(entry)
+            return None, 'expired'
+        if entry['expires'] - now < self.refresh_margin:
+            try:
+                self.backend.refresh(entry['name'], self.ttl)
+            except Exception as e:
+                print(f"Could not refresh cached context {entry['name']}: {str(e)}")
+                self._forget(entry)
+                self._count('failures')
+                return None, 'refresh failed'
+            entry['expires'] = time.time() + self.ttl
+            self._write(entry)
+            self._count('refreshed')
+        return entry, None
+
+    def model(self, entry):
+        """Model object that prepends the cached content of entry to each prompt."""
+        with self._lock:
+            model = self._models.get(entry['name'])
+        if model is None:
+            model = self.backend.model(entry['name'])
+            with self._lock:
+                self._models[entry['name']] = model
+        return model
+
+    def invalidate(self, entry):
+        """Forget a registration the backend no longer honours."""
+        print(f"Dropping cached context {entry['name']}")
+        self._forget(entry)
+        self._count('failures')
+
+    def report(self, entry, reason=None, response=None):
+        """Per-call summary: whether the prefix came from the cache and the prompt tokens that saved."""
+        if entry is None:
+            self._count('inline')
+            return {'cached': False, 'reason': reason, 'prefix_tokens_saved': 0}
+        saved = cached_token_count(response) or entry['tokens']
+        with self._lock:
+            self._stats['hits'] += 1
+            self._stats['tokens_saved'] += saved
+        return {
+            'cached': True,
+            'name': entry['name'],
+            'prefix_tokens_saved': saved,
+            'expires_in': int(entry['expires'] - time.time()),
+        }
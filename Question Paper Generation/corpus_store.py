@@ -0,0 +1,279 @@
+"""Shared on-disk store for extracted document text.
+
+Extracted text is appended once to a single data file and indexed by byte
+offsets per document, page and chunk.  Readers memory-map the data file,
+so every worker process on the machine shares the same page-cache copy of
+a corpus instead of holding its own strings, and passages are sliced out
+as memoryviews without loading whole documents.
+
+The data file is append-only: re-uploading a document under the same name
+appends the new text and repoints the index.  Pages are extracted into a
+staging file first, so slow extraction (OCR) never holds the store locked;
+writers then serialize on a lock file (fcntl where available) only to copy
+the staged text in, and the index is replaced atomically, so readers never
+see a half-written entry.
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to an in-process lock only
+    fcntl = None
+
+# Chunks end at the first line break after this many bytes
+CHUNK_BYTES = 64 * 1024
+
+
+def page_separator(previous_source, source):
+    """Separator written before a page: a newline within a source, a blank line between sources."""
+    if previous_source == source and not isinstance(source, int):
+        return "\n"
+    return "\n\n"
+
+
+class StoredDocument:
+    """Read-only view of one stored document.
+
+    Behaves enough like a string for the prompt pipeline: len() is the
+    length in characters and splitlines() yields lines decoded one chunk
+    at a time, so the whole document is never materialized.  str() decodes
+    the full text for callers that need it.
+    """
+
+    __slots__ = ('name', 'chars', 'pages', 'chunks', '_view', '_offset', '_length')
+
+    def __init__(self, name, entry, view):
+        self.name = name
+        self.chars = entry['chars']
+        self.pages = entry['pages']
+        self.chunks = entry['chunks']
+        self._view = view
+        self._offset = entry['offset']
+        self._length = entry['length']
+
+    def __len__(self):
+        return self.chars
+
+    def __str__(self):
+        return self.bytes().tobytes().decode('utf-8')
+
+    def _slice(self, offset, length):
+        return self._view[offset:offset + length]
+
+    def bytes(self):
+        """The whole document as a memoryview over the shared mapping."""
+        return self._slice(self._offset, self._length)
+
+    def page(self, index):
+        """Return (source, memoryview) for one page."""
+        offset, length, source = self.pages[index]
+        return source, self._slice(offset, length)
+
+    def chunk(self, index):
+        """Memoryview of one chunk; chunks always end on a line break."""
+        offset, length = self.chunks[index]
+        return self._slice(offset, length)
+
+    def iter_pages(self):
+        """Yield (source, text) per page, decoding one page at a time."""
+        for index in range(len(self.pages)):
+            source, view = self.page(index)
+            yield source, view.tobytes().decode('utf-8')
+
+    def splitlines(self, keepends=False):
+        """Yield the document's lines, decoding one chunk at a time."""
+        for index in range(len(self.chunks)):
+            text = self.chunk(index).tobytes().decode('utf-8')
+            yield from text.splitlines(keepends)
+
+    def preview(self, max_chars=500):
+        """First max_chars characters of the document."""
+        # A UTF-8 character is at most 4 bytes
+        head = self._slice(self._offset, min(self._length, max_chars * 4)).tobytes()
+        return head.decode('utf-8', errors='ignore')[:max_chars]
+
+
+class CorpusStore:
+    """Append-only memory-mapped text store shared by all workers."""
+
+    def __init__(self, folder, chunk_bytes=CHUNK_BYTES):
+        self.folder = folder
+        self.chunk_bytes = chunk_bytes
+        self.data_path = os.path.join(folder, 'corpus.dat')
+        self.index_path = os.path.join(folder, 'index.json')
+        self.lock_path = os.path.join(folder, 'corpus.lock')
+        self._lock = threading.Lock()
+        self._index = {}
+        self._index_version = None
+        self._mmap = None
+        self._view = memoryview(b'')
+        os.makedirs(folder, exist_ok=True)
+        open(self.data_path, 'ab').close()
+
+    # --- Reading ---
+    def _refresh(self):
+        """Reload the index and remap the data file if another writer changed them."""
+        try:
+            stat = os.stat(self.index_path)
+            version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            version = None
+        if version != self._index_version:
+            self._index = self._read_index()
+            self._index_version = version
+
+        size = os.path.getsize(self.data_path)
+        if size and (self._mmap is None or len(self._mmap) < size):
+            with open(self.data_path, 'rb') as f:
+                # Views handed out earlier keep the old mapping alive until released
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('documents', {})
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def get(self, name):
+        """Return the StoredDocument for name, or None if it is not stored."""
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(name)
+            if entry is None:
+                return None
+            return StoredDocument(name, entry, self._view)
+
+    def info(self, name):
+        """Index entry for name without the page and chunk tables, or None."""
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(name)
+        if entry is None:
+            return None
+        return {key: value for key, value in entry.items() if key not in ('pages', 'chunks')}
+
+    # --- Writing ---
+    def _acquire_file_lock(self):
+        handle = open(self.lock_path, 'a')
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _release_file_lock(self, handle):
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    def put(self, name, pages):
+        """Store a document given as an iterable of (source, text) pages.
+
+        Pages are written as they come, separated as by page_separator(),
+        so the stored text matches the extracted text.  Storing text that
+        is already in the corpus only adds an index entry.
+        """
+        # Pulling pages runs the extraction, so stage them before taking any lock
+        staging = tempfile.NamedTemporaryFile(dir=self.folder, prefix='staging-', suffix='.tmp', delete=False)
+        try:
+            with staging:
+                entry = self._append(staging, pages)
+            with self._lock:
+                handle = self._acquire_file_lock()
+                try:
+                    self._commit(name, entry, staging.name)
+                finally:
+                    self._release_file_lock(handle)
+                self._index_version = None
+        finally:
+            try:
+                os.remove(staging.name)
+            except OSError:
+                pass
+        return self.get(name)
+
+    def _commit(self, name, entry, staging_path):
+        """Append the staged text to the data file and index it under name (lock held)."""
+        index = self._read_index()
+        # Same text already stored (under any name): only add an index entry
+        existing = next((e for e in index.values() if e['sha256'] == entry['sha256']), None)
+        with open(self.data_path, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            start = f.tell()
+            try:
+                if existing is None:
+                    with open(staging_path, 'rb') as src:
+                        shutil.copyfileobj(src, f, 1024 * 1024)
+                    f.flush()
+                    entry = {
+                        **entry,
+                        'offset': start,
+                        'pages': [[offset + start, length, source] for offset, length, source in entry['pages']],
+                        'chunks': [[offset + start, length] for offset, length in entry['chunks']],
+                    }
+                else:
+                    entry = {**existing}
+
+                entry['stored_at'] = time.time()
+                index[name] = entry
+                tmp_path = f"{self.index_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as out:
+                    json.dump({'documents': index}, out)
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                # Nothing indexes the bytes copied so far
+                f.truncate(start)
+                raise
+
+    def _append(self, f, pages):
+        """Write pages at the end of f and return the index entry for them."""
+        start = f.tell()
+        position = start
+        chunk_start = start
+        chars = 0
+        digest = hashlib.sha256()
+        page_index = []
+        chunk_index = []
+        previous_source = None
+
+        for i, (source, text) in enumerate(pages):
+            separator = page_separator(previous_source, source).encode('utf-8') if i else b''
+            data = text.encode('utf-8')
+            for buf, is_page in ((separator, False), (data, True)):
+                if is_page:
+                    # Empty pages are indexed too, so page numbers match the source
+                    page_index.append([position, len(buf), source])
+                if not buf:
+                    continue
+                f.write(buf)
+                digest.update(buf)
+                # Close chunks at the first line break past the chunk size
+                while position + len(buf) - chunk_start >= self.chunk_bytes:
+                    newline = buf.find(b'\n', max(chunk_start + self.chunk_bytes - position - 1, 0))
+                    if newline < 0:
+                        break
+                    end = position + newline + 1
+                    chunk_index.append([chunk_start, end - chunk_start])
+                    chunk_start = end
+                position += len(buf)
+            chars += len(text) + (len(separator) if i else 0)
+            previous_source = source
+
+        if position > chunk_start:
+            chunk_index.append([chunk_start, position - chunk_start])
+
+        return {
+            'offset': start,
+            'length': position - start,
+            'chars': chars,
+            'sha256': digest.hexdigest(),
+            'pages': page_index,
+            'chunks': chunk_index,
+        }
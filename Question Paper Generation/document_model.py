@@ -0,0 +1,263 @@
+"""Intermediate document model for exported question papers.
+
+build_document() normalizes the raw question dicts once: missing and None
+fields get their placeholders, values become strings, and consecutive
+questions with the same topic and type are grouped into sections.  The
+renderers below only walk that structure, so exporting several formats
+(or a paper and its answer key) prepares the questions a single time.
+"""
+import html
+from datetime import datetime
+
+from pdf_engine import PaperPdf
+
+MISSING_TEXT = "Question text not available"
+MISSING_OPTION = "Option text not available"
+MISSING_ANSWER = "Answer not available"
+
+
+class QuestionRecord:
+    """One normalized question."""
+
+    __slots__ = ('number', 'id', 'text', 'type', 'difficulty', 'options', 'answer', 'explanation')
+
+    def __init__(self, number, id, text, type, difficulty, options, answer, explanation):
+        self.number = number
+        self.id = id
+        self.text = text
+        self.type = type
+        self.difficulty = difficulty
+        self.options = options
+        self.answer = answer
+        self.explanation = explanation
+
+
+class Section:
+    """A run of consecutive questions sharing a topic and a question type.
+
+    new_topic and new_type say whether the topic or type differs from the
+    previous section, i.e. whether a renderer should print its header.
+    """
+
+    __slots__ = ('topic', 'type', 'new_topic', 'new_type', 'questions')
+
+    def __init__(self, topic, type, new_topic, new_type):
+        self.topic = topic
+        self.type = type
+        self.new_topic = new_topic
+        self.new_type = new_type
+        self.questions = []
+
+
+class PaperDocument:
+    """A titled, dated paper made of sections."""
+
+    __slots__ = ('title', 'date', 'sections')
+
+    def __init__(self, title, date, sections):
+        self.title = title
+        self.date = date
+        self.sections = sections
+
+    def questions(self):
+        """Iterate over all question records in paper order."""
+        for section in self.sections:
+            yield from section.questions
+
+
+def _text(value, default=''):
+    """value as a stripped string, or default when it is None or empty."""
+    if value is None:
+        return default
+    value = str(value).strip()
+    return value if value else default
+
+
+def build_document(questions, exam_title, date=None):
+    """Normalize raw question dicts into a PaperDocument; non-dict entries are skipped."""
+    sections = []
+    current = None
+    number = 0
+    for q in questions:
+        if not isinstance(q, dict):
+            continue
+        number += 1
+        topic = _text(q.get('topic'), 'General')
+        q_type = _text(q.get('type'), 'General')
+
+        options = []
+        if q_type == 'MCQ' and isinstance(q.get('options'), list):
+            options = [_text(option, MISSING_OPTION) for option in q['options']]
+
+        answer = q.get('correct_answer')
+        record = QuestionRecord(
+            number=number,
+            id=_text(q.get('id')),
+            text=_text(q.get('text'), MISSING_TEXT),
+            type=q_type,
+            difficulty=_text(q.get('difficulty'), 'Medium'),
+            options=tuple(options),
+            answer=MISSING_ANSWER if answer is None else _text(answer),
+            explanation=_text(q.get('explanation')),
+        )
+
+        if current is None or (topic, q_type) != (current.topic, current.type):
+            current = Section(
+                topic, q_type,
+                new_topic=current is None or topic != current.topic,
+                new_type=current is None or q_type != current.type
+            )
+            sections.append(current)
+        current.questions.append(record)
+
+    return PaperDocument(_text(exam_title, 'Exam Paper'), date or datetime.now().strftime('%Y-%m-%d'), sections)
+
+
+def option_label(index):
+    return chr(65 + index)  # A, B, C, D...
+
+
+# --- Renderers ---
+def render_pdf(document, include_answers=False):
+    """Render the paper as PDF bytes."""
+    pdf = PaperPdf()
+    pdf.add_page()
+    pdf.text_line(document.title, height=10, style='B', size=16, align='C')
+    pdf.text_line(f"Date: {document.date}", height=10, size=12, align='R')
+    pdf.ln(5)
+
+    for section in document.sections:
+        if section.new_topic:
+            pdf.text_line(f"Topic: {section.topic}", height=10, style='B', size=14)
+            pdf.ln(2)
+        if section.new_type:
+            pdf.text_line(f"Section: {section.type} Questions", height=10, style='B', size=12)
+            pdf.ln(2)
+
+        for q in section.questions:
+            pdf.text_line(f"Question {q.number} ({q.difficulty} Difficulty)", height=10, style='B', size=11)
+            pdf.paragraph(q.text)
+            if q.options:
+                pdf.ln(2)
+                for j, option in enumerate(q.options):
+                    pdf.paragraph(f"{option_label(j)}. {option}", indent=5)
+                    pdf.ln(1)
+            if include_answers:
+                pdf.ln(2)
+                pdf.text_line("Answer:", style='B')
+                pdf.paragraph(q.answer)
+                if q.explanation:
+                    pdf.ln(2)
+                    pdf.text_line("Explanation:", style='I')
+                    pdf.paragraph(q.explanation, style='I')
+            pdf.ln(5)
+
+    return pdf.to_bytes()
+
+
+_HTML_STYLE = """
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        h1 { text-align: center; }
+        h2 { margin-top: 20px; color: #2c3e50; }
+        h3 { color: #3498db; }
+        .question { margin-bottom: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 5px; }
+        .difficulty { font-size: 0.9em; color: #7f8c8d; }
+        .options { margin-left: 20px; }
+        .answer { margin-top: 10px; padding: 10px; background-color: #f8f9fa; }
+        .explanation { font-style: italic; margin-top: 5px; }
+"""
+
+
+def render_html(document, include_answers=False):
+    """Render the paper as an HTML page; all question content is escaped."""
+    esc = html.escape
+    parts = [
+        "<!DOCTYPE html>\n<html>\n<head>\n",
+        '<meta charset="utf-8">\n',
+        f"<title>{esc(document.title)}</title>\n<style>{_HTML_STYLE}</style>\n</head>\n<body>\n",
+        f"<h1>{esc(document.title)}</h1>\n",
+        f'<p style="text-align: right;">Date: {esc(document.date)}</p>\n',
+    ]
+
+    for section in document.sections:
+        if section.new_topic:
+            parts.append(f"<h2>Topic: {esc(section.topic)}</h2>\n")
+        if section.new_type:
+            parts.append(f"<h3>Section: {esc(section.type)} Questions</h3>\n")
+
+        for q in section.questions:
+            parts.append('<div class="question">\n')
+            parts.append(f'<p><strong>Question {q.number}</strong> <span class="difficulty">({esc(q.difficulty)} Difficulty)</span></p>\n')
+            parts.append(f"<p>{esc(q.text)}</p>\n")
+            if q.options:
+                parts.append('<div class="options">\n')
+                for j, option in enumerate(q.options):
+                    parts.append(f"<p>{option_label(j)}. {esc(option)}</p>\n")
+                parts.append('</div>\n')
+            if include_answers:
+                parts.append(f'<div class="answer">\n<p><strong>Answer:</strong> {esc(q.answer)}</p>\n')
+                if q.explanation:
+                    parts.append(f'<p class="explanation"><strong>Explanation:</strong> {esc(q.explanation)}</p>\n')
+                parts.append('</div>\n')
+            parts.append('</div>\n')
+
+    parts.append("</body>\n</html>\n")
+    return ''.join(parts)
+
+
+def render_markdown(document, include_answers=False):
+    """Render the paper as Markdown."""
+    parts = [f"# {document.title}\n\nDate: {document.date}\n\n"]
+
+    for section in document.sections:
+        if section.new_topic:
+            parts.append(f"## Topic: {section.topic}\n\n")
+        if section.new_type:
+            parts.append(f"### Section: {section.type} Questions\n\n")
+
+        for q in section.questions:
+            parts.append(f"**Question {q.number}** ({q.difficulty} Difficulty)\n\n{q.text}\n\n")
+            for j, option in enumerate(q.options):
+                parts.append(f"{option_label(j)}. {option}\n\n")
+            if include_answers:
+                parts.append(f"**Answer:** {q.answer}\n\n")
+                if q.explanation:
+                    parts.append(f"*Explanation:* {q.explanation}\n\n")
+            parts.append("---\n\n")
+
+    return ''.join(parts)
+
+
+def render_error(format_type, message):
+    """A short document in format_type explaining that the export failed."""
+    if format_type == 'pdf':
+        pdf = PaperPdf()
+        pdf.add_page()
+        pdf.text_line("Error Generating PDF", height=10, style='B', size=16, align='C')
+        pdf.text_line("An error occurred while generating the PDF.", height=10, size=12)
+        pdf.paragraph(f"Error: {message}", height=10, size=12)
+        return pdf.to_bytes()
+    if format_type == 'html':
+        return ("<!DOCTYPE html>\n<html>\n<head>\n<title>Error</title>\n</head>\n<body>\n"
+                "<h1>Error Generating HTML</h1>\n<p>An error occurred while generating the HTML document.</p>\n"
+                f"<p>Error: {html.escape(message)}</p>\n</body>\n</html>\n")
+    return f"# Error Generating Markdown\n\nAn error occurred while generating the markdown document.\n\nError: {message}\n"
+
+
+RENDERERS = {
+    'pdf': render_pdf,
+    'html': render_html,
+    'md': render_markdown,
+}
+
+MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'html': 'text/html',
+    'md': 'text/markdown',
+}
+
+
+def render(document, format_type, include_answers=False):
+    """Render document in format_type ('pdf', 'html' or 'md') and return bytes."""
+    output = RENDERERS[format_type](document, include_answers)
+    return output if isinstance(output, bytes) else output.encode('utf-8')
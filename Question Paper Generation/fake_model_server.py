@@ -0,0 +1,284 @@
+"""Local stand-in for the Gemini API, used by load tests.
+
+Serves POST / with {"prompt": ...} and answers {"text": ...} the way the
+app's prompts expect: per-chunk topic lists for analysis prompts and the
+requested number of valid questions for generation prompts.  Latency,
+error rate and an upstream concurrency cap are configurable, so the app
+can be driven at realistic model speeds without an API key or quota.
+
+It also stands in for Gemini context caching: POST /cachedContents with
+{"contents", "ttl"} stores a prompt prefix and answers its {"name"},
+PATCH /<name> with {"ttl"} extends it and DELETE /<name> drops it.  A
+prompt posted with {"cached_content": name} is answered as if the stored
+prefix preceded it, or with 404 once the entry has expired.
+
+Point the app at it with MODEL_BACKEND_URL=http://127.0.0.1:<port>/.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_CHUNK_RE = re.compile(r'\[CHUNK (c\d+)\]')
+_GENERATE_RE = re.compile(r"Generate (\d+) exam questions for the subject '([^']*)' covering (.+?)\.\s*$", re.MULTILINE)
+_TYPES_RE = re.compile(r"Include the following types of questions: (.+?)\.\s*$", re.MULTILINE)
+_DIFFICULTY_RE = re.compile(r"Questions should be at (\w+) difficulty level")
+_WORD_RE = re.compile(r'[A-Za-z][A-Za-z-]{3,}')
+
+
+def _content_words(prompt):
+    """Words from the CONTENT section of a prompt, used to make answers look on-topic."""
+    start = prompt.find('CONTENT:')
+    end = prompt.find('Based on the above', start)
+    if end < 0:
+        end = prompt.find('Generate ', start)
+    words = _WORD_RE.findall(prompt[start:end] if start >= 0 else prompt)
+    return words or ['systems', 'processes', 'scheduling', 'memory', 'clocks']
+
+
+def analysis_answer(prompt, rng):
+    """One topic entry per [CHUNK cN] label in an analysis prompt."""
+    words = _content_words(prompt)
+    entries = []
+    for chunk_id in _CHUNK_RE.findall(prompt):
+        topic = ' '.join(rng.choice(words).title() for _ in range(2))
+        entries.append({
+            "chunk_id": chunk_id,
+            "topics": [{
+                "topic": topic,
+                "subtopics": [rng.choice(words).title() for _ in range(2)],
+                "importance": rng.choice(['High', 'Medium', 'Low']),
+                "question_types": ["MCQ", "Short Answer"],
+            }],
+        })
+    return entries
+
+
+def generation_answer(prompt, rng):
+    """The number of questions a generation prompt asks for, of the requested types."""
+    match = _GENERATE_RE.search(prompt)
+    count = int(match.group(1)) if match else 5
+    topics = match.group(3).split(', ') if match else ['General']
+    types_match = _TYPES_RE.search(prompt)
+    types = types_match.group(1).split(', ') if types_match else ['MCQ', 'Short Answer']
+    difficulty_match = _DIFFICULTY_RE.search(prompt)
+    difficulty = difficulty_match.group(1) if difficulty_match else 'Medium'
+    words = _content_words(prompt)
+
+    questions = []
+    for i in range(count):
+        q_type = types[i % len(types)]
+        phrase = ' '.join(rng.choice(words) for _ in range(6))
+        question = {
+            "id": f"fake_{rng.getrandbits(32):08x}",
+            "text": f"Explain how {phrase} relate to each other ({i + 1})?",
+            "correct_answer": f"They relate through {rng.choice(words)}.",
+            "explanation": f"See the section on {rng.choice(words)}.",
+            "topic": topics[i % len(topics)],
+            "difficulty": difficulty,
+            "type": q_type,
+        }
+        if q_type == 'MCQ':
+            question["options"] = [f"{rng.choice(words)} {rng.choice(words)} ({letter})" for letter in 'ABCD']
+            question["correct_answer"] = question["options"][rng.randrange(4)]
+        questions.append(question)
+    return questions
+
+
+def answer_for(prompt, rng):
+    """Response text for a prompt, as the model would produce it."""
+    if _CHUNK_RE.search(prompt):
+        return json.dumps(analysis_answer(prompt, rng))
+    if 'exam questions for the subject' in prompt:
+        return "```json\n" + json.dumps(generation_answer(prompt, rng)) + "\n```"
+    # Repair and anything else: an empty list keeps the app on its fallback paths
+    return "[]"
+
+
+class FakeModelServer:
+    """Threaded HTTP server answering model prompts after a simulated delay.
+
+    latency is the mean delay in seconds, spread uniformly by +/- jitter
+    (a fraction of latency).  error_rate is the share of calls answered
+    with 503, and calls beyond max_concurrency in flight get 429, like a
+    quota-limited API.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=1.0, jitter=0.5, error_rate=0.0, max_concurrency=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'calls': 0, 'errors': 0, 'throttled': 0, 'peak_in_flight': 0, 'prompt_chars': 0,
+                       'cached_calls': 0, 'cached_chars': 0}
+        self._caches = {}  # name -> [contents, expiry time]
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self):
+        """Serve in a background thread and return self."""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-model-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _delay(self):
+        with self._lock:
+            spread = self.latency * self.jitter
+            return max(0.0, self._rng.uniform(self.latency - spread, self.latency + spread))
+
+    # --- Cached Contents ---
+    def _live_cache(self, name):
+        """The entry for name if it exists and has not expired (call with the lock held)."""
+        entry = self._caches.get(name)
+        if entry is not None and entry[1] <= time.time():
+            del self._caches[name]
+            entry = None
+        return entry
+
+    def _cache_request(self, method, name, body):
+        """Return (status, body) for a create, refresh or delete of cached content."""
+        with self._lock:
+            if method == 'POST' and name is None:
+                if not isinstance(body.get('contents'), str):
+                    return 400, {"error": "Expected contents to cache"}
+                name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+                self._caches[name] = [body['contents'], time.time() + float(body.get('ttl', 3600))]
+                return 200, {"name": name}
+            entry = self._live_cache(name)
+            if entry is None:
+                return 404, {"error": f"Cached content not found: {name}"}
+            if method == 'PATCH':
+                entry[1] = time.time() + float(body.get('ttl', 3600))
+                return 200, {"name": name}
+            if method == 'DELETE':
+                del self._caches[name]
+                return 200, {}
+            return 405, {"error": f"{method} is not supported on cached content"}
+
+    def _handle(self, prompt, cached_content=None):
+        """Return (status, body) for one prompt."""
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['prompt_chars'] += len(prompt)
+            if cached_content is not None:
+                entry = self._live_cache(cached_content)
+                if entry is None:
+                    return 404, {"error": f"Cached content not found: {cached_content}"}
+                self._stats['cached_calls'] += 1
+                self._stats['cached_chars'] += len(entry[0])
+                prompt = entry[0] + prompt
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                self._stats['throttled'] += 1
+                return 429, {"error": "Resource has been exhausted (fake quota)"}
+            self._in_flight += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+            fail = self._rng.random() < self.error_rate
+            rng = random.Random(self._rng.getrandbits(64))
+        try:
+            time.sleep(self._delay())
+            if fail:
+                with self._lock:
+                    self._stats['errors'] += 1
+                return 503, {"error": "The service is currently unavailable (fake error)"}
+            return 200, {"text": answer_for(prompt, rng)}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _body(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(body, dict):
+                    raise ValueError("Expected a JSON object")
+                return body
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _cache_name(self):
+                path = self.path.strip('/')
+                if path == 'cachedContents':
+                    return None
+                return path if path.startswith('cachedContents/') else ''
+
+            def do_POST(self):
+                try:
+                    body = self._body()
+                except ValueError:
+                    self._send(400, {"error": "Expected a JSON body with a prompt"})
+                    return
+                name = self._cache_name()
+                if name is None:
+                    self._send(*server._cache_request('POST', None, body))
+                else:
+                    self._send(*server._handle(str(body.get('prompt', '')), body.get('cached_content')))
+
+            def do_PATCH(self):
+                try:
+                    body = self._body()
+                except ValueError:
+                    body = {}
+                self._send(*server._cache_request('PATCH', self._cache_name(), body))
+
+            def do_DELETE(self):
+                self._send(*server._cache_request('DELETE', self._cache_name(), {}))
+
+            def do_GET(self):
+                self._send(200, server.stats())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake model server for load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=1.0, help="mean seconds per call")
+    parser.add_argument('--jitter', type=float, default=0.5, help="latency spread as a fraction of --latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="calls in flight before answering 429 (0: no limit)")
+    args = parser.parse_args()
+
+    fake = FakeModelServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.max_concurrency)
+    print(f"Fake model server on {fake.url} (GET for stats)")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,142 @@
+"""Bounded HTML-to-PDF rendering service.
+
+Conversions run on a fixed pool of worker threads fed from a bounded
+queue.  When the queue is full render() fails fast with RendererBusy
+instead of piling up more wkhtmltopdf processes, and every job has a
+deadline covering both its wait in the queue and the conversion itself;
+a conversion that overruns it is killed.  HTML goes in as a string and
+the PDF comes back as bytes over pipes, so no temp files are written.
+"""
+import queue
+import subprocess
+import threading
+import time
+
+import pdfkit
+
+DEFAULT_OPTIONS = {
+    'quiet': '',
+    'encoding': 'UTF-8',
+}
+
+
+class RendererBusy(Exception):
+    """Raised when the render queue is full."""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render job misses its deadline."""
+
+
+class _RenderJob:
+    """One queued conversion and its result slot."""
+
+    def __init__(self, html, deadline):
+        self.html = html
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class HtmlRenderer:
+    """Pool of warm worker threads converting HTML strings to PDF bytes.
+
+    The wkhtmltopdf binary is located once and reused by every job; only
+    the conversion process itself is started per job.
+    """
+
+    def __init__(self, workers=2, queue_size=8, timeout=60.0, wkhtmltopdf='', options=None):
+        self.timeout = timeout
+        self.wkhtmltopdf = wkhtmltopdf
+        self.options = {**DEFAULT_OPTIONS, **(options or {})}
+        self._configuration = None
+        self._config_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._stats = {'rendered': 0, 'rejected': 0, 'timed_out': 0, 'failed': 0}
+        self._workers = [
+            threading.Thread(target=self._work, name=f"html-renderer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        """Return job counters and the current queue length."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['workers'] = len(self._workers)
+        return stats
+
+    def _get_configuration(self):
+        """Resolve the wkhtmltopdf binary once; raises IOError if it is missing."""
+        with self._config_lock:
+            if self._configuration is None:
+                self._configuration = pdfkit.configuration(wkhtmltopdf=self.wkhtmltopdf)
+            return self._configuration
+
+    def render(self, html, timeout=None):
+        """Convert an HTML string to PDF bytes.
+
+        Raises RendererBusy if the queue is full and RenderTimeout if the
+        job does not finish within timeout seconds (queueing included).
+        """
+        job = _RenderJob(html, time.monotonic() + (timeout or self.timeout))
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count('rejected')
+            raise RendererBusy("PDF renderer is busy, please retry shortly")
+
+        if not job.done.wait(max(job.deadline - time.monotonic(), 0)):
+            # The worker skips the job, or kills its conversion, once the deadline passes
+            raise RenderTimeout("PDF rendering timed out")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.result = self._convert(job)
+            except Exception as e:
+                job.error = e
+            finally:
+                job.done.set()
+                self._queue.task_done()
+
+    def _convert(self, job):
+        remaining = job.deadline - time.monotonic()
+        if remaining <= 0:
+            self._count('timed_out')
+            raise RenderTimeout("PDF rendering timed out while queued")
+
+        # pdfkit builds the command line; '-' as input and output means stdin/stdout
+        converter = pdfkit.PDFKit(job.html, 'string', options=self.options, configuration=self._get_configuration())
+        try:
+            result = subprocess.run(
+                converter.command(),
+                input=job.html.encode('utf-8'),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=remaining
+            )
+        except subprocess.TimeoutExpired:
+            self._count('timed_out')
+            raise RenderTimeout("PDF rendering timed out")
+
+        # wkhtmltopdf exits non-zero on some page warnings even when the PDF is fine
+        if not result.stdout.startswith(b'%PDF'):
+            self._count('failed')
+            stderr = result.stderr.decode('utf-8', errors='replace').strip()
+            raise IOError(f"wkhtmltopdf failed (exit code {result.returncode}): {stderr[:500]}")
+
+        self._count('rendered')
+        return result.stdout
@@ -0,0 +1,262 @@
+"""Incremental JSON reading for large extracted-text corpora.
+
+The merged corpora written by the extraction pipeline look like
+``{"file.pdf": {"text": ["page 1", "page 2", ...]}, ...}`` and can grow to
+hundreds of MB, so they are walked event by event instead of being loaded
+with ``json.load``.  Only one page string is held in memory at a time.
+"""
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_RE = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+# --- Tokenizer ---
+class _Reader:
+    """Buffered character reader that discards consumed input."""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read one more chunk into the buffer. Returns False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed so the buffer stays bounded
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def read_string(self):
+        """Consume a JSON string (the opening quote is at pos) and return it decoded.
+
+        A string spanning several chunks is collected in pieces that are
+        joined once at the closing quote, so long strings cost linear time.
+        """
+        pieces = []
+        start = self.pos + 1
+        search_from = start
+        while True:
+            end = self.buf.find('"', search_from)
+            if end == -1:
+                # Move the scanned text out of the buffer, except a trailing run
+                # of backslashes, which may escape a quote in the next chunk
+                keep = len(self.buf)
+                while keep > start and self.buf[keep - 1] == '\\':
+                    keep -= 1
+                pieces.append(self.buf[start:keep])
+                self.pos = keep
+                if not self.fill():
+                    raise ValueError("Unterminated string in JSON")
+                start = search_from = 0
+                continue
+            # Count preceding backslashes to tell escaped quotes apart
+            backslashes = 0
+            i = end - 1
+            while i >= start and self.buf[i] == '\\':
+                backslashes += 1
+                i -= 1
+            if backslashes % 2 == 0:
+                break
+            search_from = end + 1
+
+        pieces.append(self.buf[start:end])
+        raw = ''.join(pieces)
+        self.pos = end + 1
+        if '\\' not in raw:
+            return raw
+        return json.loads('"' + raw + '"')
+
+    def read_scalar(self):
+        """Consume a number or literal (true/false/null) and return its value."""
+        # Make sure the whole token is buffered before matching it
+        while True:
+            end = self.pos
+            while end < len(self.buf) and self.buf[end] not in _WHITESPACE + ',]}':
+                end += 1
+            if end < len(self.buf) or not self.fill():
+                break
+        token = self.buf[self.pos:end]
+        self.pos = end
+
+        if token in _LITERALS:
+            return _LITERALS[token]
+        if _NUMBER_RE.fullmatch(token):
+            return json.loads(token)
+        raise ValueError(f"Invalid JSON token: {token[:20]!r}")
+
+
+def iter_events(f, chunk_size=CHUNK_SIZE):
+    """Yield (event, value) pairs for a JSON document read from a text file object.
+
+    Events are 'start_map', 'end_map', 'map_key', 'start_array', 'end_array'
+    and 'value'.
+    """
+    reader = _Reader(f, chunk_size)
+    # Stack of containers: '{' or '['; expect_key tracks position inside maps
+    stack = []
+    expect_key = False
+
+    while True:
+        ch = reader.peek()
+        if not ch:
+            break
+
+        if ch == ',':
+            reader.pos += 1
+            if stack and stack[-1] == '{':
+                expect_key = True
+            continue
+        if ch == ':':
+            reader.pos += 1
+            continue
+
+        if ch == '{':
+            reader.pos += 1
+            stack.append('{')
+            expect_key = True
+            yield 'start_map', None
+        elif ch == '}':
+            reader.pos += 1
+            stack.pop()
+            expect_key = False
+            yield 'end_map', None
+        elif ch == '[':
+            reader.pos += 1
+            stack.append('[')
+            expect_key = False
+            yield 'start_array', None
+        elif ch == ']':
+            reader.pos += 1
+            stack.pop()
+            yield 'end_array', None
+        elif ch == '"':
+            value = reader.read_string()
+            if expect_key:
+                expect_key = False
+                yield 'map_key', value
+            else:
+                yield 'value', value
+        else:
+            yield 'value', reader.read_scalar()
+
+    if stack:
+        raise ValueError("Unexpected end of JSON document")
+
+
+# --- Value helpers ---
+def _build_value(events, event, value):
+    """Materialize the value that starts with (event, value) from the event stream."""
+    if event == 'value':
+        return value
+    if event == 'start_array':
+        items = []
+        for event, value in events:
+            if event == 'end_array':
+                return items
+            items.append(_build_value(events, event, value))
+    elif event == 'start_map':
+        obj = {}
+        for event, value in events:
+            if event == 'end_map':
+                return obj
+            key = value
+            event, value = next(events)
+            obj[key] = _build_value(events, event, value)
+    raise ValueError("Malformed JSON document")
+
+
+def _skip_value(events, event):
+    """Consume the value that starts with event without building it."""
+    if event not in ('start_map', 'start_array'):
+        return
+    depth = 1
+    for event, _ in events:
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def _iter_text_field(events, source):
+    """Yield (source, text) for every entry of a {"text": ...} object."""
+    for event, key in events:
+        if event == 'end_map':
+            return
+        event, value = next(events)
+        if key != 'text':
+            _skip_value(events, event)
+        elif event == 'start_array':
+            for event, value in events:
+                if event == 'end_array':
+                    break
+                yield source, str(_build_value(events, event, value))
+        else:
+            yield source, str(_build_value(events, event, value))
+
+
+# --- Public API ---
+def iter_json_text(json_path, chunk_size=CHUNK_SIZE):
+    """Stream (source, text) pairs out of an extracted-text JSON file.
+
+    - Dicts yield one pair per page for ``{"name": {"text": [...]}}`` entries
+      (source is the key, e.g. the original PDF name) and one pair for
+      ``{"name": "text"}`` entries.
+    - Lists yield one pair per item, with the item index as source.
+    - Any other top-level value yields a single pair with source None.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        events = iter_events(f, chunk_size)
+        try:
+            event, value = next(events)
+        except StopIteration:
+            raise ValueError("Empty JSON document")
+
+        if event == 'start_map':
+            for event, key in events:
+                if event == 'end_map':
+                    break
+                event, value = next(events)
+                if event == 'start_map':
+                    yield from _iter_text_field(events, key)
+                elif event == 'value' and isinstance(value, str):
+                    yield key, value
+                else:
+                    _skip_value(events, event)
+        elif event == 'start_array':
+            index = 0
+            for event, value in events:
+                if event == 'end_array':
+                    break
+                yield index, str(_build_value(events, event, value))
+                index += 1
+        else:
+            yield None, str(_build_value(events, event, value))
+
+        # Drain the stream so trailing garbage is reported as an error
+        for _ in events:
+            raise ValueError("Extra data after JSON document")
@@ -0,0 +1,550 @@
+"""End-to-end load test for the question paper app.
+
+Virtual users run realistic sessions against the HTTP API: upload a course
+file (which runs topic analysis), generate a paper from it, then export the
+paper in every format.  By default the app is started in a subprocess
+against fake_model_server.py, so model latency and failures are under the
+test's control and no API key is needed.
+
+The report gives throughput, error rates and p50/p95/p99 latency per
+endpoint, plus CPU, memory and thread use of the app's process tree (read
+from /proc).  Reports are written as JSON; --compare checks a run against
+an earlier report and exits non-zero on a regression, so serving
+configurations can be compared before rolling one out.
+
+    python load_test.py --users 8 --sessions 40 --output baseline.json
+    python load_test.py --users 8 --sessions 40 --env MODEL_MAX_CONCURRENCY=4 --compare baseline.json
+    python load_test.py --app-cmd "gunicorn -w 4 -b 127.0.0.1:{port} app:app" --compare baseline.json
+"""
+import argparse
+import json
+import os
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from fake_model_server import FakeModelServer
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILE = os.path.join(APP_DIR, 'uploads', 'combined_extracted_text_34.json')
+DEFAULT_APP_CMD = "{python} -c \"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)\""
+EXPORT_FORMATS = ('pdf', 'html', 'md', 'zip')
+PERCENTILES = (50, 95, 99)
+
+# Relative increase in p95/p99 latency (or drop in throughput) counted as a regression
+DEFAULT_TOLERANCE = 0.10
+# Absolute increase in error rate counted as a regression
+ERROR_RATE_TOLERANCE = 0.01
+
+
+# --- Statistics ---
+def percentile(sorted_values, pct):
+    """pct-th percentile of an ascending list, interpolating between ranks."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize_samples(samples, elapsed):
+    """Per-endpoint counts, error rate, throughput and latency percentiles.
+
+    samples is a list of (endpoint, status, seconds) tuples; status 0 means
+    the request did not get an HTTP answer at all.
+    """
+    by_endpoint = {}
+    for endpoint, status, seconds in samples:
+        by_endpoint.setdefault(endpoint, []).append((status, seconds))
+
+    summary = {}
+    for endpoint, results in sorted(by_endpoint.items()):
+        latencies = sorted(seconds for _, seconds in results)
+        errors = sum(1 for status, _ in results if not 200 <= status < 300)
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        entry = {
+            'requests': len(results),
+            'errors': errors,
+            'error_rate': round(errors / len(results), 4),
+            'throughput': round(len(results) / elapsed, 3) if elapsed else None,
+            'statuses': statuses,
+            'mean': round(sum(latencies) / len(latencies), 4),
+            'max': round(latencies[-1], 4),
+        }
+        for pct in PERCENTILES:
+            entry[f'p{pct}'] = round(percentile(latencies, pct), 4)
+        summary[endpoint] = entry
+    return summary
+
+
+# --- Resource Monitoring ---
+class ProcessMonitor:
+    """Samples CPU time, RSS, threads and open files of a process and its descendants.
+
+    Reads /proc, so it only reports on Linux; elsewhere report() is None.
+    CPU time of children that have already exited is included through the
+    root process's cutime/cstime.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.available = os.path.exists(f'/proc/{pid}/stat')
+        self._ticks = os.sysconf('SC_CLK_TCK') if self.available else 100
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if self.available else 4096
+        self._samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='process-monitor', daemon=True)
+
+    @staticmethod
+    def _read_stat(pid):
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Fields after the parenthesised command name, which may contain spaces
+        return data[data.rindex(')') + 2:].split()
+
+    def _tree(self):
+        """pid plus all of its descendants."""
+        children = {}
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                fields = self._read_stat(name)
+                if fields:
+                    children.setdefault(int(fields[1]), []).append(int(name))
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, []))
+        return pids
+
+    def sample(self):
+        """One (time, cpu_seconds, rss_bytes, threads, open_files) reading of the tree."""
+        cpu = rss = threads = files = 0
+        for pid in self._tree():
+            fields = self._read_stat(pid)
+            if not fields:
+                continue
+            # utime, stime, cutime, cstime are fields 14-17 of /proc/<pid>/stat
+            cpu += int(fields[11]) + int(fields[12])
+            if pid == self.pid:
+                cpu += int(fields[13]) + int(fields[14])
+            threads += int(fields[17])
+            rss += int(fields[21]) * self._page_size
+            try:
+                files += len(os.listdir(f'/proc/{pid}/fd'))
+            except OSError:
+                pass
+        return time.monotonic(), cpu / self._ticks, rss, threads, files
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._samples.append(self.sample())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.available:
+            self._samples.append(self.sample())
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self.available:
+            self._stop.set()
+            self._thread.join()
+            self._samples.append(self.sample())
+
+    def report(self):
+        if not self.available or len(self._samples) < 2:
+            return None
+        first, last = self._samples[0], self._samples[-1]
+        elapsed = last[0] - first[0]
+        cpu_seconds = last[1] - first[1]
+        rss = [s[2] for s in self._samples]
+        return {
+            'cpu_seconds': round(cpu_seconds, 2),
+            'cpu_percent': round(100.0 * cpu_seconds / elapsed, 1) if elapsed else None,
+            'peak_rss_mb': round(max(rss) / 2 ** 20, 1),
+            'mean_rss_mb': round(sum(rss) / len(rss) / 2 ** 20, 1),
+            'peak_threads': max(s[3] for s in self._samples),
+            'peak_open_files': max(s[4] for s in self._samples),
+        }
+
+
+# --- App Under Test ---
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(app_cmd, port, model_url, env_overrides, workdir):
+    """Start the app in workdir and wait until it answers; returns the Popen."""
+    env = dict(os.environ)
+    env.update(env_overrides)
+    env['MODEL_BACKEND_URL'] = model_url
+    # Keep uploads, stores and caches of the run out of the source tree
+    env['APP_DATA_DIR'] = workdir
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_DIR, env.get('PYTHONPATH')]))
+    env['PYTHONUNBUFFERED'] = '1'
+    command = shlex.split(app_cmd.format(python=shlex.quote(sys.executable), port=port))
+    log = open(os.path.join(workdir, 'app.log'), 'wb')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}; see {log.name}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=2)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_app(process)
+    raise RuntimeError(f"App did not start within 60s; see {log.name}")
+
+
+def stop_app(process):
+    """Stop the app and any worker processes it started."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+# --- Sessions ---
+def session_payload(template, filename, session_no, unique):
+    """Upload body for one session.
+
+    With unique, every page is tagged with the session number so each
+    session is a different course and topic analysis cannot be served
+    from the analysis cache; otherwise all sessions upload the same file.
+    """
+    if not unique:
+        return template
+    if filename.endswith('.json'):
+        try:
+            data = json.loads(template)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for entry in data.values():
+                if isinstance(entry, dict) and isinstance(entry.get('text'), list):
+                    entry['text'] = [f"Course {session_no}. {page}" for page in entry['text']]
+            return json.dumps(data).encode('utf-8')
+    if filename.endswith(('.txt', '.md')):
+        return f"Course {session_no}\n".encode('utf-8') + template
+    return template
+
+
+class LoadTest:
+    """Runs sessions from a number of concurrent virtual users and records every request."""
+
+    def __init__(self, base_url, template, filename, users=4, sessions=20, duration=None, formats=EXPORT_FORMATS,
+                 num_questions=10, think_time=0.0, ramp_up=0.0, unique_content=True, request_timeout=300):
+        self.base_url = base_url.rstrip('/')
+        self.template = template
+        self.filename = filename
+        self.users = users
+        self.sessions = sessions
+        self.duration = duration
+        self.formats = formats
+        self.num_questions = num_questions
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.unique_content = unique_content
+        self.request_timeout = request_timeout
+        self.samples = []
+        self.session_results = {'completed': 0, 'failed': 0}
+        self.failures = []
+        self._lock = threading.Lock()
+        self._next_session = 0
+        self._stop_at = None
+
+    def _claim_session(self):
+        """Next session number, or None when the run is over."""
+        with self._lock:
+            if self._stop_at is not None and time.monotonic() >= self._stop_at:
+                return None
+            if self.duration is None and self._next_session >= self.sessions:
+                return None
+            self._next_session += 1
+            return self._next_session
+
+    def _request(self, http, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = http.request(method, self.base_url + path, timeout=self.request_timeout, **kwargs)
+            status = response.status_code
+        except requests.RequestException as e:
+            response, status = None, 0
+            error = str(e)
+        with self._lock:
+            self.samples.append((endpoint, status, time.perf_counter() - start))
+        if not 200 <= status < 300:
+            detail = error if response is None else response.text[:200]
+            raise RuntimeError(f"{endpoint} failed ({status}): {detail}")
+        return response
+
+    def _pause(self):
+        if self.think_time:
+            time.sleep(self.think_time)
+
+    def run_session(self, http, session_no):
+        """upload -> generate -> export in each format."""
+        ext = os.path.splitext(self.filename)[1]
+        name = f"loadtest_{session_no:05d}{ext}"
+        payload = session_payload(self.template, self.filename, session_no, self.unique_content)
+        # Topic analysis is cached per subject, so shared content also needs a shared subject
+        subject = f"Course {session_no}" if self.unique_content else "Load Test Course"
+
+        upload = self._request(http, 'upload', 'POST', '/api/upload',
+                               files={'file': (name, payload)}, data={'subject': subject}).json()
+        self._pause()
+
+        topics = [t['topic'] for t in upload.get('topics', [])[:3] if isinstance(t, dict) and t.get('topic')]
+        paper = self._request(http, 'generate', 'POST', '/api/generate-questions', json={
+            'filename': upload['filename'],
+            'subject': subject,
+            'topics': topics,
+            'difficulty': 'Medium',
+            'question_types': ['MCQ', 'Short Answer'],
+            'num_questions': self.num_questions,
+        }).json()
+        self._pause()
+
+        for format_type in self.formats:
+            self._request(http, f'export:{format_type}', 'POST', '/api/export', json={
+                'paper_id': paper['paper_id'],
+                'version': paper['version'],
+                'format': format_type,
+                'title': f"{subject} Paper",
+                'include_answers': True,
+            })
+            self._pause()
+
+    def _user(self, index):
+        if self.ramp_up:
+            time.sleep(self.ramp_up * index / self.users)
+        http = requests.Session()
+        while True:
+            session_no = self._claim_session()
+            if session_no is None:
+                return
+            try:
+                self.run_session(http, session_no)
+                outcome = 'completed'
+            except Exception as e:
+                outcome = 'failed'
+                with self._lock:
+                    if len(self.failures) < 20:
+                        self.failures.append(f"session {session_no}: {e}")
+            with self._lock:
+                self.session_results[outcome] += 1
+
+    def run(self):
+        """Run all users to completion and return the elapsed seconds."""
+        start = time.monotonic()
+        if self.duration is not None:
+            self._stop_at = start + self.duration
+        threads = [threading.Thread(target=self._user, args=(i,), name=f'user-{i}', daemon=True) for i in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - start
+
+
+# --- Reports ---
+def compare_reports(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Per-endpoint changes against a baseline report and the regressions among them."""
+    rows, regressions = [], []
+    for endpoint, current in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        row = {'endpoint': endpoint}
+        for key in ('p50', 'p95', 'p99', 'throughput'):
+            if before.get(key):
+                row[key] = round((current[key] - before[key]) / before[key], 3)
+        row['error_rate'] = round(current['error_rate'] - before['error_rate'], 4)
+        rows.append(row)
+
+        for key in ('p95', 'p99'):
+            if row.get(key, 0) > tolerance:
+                regressions.append(f"{endpoint} {key} {before[key]:.3f}s -> {current[key]:.3f}s")
+        if row.get('throughput', 0) < -tolerance:
+            regressions.append(f"{endpoint} throughput {before['throughput']} -> {current['throughput']} req/s")
+        if row['error_rate'] > ERROR_RATE_TOLERANCE:
+            regressions.append(f"{endpoint} error rate {before['error_rate']:.2%} -> {current['error_rate']:.2%}")
+    return rows, regressions
+
+
+def print_report(report):
+    sessions = report['sessions']
+    print(f"\n{report['label']}: {sessions['completed']} sessions completed, {sessions['failed']} failed "
+          f"in {report['duration']:.1f}s ({sessions['per_second']:.2f} sessions/s)")
+    print(f"{'endpoint':<14}{'reqs':>6}{'err%':>7}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for endpoint, e in report['endpoints'].items():
+        print(f"{endpoint:<14}{e['requests']:>6}{e['error_rate'] * 100:>7.1f}{e['throughput']:>8.2f}"
+              f"{e['p50']:>8.3f}{e['p95']:>8.3f}{e['p99']:>8.3f}{e['max']:>8.3f}")
+    if report.get('resources'):
+        r = report['resources']
+        print(f"app: {r['cpu_seconds']}s CPU ({r['cpu_percent']}%), peak RSS {r['peak_rss_mb']} MB, "
+              f"peak threads {r['peak_threads']}, peak open files {r['peak_open_files']}")
+    if report.get('model_server'):
+        m = report['model_server']
+        print(f"model: {m['calls']} calls, {m['throttled']} throttled, {m['errors']} errors, peak {m['peak_in_flight']} in flight")
+    for failure in report.get('failures', [])[:5]:
+        print(f"  {failure}")
+
+
+def print_comparison(rows, regressions, baseline_label):
+    print(f"\nChange against {baseline_label} (relative; error rate absolute):")
+    print(f"{'endpoint':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'err':>9}")
+    for row in rows:
+        cells = ''.join(f"{row[key]:>+9.1%}" if key in row else f"{'-':>9}" for key in ('p50', 'p95', 'p99', 'throughput'))
+        print(f"{row['endpoint']:<14}{cells}{row['error_rate']:>+9.2%}")
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+    else:
+        print("No regressions.")
+
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--env expects KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the question paper app end to end")
+    parser.add_argument('--label', default=None, help="name of this run in the report")
+    parser.add_argument('--users', type=int, default=4, help="concurrent virtual users")
+    parser.add_argument('--sessions', type=int, default=20, help="total sessions to run")
+    parser.add_argument('--duration', type=float, default=None, help="run for this many seconds instead of --sessions")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="seconds over which users start")
+    parser.add_argument('--think-time', type=float, default=0.0, help="seconds a user waits between steps")
+    parser.add_argument('--file', default=DEFAULT_FILE, help="course file each session uploads")
+    parser.add_argument('--same-content', action='store_true', help="upload identical content in every session")
+    parser.add_argument('--questions', type=int, default=10, help="questions per generated paper")
+    parser.add_argument('--formats', default=','.join(EXPORT_FORMATS), help="export formats per session")
+    parser.add_argument('--request-timeout', type=float, default=300)
+    parser.add_argument('--target', default=None, help="URL of an already running app (skips starting one)")
+    parser.add_argument('--pid', type=int, default=None, help="with --target: process to report resource use for")
+    parser.add_argument('--app-cmd', default=DEFAULT_APP_CMD, help="command starting the app; {port} and {python} are filled in")
+    parser.add_argument('--env', action='append', default=[], help="KEY=VALUE setting for the app (repeatable)")
+    parser.add_argument('--keep-workdir', action='store_true', help="keep the app's working directory and log")
+    parser.add_argument('--model-url', default=None, help="existing model backend instead of the built-in fake server")
+    parser.add_argument('--model-latency', type=float, default=1.0, help="fake model: mean seconds per call")
+    parser.add_argument('--model-jitter', type=float, default=0.5, help="fake model: latency spread as a fraction")
+    parser.add_argument('--model-error-rate', type=float, default=0.0, help="fake model: share of calls answered 503")
+    parser.add_argument('--model-max-concurrency', type=int, default=0, help="fake model: calls in flight before 429")
+    parser.add_argument('--output', default=None, help="write the JSON report here")
+    parser.add_argument('--compare', default=None, help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="relative latency/throughput change counted as a regression")
+    args = parser.parse_args(argv)
+    env_overrides = parse_env(args.env)
+
+    with open(args.file, 'rb') as f:
+        template = f.read()
+
+    fake = None
+    model_url = args.model_url
+    if not args.target and not model_url:
+        fake = FakeModelServer(latency=args.model_latency, jitter=args.model_jitter,
+                               error_rate=args.model_error_rate, max_concurrency=args.model_max_concurrency).start()
+        model_url = fake.url
+
+    process = None
+    workdir = None
+    if args.target:
+        base_url = args.target
+        monitor = ProcessMonitor(args.pid) if args.pid else None
+    else:
+        workdir = tempfile.mkdtemp(prefix='loadtest_')
+        port = free_port()
+        process = start_app(args.app_cmd, port, model_url, env_overrides, workdir)
+        base_url = f'http://127.0.0.1:{port}'
+        monitor = ProcessMonitor(process.pid)
+        print(f"App running at {base_url} (working directory {workdir})")
+
+    test = LoadTest(
+        base_url, template, os.path.basename(args.file), users=args.users, sessions=args.sessions,
+        duration=args.duration, formats=[f for f in args.formats.split(',') if f], num_questions=args.questions,
+        think_time=args.think_time, ramp_up=args.ramp_up, unique_content=not args.same_content,
+        request_timeout=args.request_timeout
+    )
+    if monitor:
+        monitor.start()
+    try:
+        elapsed = test.run()
+    finally:
+        if monitor:
+            monitor.stop()
+        if process:
+            stop_app(process)
+            if not args.keep_workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        if fake:
+            fake.stop()
+
+    report = {
+        'label': args.label or datetime.now().strftime('run-%Y%m%d-%H%M%S'),
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'users': args.users, 'sessions': args.sessions, 'duration': args.duration,
+            'questions': args.questions, 'formats': test.formats, 'file': os.path.basename(args.file),
+            'unique_content': test.unique_content, 'app_cmd': None if args.target else args.app_cmd,
+            'env': env_overrides, 'model_latency': args.model_latency, 'model_error_rate': args.model_error_rate,
+        },
+        'duration': round(elapsed, 3),
+        'sessions': {**test.session_results, 'per_second': round(test.session_results['completed'] / elapsed, 3)},
+        'endpoints': summarize_samples(test.samples, elapsed),
+        'resources': monitor.report() if monitor else None,
+        'model_server': fake.stats() if fake else None,
+        'failures': test.failures,
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare_reports(report, baseline, args.tolerance)
+        print_comparison(rows, regressions, baseline.get('label', args.compare))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
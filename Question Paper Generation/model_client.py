@@ -0,0 +1,326 @@
+"""Shared entry point for model calls.
+
+Every request to the Gemini API goes through ModelClient.generate(), which
+adds what a bare model.generate_content() call lacks:
+
+- an adaptive concurrency limit (additive increase on success,
+  multiplicative decrease when the API throttles us),
+- retries with jittered exponential backoff on 429/5xx and timeouts,
+- a deadline per call, covering queueing, attempts and backoff,
+- a priority queue so interactive requests go before batch work,
+- coalescing of identical prompts already in flight into one upstream call.
+
+generate() can be given another model object for a single call, such as
+one bound to cached content (see context_cache.py); it shares the same
+limits and retries.
+"""
+import hashlib
+import heapq
+import inspect
+import itertools
+import random
+import threading
+import time
+
+import requests
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+THROTTLE_STATUS_CODES = {429, 503}
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+}
+
+
+class ModelCallError(Exception):
+    """Raised when a model call fails for good (retries exhausted or deadline passed)."""
+
+
+def accepts_request_options(model):
+    """True if model.generate_content() takes request_options (for per-call timeouts)."""
+    try:
+        return 'request_options' in inspect.signature(model.generate_content).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _status_code(exc):
+    """Best-effort HTTP status code of an API exception, or None."""
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttle_error(exc):
+    """Return True if exc means the API wants us to slow down."""
+    return _status_code(exc) in THROTTLE_STATUS_CODES or type(exc).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+
+def is_retryable_error(exc):
+    """Return True if the call that raised exc is worth retrying."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES or type(exc).__name__ in RETRYABLE_ERROR_NAMES
+
+
+# --- Concurrency Limiter ---
+class AdaptiveLimiter:
+    """Priority-ordered concurrency limit adjusted with AIMD.
+
+    The limit grows by roughly one slot per limit-many successful calls and
+    halves on a throttling signal (at most once per cooldown period, so one
+    burst of 429s counts as a single signal).
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, decrease_factor=0.5, cooldown=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Wait for a slot. Returns False if the deadline passes first."""
+        with self._cond:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while self._waiting[0] != ticket or self.in_flight >= int(self.limit):
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        return False
+                    self._cond.wait(timeout)
+                heapq.heappop(self._waiting)
+                self.in_flight += 1
+                return True
+            finally:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                # The head of the queue may have changed either way
+                self._cond.notify_all()
+
+    def release(self, throttled=False):
+        """Free a slot and adjust the limit from the call's outcome."""
+        with self._cond:
+            # Only grow the limit when it was actually the bottleneck
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif saturated:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """Spaces calls at least 60/per_minute seconds apart, across all threads.
+
+    Each caller reserves the next free start time, so waiting callers are
+    released in turn rather than in a burst.
+    """
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.interval = 60.0 / per_minute
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Wait for this call's turn. Returns False (without waiting) if it falls after the deadline."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            if deadline is not None and start > deadline:
+                return False
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+        return True
+
+
+class _InFlightCall:
+    """Result slot shared by callers coalesced onto one upstream call."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+# --- Client ---
+class ModelClient:
+    """Wraps a Gemini GenerativeModel with limits, retries and coalescing."""
+
+    def __init__(self, model, max_concurrency=16, initial_concurrency=4, max_retries=4,
+                 base_delay=1.0, max_delay=30.0, timeout=120.0, rate_limit=0):
+        self.model = model
+        self.limiter = AdaptiveLimiter(initial=min(initial_concurrency, max_concurrency), maximum=max_concurrency)
+        # Optional cap on upstream calls per minute (retries included)
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'upstream_calls': 0, 'coalesced': 0, 'retries': 0, 'throttled': 0, 'failures': 0}
+        self._supports_request_options = accepts_request_options(model)
+
+    def stats(self):
+        """Return call counters and the current concurrency limit."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['concurrency_limit'] = int(self.limiter.limit)
+        stats['in_flight'] = self.limiter.in_flight
+        return stats
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def generate(self, prompt, priority=PRIORITY_INTERACTIVE, timeout=None, model=None):
+        """Generate content for prompt and return the model response.
+
+        timeout is the deadline in seconds for the whole call, including
+        time spent queued and backing off. Identical prompts already in
+        flight share that call's result. model replaces the client's model
+        for this call.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        if model is not None:
+            key = f"{id(model)}:{key}"
+        self._count('calls')
+
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _InFlightCall()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            if not call.done.wait(max(deadline - time.monotonic(), 0)):
+                raise ModelCallError("Model call deadline exceeded while waiting for an identical request")
+            if call.error is not None:
+                raise call.error
+            return call.response
+
+        try:
+            call.response = self._call_with_retries(prompt, priority, deadline, model)
+            return call.response
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def _call_with_retries(self, prompt, priority, deadline, model=None):
+        if model is None:
+            model, supports_request_options = self.model, self._supports_request_options
+        else:
+            supports_request_options = accepts_request_options(model)
+        attempt = 0
+        while True:
+            if not self.limiter.acquire(priority, deadline):
+                self._count('failures')
+                raise ModelCallError("Model call deadline exceeded while queued")
+            # Slots are handed out by priority first, then spaced by the rate limit
+            if self.rate_limiter is not None and not self.rate_limiter.acquire(deadline):
+                self.limiter.release()
+                self._count('failures')
+                raise ModelCallError("Model call deadline exceeded waiting for the rate limit")
+
+            throttled = False
+            try:
+                self._count('upstream_calls')
+                if supports_request_options:
+                    remaining = max(deadline - time.monotonic(), 1.0)
+                    return model.generate_content(prompt, request_options={'timeout': remaining})
+                return model.generate_content(prompt)
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                if throttled:
+                    self._count('throttled')
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                error = e
+            finally:
+                self.limiter.release(throttled=throttled)
+
+            # Full jitter: sleep a random time up to the exponential cap
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                self._count('failures')
+                raise ModelCallError(f"Model call deadline exceeded after {attempt + 1} attempts: {error}")
+            print(f"Model call failed ({error}); retrying in {delay:.1f}s")
+            self._count('retries')
+            time.sleep(delay)
+            attempt += 1
+
+
+
+# --- HTTP Backend ---
+class HttpModelError(Exception):
+    """Non-2xx answer from an HTTP model backend; code is the HTTP status."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+class _HttpResponse:
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class HttpModel:
+    """Stand-in for a Gemini GenerativeModel that talks to a plain HTTP endpoint.
+
+    Posts {"prompt": ...} to url and expects {"text": ...} back, which is
+    what fake_model_server.py serves.  Errors are raised in a form
+    ModelClient recognises, so throttling and retries behave as they do
+    against the real API.  With cached_content set, the name of content
+    cached on the server is sent along and the server prepends it.
+    """
+
+    def __init__(self, url, cached_content=None):
+        self.url = url
+        self.cached_content = cached_content
+        self._session = requests.Session()
+
+    def generate_content(self, prompt, request_options=None):
+        timeout = (request_options or {}).get('timeout')
+        body = {'prompt': prompt}
+        if self.cached_content:
+            body['cached_content'] = self.cached_content
+        try:
+            response = self._session.post(self.url, json=body, timeout=timeout)
+        except requests.Timeout as e:
+            raise TimeoutError(str(e))
+        except requests.ConnectionError as e:
+            raise ConnectionError(str(e))
+        if response.status_code >= 300:
+            raise HttpModelError(response.status_code, response.text[:200])
+        return _HttpResponse(response.json()['text'])
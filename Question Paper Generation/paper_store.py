@@ -0,0 +1,272 @@
+"""Server-side storage of generated papers and question banks.
+
+A generated paper is saved under a paper id and changed afterwards with
+small edit lists (reorder, delete, replace or add a question), so the
+browser only has to send the id and the change instead of posting the
+whole paper back for every export or regeneration.
+
+Every accepted edit list bumps the paper's version.  The paper keeps a
+base set of questions and the log of edits since, so recent versions can
+be rebuilt, and an edit against an out-of-date version is refused rather
+than silently overwriting someone else's change.  Only the last
+keep_versions edits are logged: older ones are folded into the base, so
+papers that are regenerated over and over do not grow without bound.
+"""
+import contextlib
+import copy
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to an in-process lock only
+    fcntl = None
+
+_PAPER_ID_RE = re.compile(r'^p_[0-9a-f]{12}$')
+
+EDIT_OPS = ('reorder', 'delete', 'replace', 'add', 'set')
+
+
+class PaperConflict(Exception):
+    """Raised when edits are based on a version that is no longer current."""
+
+
+class PaperEditError(ValueError):
+    """Raised when an edit does not make sense for the paper."""
+
+
+def is_paper_id(value):
+    return isinstance(value, str) and bool(_PAPER_ID_RE.match(value))
+
+
+def parse_version(value):
+    """A version number from client input (None stays None); PaperEditError if it is not one."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise PaperEditError(f"Invalid version: {value!r}")
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        raise PaperEditError(f"Invalid version: {value!r}")
+    if version < 1 or (isinstance(value, float) and version != value):
+        raise PaperEditError(f"Invalid version: {value!r}")
+    return version
+
+
+def _index_of(questions, question_id):
+    for i, q in enumerate(questions):
+        if str(q.get('id')) == str(question_id):
+            return i
+    raise PaperEditError(f"Question not found: {question_id}")
+
+
+def apply_edit(questions, edit):
+    """Apply one edit to a list of questions and return the new list.
+
+    Edits:
+      {"op": "reorder", "order": [id, ...]}        every id, in the new order
+      {"op": "delete", "id": id}
+      {"op": "replace", "id": id, "question": {...}}
+      {"op": "add", "question": {...}, "index": n}  index is optional (append)
+      {"op": "set", "questions": [...]}            replace the whole paper
+    """
+    if not isinstance(edit, dict) or edit.get('op') not in EDIT_OPS:
+        raise PaperEditError(f"Unknown edit: {edit!r}")
+    op = edit['op']
+
+    if op == 'reorder':
+        order = [str(question_id) for question_id in edit.get('order') or []]
+        by_id = {str(q.get('id')): q for q in questions}
+        if sorted(order) != sorted(by_id):
+            raise PaperEditError("reorder must list every question id exactly once")
+        return [by_id[question_id] for question_id in order]
+
+    if op == 'delete':
+        index = _index_of(questions, edit.get('id'))
+        return questions[:index] + questions[index + 1:]
+
+    if op == 'set':
+        new_questions = edit.get('questions')
+        if not isinstance(new_questions, list) or not all(isinstance(q, dict) for q in new_questions):
+            raise PaperEditError("set needs a list of questions")
+        return list(new_questions)
+
+    question = edit.get('question')
+    if not isinstance(question, dict):
+        raise PaperEditError(f"{op} needs a question object")
+
+    if op == 'replace':
+        index = _index_of(questions, edit.get('id'))
+        return questions[:index] + [question] + questions[index + 1:]
+
+    # add
+    if any(str(q.get('id')) == str(question.get('id')) for q in questions):
+        raise PaperEditError(f"Question id already in paper: {question.get('id')}")
+    index = edit.get('index')
+    index = len(questions) if not isinstance(index, int) else max(0, min(index, len(questions)))
+    return questions[:index] + [question] + questions[index:]
+
+
+class PaperStore:
+    """Papers and question banks as JSON files, shared by all workers."""
+
+    def __init__(self, folder, keep_versions=20):
+        self.folder = folder
+        self.keep_versions = keep_versions
+        self.papers_folder = os.path.join(folder, 'papers')
+        self.banks_folder = os.path.join(folder, 'banks')
+        self.lock_path = os.path.join(folder, 'papers.lock')
+        self._lock = threading.Lock()
+        os.makedirs(self.papers_folder, exist_ok=True)
+        os.makedirs(self.banks_folder, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize writers within this process and, where fcntl exists, across workers."""
+        with self._lock:
+            with open(self.lock_path, 'a') as handle:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _paper_path(self, paper_id):
+        return os.path.join(self.papers_folder, f"{paper_id}.json")
+
+    def _bank_path(self, name):
+        return os.path.join(self.banks_folder, f"{secure_filename(name) or 'default'}.json")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    # --- Papers ---
+    def create(self, questions, meta=None):
+        """Save a new paper at version 1 and return it."""
+        now = time.time()
+        record = {
+            'paper_id': f"p_{uuid.uuid4().hex[:12]}",
+            'version': 1,
+            'created': now,
+            'updated': now,
+            'meta': meta or {},
+            'questions': questions,
+            'base_version': 1,
+            'base_questions': questions,
+            'history': [],
+        }
+        with self._locked():
+            self._write(self._paper_path(record['paper_id']), record)
+        return self._public(record)
+
+    def get(self, paper_id, version=None):
+        """Return the paper (optionally as of a retained earlier version), or None.
+
+        Raises PaperEditError if version is not a version number.
+        """
+        version = parse_version(version)
+        if not is_paper_id(paper_id):
+            return None
+        record = self._read(self._paper_path(paper_id))
+        if record is None:
+            return None
+        if version is None or version == record['version']:
+            return self._public(record)
+
+        if not record.get('base_version', 1) <= version <= record['version']:
+            return None
+        questions = copy.deepcopy(record['base_questions'])
+        for entry in record['history']:
+            if entry['version'] > version:
+                break
+            for edit in entry['edits']:
+                questions = apply_edit(questions, edit)
+        return self._public({**record, 'version': version, 'questions': questions})
+
+    def update(self, paper_id, edits, base_version=None):
+        """Apply a list of edits as one new version and return the updated paper.
+
+        Raises PaperConflict if base_version is given and is not the current
+        version, and PaperEditError if base_version or any edit is invalid
+        (nothing is saved).
+        """
+        base_version = parse_version(base_version)
+        if not isinstance(edits, list) or not edits:
+            raise PaperEditError("No edits given")
+        with self._locked():
+            record = self._read(self._paper_path(paper_id)) if is_paper_id(paper_id) else None
+            if record is None:
+                return None
+            if base_version is not None and base_version != record['version']:
+                raise PaperConflict(
+                    f"Paper is at version {record['version']}, edits were made against version {base_version}"
+                )
+
+            questions = record['questions']
+            for edit in edits:
+                questions = apply_edit(questions, edit)
+
+            record['version'] += 1
+            record['updated'] = time.time()
+            record['questions'] = questions
+            record['history'].append({'version': record['version'], 'edits': edits, 'at': record['updated']})
+            self._fold_history(record)
+            self._write(self._paper_path(paper_id), record)
+        return self._public(record)
+
+    def _fold_history(self, record):
+        """Apply edits beyond the last keep_versions to the base questions and drop them from the log."""
+        excess = len(record['history']) - self.keep_versions
+        if excess <= 0:
+            return
+        questions = record['base_questions']
+        for entry in record['history'][:excess]:
+            for edit in entry['edits']:
+                questions = apply_edit(questions, edit)
+        record['base_questions'] = questions
+        record['base_version'] = record['history'][excess - 1]['version']
+        record['history'] = record['history'][excess:]
+
+    @staticmethod
+    def _public(record):
+        """Paper fields returned to callers (without the base snapshot and edit log)."""
+        return {
+            'paper_id': record['paper_id'],
+            'version': record['version'],
+            'created': record['created'],
+            'updated': record['updated'],
+            'meta': record['meta'],
+            'questions': record['questions'],
+        }
+
+    # --- Question Banks ---
+    def put_bank(self, name, questions):
+        """Save the question bank parsed from an upload."""
+        with self._locked():
+            self._write(self._bank_path(name), {'name': name, 'questions': questions, 'updated': time.time()})
+
+    def get_bank(self, name):
+        """Return the question bank saved for an upload ([] if none)."""
+        bank = self._read(self._bank_path(name))
+        return bank['questions'] if bank else []
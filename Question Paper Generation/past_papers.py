@@ -0,0 +1,497 @@
+"""Deterministic segmentation of past exam papers into question bank entries.
+
+Past papers already contain questions, so they do not need a model call to
+be useful.  parse_past_paper() recognises question numbering (including OCR
+variants like 'Ql' for 'Q1'), section headers ('SECTION-B'), sub-parts such
+as '(a)' or 'b)', and mark allocations like '[1x5]', '[2.5+2.5]' or
+'[ 2.5 Marks ]', and turns each part into a bank question.  Whatever cannot
+be read as a question is returned as leftover text for the model.
+
+Scanned papers are noisy: labels go missing or drift into a column of their
+own, and page footers land mid-question.  Question numbers therefore have
+to increase, marks have to be whole or half marks, and a section whose
+labels were lost is split into questions sentence by sentence.
+"""
+import re
+import uuid
+from collections import Counter
+
+from text_compaction import strip_repeated_segments
+
+# A document needs this many paper signals to be treated as a past paper
+MIN_PAPER_SIGNALS = 2
+# Marks above this for one part are OCR errors ('[12.5 Marks]' for '[2.5 Marks]')
+MAX_PART_MARKS = 20
+# Largest jump in question numbers accepted after a section header
+MAX_SECTION_SKIP = 5
+
+_PAPER_SIGNALS = [
+    re.compile(r'examination', re.IGNORECASE),
+    re.compile(r'full\s+marks?\s*:?\s*\d+', re.IGNORECASE),
+    re.compile(r'time\s*:\s*\d', re.IGNORECASE),
+    re.compile(r'answer\s+(?:any|all)\b', re.IGNORECASE),
+    re.compile(r'figures\s+in\s+the\s+margin', re.IGNORECASE),
+]
+
+# 'Q1', 'Q.2', 'Ql' (OCR for Q1), 'QO' ... and '3.' / '3)' followed by a question
+_QUESTION_MARKER_RE = re.compile(
+    r'(?:(?<=\s)|^)(?:Q\s?\.?\s?([0-9lIO]{1,2})\b\s*[.:)]?|(\d{1,2})\s?[.)](?=\s+[(\[A-Z]))'
+)
+# '(a)', 'a)' or 'a. Explain'
+_PART_MARKER_RE = re.compile(r'(?:(?<=\s)|^)(?:\(([a-j])\)|([a-j])\)|([a-j])\.(?=\s+[A-Z]))')
+# '[4]', '{4}', '[1x5]', '[2x 10]', '(2.5)', '[2.5+2.5]', '[ 2.5 Marks ]', '[1 Mark X 5 ]'
+_MARKS_RE = re.compile(
+    r'[\[{(]\s*(\d{1,2}(?:\.\d+)?(?:\s*(?:marks?)?\s*[+xX×]\s*\d{1,2}(?:\.\d+)?)*)\s*(?:marks?)?\s*[\]})]',
+    re.IGNORECASE
+)
+# 'SECTION-B', 'Section: C', 'PART A'; the instructions' 'Section A is compulsory' is not a header
+_SECTION_RE = re.compile(r'\b(?:SECTION|PART|Section|Part)\s*[-–:]\s*[A-E]\b|\b(?:SECTION|PART)\s+[A-E]\b')
+# Page footers such as 'KIIT-DU/2019/SOT/Spring End Semester Examination-2019 (1)'
+_FOOTER_RE = re.compile(
+    r'(?:[A-Z][\w\-]*\s+)?\S*/\S*\s+(?:\S+\s+){0,4}?examination[\s\-]*\d{4}(?:\s*\(\d+\))?',
+    re.IGNORECASE
+)
+# Three or more labels with nothing between them ('(b) (6) (b)'): a label column that lost its text
+_LABEL_RUN_RE = re.compile(r'(?:(?<=\s)|^)(?:\(?[a-j0-9@]{1,2}\)\s+){2,}\(?[a-j0-9@]{1,2}\)(?=\s|$)')
+_EXAM_TITLE_RE = re.compile(
+    r'\b((?:(?:spring|autumn|fall|summer|winter|supplementary)\s+)?(?:(?:mid|end)[\s\-]*semester\s+)?'
+    r'examination[\s\-]*\d{4})',
+    re.IGNORECASE
+)
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.?!])\s+')
+# Short scraps after the last sentence ('... fault. ns', '... system? 4.') are scanning noise
+_JUNK_TAIL_RE = re.compile(r'(?<=[.?!])(?:\s+[^\s?]{1,3})+$')
+# A sentence ending in a list label ('... the following: i.') continues in the next one
+_LIST_ITEM_END_RE = re.compile(r'(?:(?:^|\s)(?:[ivx]{1,4}|[a-e])\.|:)$')
+_INSTRUCTION_RE = re.compile(r'\b(?:answer\s+(?:the|all|any)|compulsory|candidates\s+are)\b', re.IGNORECASE)
+
+_OCR_DIGITS = str.maketrans({'l': '1', 'I': '1', 'O': '0'})
+
+_QUESTION_WORDS = {
+    'what', 'why', 'how', 'when', 'where', 'which', 'who', 'whom', 'whose', 'explain', 'describe',
+    'define', 'differentiate', 'distinguish', 'compare', 'contrast', 'discuss', 'write', 'give',
+    'list', 'state', 'analyze', 'analyse', 'justify', 'construct', 'consider', 'show', 'suppose',
+    'design', 'calculate', 'derive', 'illustrate', 'mention', 'name', 'draw', 'prove', 'find',
+    'evaluate', 'identify', 'elaborate', 'outline', 'briefly', 'enumerate', 'demonstrate', 'let',
+    'using', 'can', 'does', 'is', 'are', 'do', 'if', 'assume', 'determine', 'solve', 'implement',
+}
+
+_STOP_WORDS = {
+    'the', 'a', 'an', 'of', 'in', 'on', 'for', 'to', 'and', 'or', 'with', 'by', 'is', 'are', 'be',
+    'what', 'why', 'how', 'which', 'when', 'where', 'who', 'explain', 'describe', 'define', 'write',
+    'give', 'list', 'state', 'discuss', 'compare', 'differentiate', 'between', 'its', 'their', 'this',
+    'that', 'these', 'those', 'any', 'all', 'each', 'example', 'examples', 'suitable', 'following',
+    'different', 'various', 'used', 'using', 'do', 'does', 'can', 'you', 'mean', 'brief', 'briefly',
+    'short', 'notes', 'note', 'two', 'three', 'four', 'five', 'system', 'systems', 'show', 'consider',
+    'mention', 'justify', 'answer', 'your', 'it', 'as', 'at', 'from', 'not', 'if', 'will', 'would',
+    'should', 'has', 'have', 'was', 'were', 'there', 'they', 'them', 'such', 'also', 'details',
+    'examination', 'semester', 'spring', 'autumn', 'end', 'mid', 'marks', 'mark', 'section', 'question',
+    'questions', 'time', 'hours', 'full', 'following', 'figure', 'above', 'respectively',
+}
+
+# Stems that set up a scenario for the parts below them
+_CONTEXT_STARTS = ('consider', 'suppose', 'let', 'given', 'assume', 'in a', 'in the', 'a distributed', 'the following')
+# Question words that open a statement rather than ask ('When a binary is released, it is ...')
+_CONDITIONAL_WORDS = {'if', 'when', 'where', 'let', 'consider', 'suppose', 'assume', 'using', 'given'}
+
+
+def is_past_paper(text):
+    """Return True if text looks like an exam paper rather than course material."""
+    head = text[:3000]
+    return sum(1 for signal in _PAPER_SIGNALS if signal.search(head)) >= MIN_PAPER_SIGNALS
+
+
+# --- Marks ---
+def _parse_marks(token):
+    """Turn the inside of a marks token into a list of per-part marks.
+
+    '1x5' -> [1, 1, 1, 1, 1], '2.5+2.5' -> [2.5, 2.5], '4' -> [4].  Values
+    that cannot be marks ('2.54' for a misread '2.5+') are dropped.
+    """
+    token = re.sub(r'marks?', '', token, flags=re.IGNORECASE).replace('×', 'x').replace('X', 'x')
+    try:
+        if 'x' in token:
+            per_part, count = (float(v) for v in token.split('x', 1))
+            values = [per_part] * min(int(count), 20)
+        else:
+            values = [float(v) for v in token.split('+')]
+    except ValueError:
+        return []
+    return [v for v in values if _plausible_marks(v)]
+
+
+def _plausible_marks(value):
+    """Return True for whole or half marks up to MAX_PART_MARKS."""
+    return 0 < value <= MAX_PART_MARKS and float(value * 2).is_integer()
+
+
+def _find_marks(text):
+    """Return (text without marks tokens, list of per-part marks found in it)."""
+    marks = []
+
+    def collect(match):
+        raw = match.group(0)
+        # '(2)' is more often a page number than a mark; accept () only for '2.5', '1x5' ...
+        if raw.startswith('(') and re.fullmatch(r'\d+', match.group(1).strip()):
+            return raw
+        marks.extend(_parse_marks(match.group(1)))
+        return ' '
+    return _MARKS_RE.sub(collect, text), marks
+
+
+def _number(value):
+    return int(value) if value == int(value) else value
+
+
+# --- Segmentation ---
+def _clean_noise(text):
+    """Drop page footers and runs of labels that lost their text."""
+    return _LABEL_RUN_RE.sub(' ', _FOOTER_RE.sub(' ', text))
+
+
+def _opens_with_parts(text):
+    """Return True if text starts with part '(a)', with at most instructions before it."""
+    match = _PART_MARKER_RE.search(text)
+    if not match or next(g for g in match.groups() if g) != 'a':
+        return False
+    return not looks_like_question(_find_marks(text[:match.start()])[0])
+
+
+def _question_spans(text):
+    """Find numbered questions. Returns a list of (number, start, body_start, end) spans.
+
+    Numbers must increase (one missing number is tolerated, since OCR
+    regularly eats a label), which filters out stray digits.  A section
+    header ends the question before it, and after one a larger jump is
+    accepted, as the labels of a whole section can be lost.  The text
+    between a header and the next question is a span with number None,
+    unless it opens with '(a)': then it is the next question, unlabelled.
+    """
+    events = sorted(
+        [(m.start(), m.end(), m) for m in _QUESTION_MARKER_RE.finditer(text)] +
+        [(m.start(), m.end(), None) for m in _SECTION_RE.finditer(text)],
+        key=lambda event: event[0]
+    )
+    starts = []
+    expected = 1
+    after_section = False
+    for i, (start, end, match) in enumerate(events):
+        if match is None:
+            following = text[end:events[i + 1][0] if i + 1 < len(events) else len(text)]
+            if _opens_with_parts(following):
+                starts.append((expected, start, end))
+                expected += 1
+                after_section = False
+            else:
+                starts.append((None, start, end))
+                after_section = True
+            continue
+
+        raw = match.group(1) or match.group(2)
+        try:
+            number = int(raw.translate(_OCR_DIGITS))
+        except ValueError:
+            continue
+        if expected <= number <= expected + (MAX_SECTION_SKIP if after_section else 1):
+            starts.append((number, start, end))
+            expected = number + 1
+            after_section = False
+
+    spans = []
+    for i, (number, start, body_start) in enumerate(starts):
+        end = starts[i + 1][1] if i + 1 < len(starts) else len(text)
+        spans.append((number, start, body_start, end))
+    return spans
+
+
+def _split_parts(body):
+    """Split a question body into (stem, [(letter, text), ...]) on sequential sub-part labels."""
+    parts = []
+    expected = 'a'
+    for match in _PART_MARKER_RE.finditer(body):
+        letter = next(g for g in match.groups() if g)
+        # Accept the next letter in sequence, or 'a' restarting a new group
+        if letter == expected or (letter == 'a' and parts):
+            parts.append((letter, match.start(), match.end()))
+            expected = chr(ord(letter) + 1)
+
+    if not parts:
+        return body, []
+    stem = body[:parts[0][1]]
+    texts = []
+    for i, (letter, _, text_start) in enumerate(parts):
+        end = parts[i + 1][1] if i + 1 < len(parts) else len(body)
+        texts.append((letter, body[text_start:end]))
+    return stem, texts
+
+
+def _split_by_marks(text):
+    """Fallback when numbering is unusable: every marks token starts a new question."""
+    positions = [m.start() for m in _MARKS_RE.finditer(text) if not m.group(0).startswith('(')]
+    if len(positions) < 2:
+        return []
+    spans = []
+    for i, start in enumerate(positions):
+        end = positions[i + 1] if i + 1 < len(positions) else len(text)
+        spans.append((i + 1, start, start, end))
+    return spans
+
+
+def _split_unlabelled(text):
+    """Group the sentences of a section whose question labels were lost into questions.
+
+    Once a group has asked something, a sentence opening a new question or
+    scenario starts the next group; short sentences and list items
+    ('following: i. ...') stay with the sentence before them.
+    """
+    groups = []
+    asks = False
+    for sentence in _SENTENCE_SPLIT_RE.split(text.strip()):
+        words = re.findall(r"[A-Za-z']+", sentence.lower())
+        opens = bool(words) and (
+            words[0] in _QUESTION_WORDS or words[0] in ('a', 'an') or sentence.lower().startswith(_CONTEXT_STARTS)
+        )
+        continues = len(words) < 6 or (groups and _LIST_ITEM_END_RE.search(groups[-1]))
+        if groups and not (asks and opens and not continues):
+            groups[-1] = f"{groups[-1]} {sentence}"
+        elif sentence:
+            groups.append(sentence)
+            asks = False
+        asks = asks or '?' in sentence or bool(words and words[0] in _QUESTION_WORDS and words[0] not in _CONDITIONAL_WORDS)
+    return groups
+
+
+def _split_sentences(text, count):
+    """Split text into count question sentences, or return None if that is not possible."""
+    sentences = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text.strip()):
+        # 'Explain.' belongs to the sentence before it
+        if sentences and len(sentence.split()) < 3:
+            sentences[-1] = f"{sentences[-1]} {sentence}"
+        elif sentence:
+            sentences.append(sentence)
+    return sentences if len(sentences) == count else None
+
+
+def _clean(text):
+    return ' '.join(text.split()).strip(' ,;:-')
+
+
+def _trim(text):
+    """Clean up question text, dropping scraps of noise after its last sentence."""
+    return _JUNK_TAIL_RE.sub('', _clean(text))
+
+
+def looks_like_question(text):
+    """Return True if text reads like an exam question."""
+    words = re.findall(r"[A-Za-z']+", text.lower())
+    if len(words) < 3:
+        return False
+    if '?' in text:
+        return True
+    return any(word in _QUESTION_WORDS for word in words[:6])
+
+
+def _is_instruction(text):
+    """Return True for paper headers and instructions ('Answer any four questions ...')."""
+    return bool(_INSTRUCTION_RE.search(text)) or any(signal.search(text) for signal in _PAPER_SIGNALS)
+
+
+def _infer_type(marks):
+    if marks is None or marks <= 2.5:
+        return 'Short Answer'
+    return 'Essay'
+
+
+def _infer_difficulty(marks):
+    if marks is None:
+        return 'Medium'
+    if marks <= 1:
+        return 'Easy'
+    if marks <= 3:
+        return 'Medium'
+    return 'Hard'
+
+
+def _bank_entry(text, marks, number, part, source, exam):
+    label = f"Q{number}{f'({part})' if part else ''}" if number is not None else "(number unreadable)"
+    where = ', '.join(v for v in (exam, source) if v)
+    return {
+        "id": f"pp_{str(uuid.uuid4())[:8]}",
+        "text": text,
+        "correct_answer": "",
+        "explanation": f"Past paper question {label}" + (f" from {where}" if where else ""),
+        "topic": "",
+        "difficulty": _infer_difficulty(marks),
+        "type": _infer_type(marks),
+        "marks": _number(marks) if marks is not None else None,
+        "question_number": number,
+        "part": part,
+        "source": source,
+    }
+
+
+def _exam_title(header):
+    match = _EXAM_TITLE_RE.search(header)
+    return _clean(match.group(1)).title() if match else None
+
+
+def _unlabelled_questions(body, source, exam, questions, leftovers):
+    """Add the questions of a section without usable labels, split sentence by sentence."""
+    body, marks = _find_marks(body)
+    # The section's marks column ('[5] [5] [5]') only says something when it is uniform
+    section_marks = marks[0] if marks and len(set(marks)) == 1 else None
+    for text in _split_unlabelled(_clean(body)):
+        text = _trim(text)
+        if _is_instruction(text):
+            continue
+        # A group may open with its scenario ('A process with timestamp 50 ... Compare ...')
+        if any(looks_like_question(sentence) for sentence in _SENTENCE_SPLIT_RE.split(text)):
+            questions.append(_bank_entry(text, section_marks, None, None, source, exam))
+        elif text:
+            leftovers.append(text)
+
+
+def parse_past_paper(text, source=None):
+    """Split the text of one past paper into bank questions.
+
+    Returns a dict with 'is_past_paper', 'exam', 'questions' (bank entries)
+    and 'leftover' (text that could not be read as questions and should go
+    to the model).
+    """
+    if not is_past_paper(text):
+        return {"is_past_paper": False, "exam": None, "questions": [], "leftover": text}
+
+    # Page headers/footers repeat on every page and would end up inside questions
+    text = ' '.join(strip_repeated_segments(text).split())
+    exam = _exam_title(text[:3000])
+    # Footers that differ per page ('... Examination-2019 (2)') are not caught as repeats
+    text = ' '.join(_clean_noise(text).split())
+
+    spans = _question_spans(text)
+    # A column of margin labels ('Ql. Q2. Q3 ...') leaves the questions themselves empty
+    numbered = [span for span in spans if span[0] is not None]
+    if sum(1 for _, _, body_start, end in numbered if looks_like_question(text[body_start:end])) < 2:
+        spans = _split_by_marks(text)
+
+    questions = []
+    leftovers = []
+
+    for k, (number, _, body_start, end) in enumerate(spans):
+        if number is None:
+            _unlabelled_questions(text[body_start:end], source, exam, questions, leftovers)
+            continue
+        # The label of the next question was lost if the one after jumps by two; a second '(a)' group is it
+        next_number = spans[k + 1][0] if k + 1 < len(spans) else None
+        lost_label = next_number == number + 2
+
+        body, question_marks = _find_marks(text[body_start:end])
+        stem, parts = _split_parts(body)
+
+        if not parts:
+            # '[1x5] What is DOS? ...' lists several unlabelled questions
+            sentences = _split_sentences(stem, len(question_marks)) if len(question_marks) > 1 else None
+            if sentences:
+                parts = [(None, s) for s in sentences]
+                stem = ''
+            else:
+                parts = [(None, stem)]
+                stem = ''
+
+        # A stem like 'Consider a system with ...' is context for every part;
+        # a stem that is a full question of its own becomes its own entry
+        use_stem = stem.rstrip().endswith(':')
+        stem = _clean(stem)
+        if _is_instruction(stem):
+            stem = ''
+        use_stem = bool(stem) and (use_stem or stem.lower().startswith(_CONTEXT_STARTS))
+        if stem and not use_stem and looks_like_question(stem):
+            questions.append(_bank_entry(_trim(stem), question_marks[0] if question_marks else None, number, None, source, exam))
+
+        part_number = number
+        for i, (letter, part_text) in enumerate(parts):
+            if letter == 'a' and i > 0 and lost_label and part_number == number:
+                part_number = number + 1
+                use_stem = False
+            part_text, part_marks = _find_marks(part_text)
+            part_text = _trim(part_text)
+            if use_stem:
+                part_text = f"{stem} {part_text}"
+            marks = part_marks[0] if part_marks else (
+                question_marks[i] if i < len(question_marks) else (question_marks[0] if len(question_marks) == 1 else None)
+            )
+            if looks_like_question(part_text):
+                questions.append(_bank_entry(part_text, marks, part_number, letter, source, exam))
+            elif part_text:
+                leftovers.append(part_text)
+
+    if not spans:
+        leftovers.append(text)
+
+    return {"is_past_paper": True, "exam": exam, "questions": questions, "leftover": '\n'.join(leftovers)}
+
+
+# --- Topics ---
+def _key_phrases(text):
+    """Candidate topic phrases (2-3 consecutive content words) in text."""
+    words = [w.strip("'-") for w in re.findall(r"[A-Za-z][A-Za-z'\-]+", text.lower())]
+    phrases = set()
+    run = []
+    for word in words + ['the']:
+        if word in _STOP_WORDS or len(word) < 3:
+            for n in (2, 3):
+                for i in range(len(run) - n + 1):
+                    phrases.add(' '.join(run[i:i + n]))
+            run = []
+        else:
+            run.append(word)
+    return phrases
+
+
+def derive_topics(questions, max_topics=8):
+    """Build a topic list from bank questions without the model.
+
+    Topics are the two- and three-word phrases shared by the most
+    questions, preferring longer phrases at similar frequency.
+    """
+    counts = Counter()
+    for q in questions:
+        counts.update(_key_phrases(q['text']))
+
+    candidates = [(phrase, n) for phrase, n in counts.items() if n >= 2]
+    # Longer phrases first at similar counts, so 'lamport's logical clock' beats 'logical clock'
+    candidates.sort(key=lambda item: (-item[1] * (1 + 0.5 * item[0].count(' ')), item[0]))
+
+    topics = []
+    for phrase, _ in candidates:
+        if any(phrase in t or t in phrase for t in topics):
+            continue
+        topics.append(phrase)
+        if len(topics) >= max_topics:
+            break
+
+    return [{
+        "topic": ' '.join(word[:1].upper() + word[1:] for word in topic.split()),
+        "subtopics": [],
+        "importance": "High" if i < 3 else "Medium",
+        "question_types": ["Short Answer", "Essay"],
+    } for i, topic in enumerate(topics)]
+
+
+def assign_topics(questions, topics, default_topic):
+    """Set each bank question's topic to the topic whose words it shares most."""
+    topic_words = []
+    for topic in topics:
+        words = set(re.findall(r'[a-z]{3,}', ' '.join([topic['topic']] + list(topic.get('subtopics') or [])).lower()))
+        topic_words.append((topic['topic'], words - _STOP_WORDS))
+
+    for q in questions:
+        words = set(re.findall(r'[a-z]{3,}', q['text'].lower()))
+        best, best_score = default_topic, 0
+        for name, keywords in topic_words:
+            score = len(words & keywords)
+            if score > best_score:
+                best, best_score = name, score
+        q['topic'] = best
+    return questions
+
@@ -0,0 +1,469 @@
+"""PDF rendering with embedded Unicode fonts.
+
+Question papers are written with an embedded TrueType font (DejaVu Sans
+by default, or the font named by PDF_FONT_PATH), so math symbols, accented
+Latin, Greek and Cyrillic, and the model's smart quotes print as they are
+instead of breaking the export.  Text with characters that font lacks,
+such as Devanagari, is drawn with the first fallback font that has them
+(Noto Sans Devanagari, FreeSans, ... or PDF_FALLBACK_FONTS).  fpdf does
+no text shaping, so Devanagari conjuncts and reordered vowel signs are
+not formed: the glyphs print in logical order, legible but not typeset.
+Characters no installed font covers print as empty boxes and are logged.
+When no TrueType font can be found the engine falls back to the core
+Helvetica font and maps text onto Latin-1.
+
+PaperPdf fills fpdf's private font tables directly, so fpdf is pinned to
+SUPPORTED_FPDF_VERSION in setup.py.
+
+Font metrics are parsed once per process and shared by every render.
+Lines are wrapped by measured width using cached glyph-width tables
+rather than by character count.
+
+Run this module directly to benchmark rendering throughput:
+
+    python pdf_engine.py --questions 1000
+"""
+import os
+import threading
+import unicodedata
+
+from fpdf import FPDF, FPDF_VERSION
+from fpdf.fonts import fpdf_charwidths
+from fpdf.ttfonts import TTFontFile
+
+SUPPORTED_FPDF_VERSION = '1.7.2'
+if FPDF_VERSION != SUPPORTED_FPDF_VERSION:
+    print(f"pdf_engine.py is written against fpdf {SUPPORTED_FPDF_VERSION}, found {FPDF_VERSION}; PDF export may break")
+
+# Candidate locations of DejaVu Sans when PDF_FONT_PATH is not set
+FONT_DIRS = [
+    '/usr/share/fonts/truetype/dejavu',
+    '/usr/share/fonts/dejavu',
+    '/usr/share/fonts/truetype/noto',
+    '/usr/share/fonts/noto',
+    '/usr/share/fonts/truetype/freefont',
+    '/usr/share/fonts/gnu-free',
+    '/usr/share/fonts/truetype/lohit-devanagari',
+    '/usr/share/fonts/TTF',
+    '/usr/local/share/fonts',
+    '/Library/Fonts',
+    os.path.expanduser('~/Library/Fonts'),
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts'),
+]
+FONT_FILES = {
+    '': 'DejaVuSans.ttf',
+    'B': 'DejaVuSans-Bold.ttf',
+    'I': 'DejaVuSans-Oblique.ttf',
+}
+FONT_ENV = {
+    '': 'PDF_FONT_PATH',
+    'B': 'PDF_FONT_BOLD_PATH',
+    'I': 'PDF_FONT_ITALIC_PATH',
+}
+# Fonts tried, in order, for text the main font cannot draw (regular face only);
+# PDF_FALLBACK_FONTS replaces the list with paths separated by os.pathsep
+FALLBACK_FONT_FILES = [
+    'NotoSansDevanagari-Regular.ttf',
+    'FreeSans.ttf',
+    'Lohit-Devanagari.ttf',
+]
+FALLBACK_FONT_ENV = 'PDF_FALLBACK_FONTS'
+
+FAMILY = 'paper'
+FALLBACK_FAMILY = 'helvetica'
+
+# Word widths cached per font; cleared when it grows past this
+MAX_CACHED_WORDS = 50000
+
+# Latin-1 stand-ins for characters the model likes to produce
+_LATIN1_REPLACEMENTS = str.maketrans({
+    '\u2018': "'", '\u2019': "'", '\u201a': "'", '\u201b': "'",
+    '\u201c': '"', '\u201d': '"', '\u201e': '"', '\u2032': "'", '\u2033': '"',
+    '\u2013': '-', '\u2014': '-', '\u2015': '-', '\u2212': '-', '\u2010': '-', '\u2011': '-',
+    '\u2026': '...', '\u2022': '*', '\u00b7': '*', '\u2192': '->', '\u2190': '<-', '\u21d2': '=>',
+    '\u2264': '<=', '\u2265': '>=', '\u2260': '!=', '\u2248': '~', '\u221e': 'inf',
+    '\u00a0': ' ', '\u2009': ' ', '\u200b': '', '\ufeff': '',
+})
+
+
+def to_latin1(text):
+    """Map text onto Latin-1 for the core fonts, keeping it as readable as possible."""
+    text = text.translate(_LATIN1_REPLACEMENTS)
+    try:
+        text.encode('latin-1')
+        return text
+    except UnicodeEncodeError:
+        pass
+    chars = []
+    for char in text:
+        if ord(char) < 256:
+            chars.append(char)
+            continue
+        # Drop accents that Latin-1 cannot carry (e.g. 'ő' -> 'o')
+        base = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+        chars.append(base if base and all(ord(c) < 256 for c in base) else '?')
+    return ''.join(chars)
+
+
+def _find_in_font_dirs(filename):
+    for folder in FONT_DIRS:
+        candidate = os.path.join(folder, filename)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _find_font_file(style):
+    path = os.environ.get(FONT_ENV[style])
+    if path:
+        return path if os.path.exists(path) else None
+    return _find_in_font_dirs(FONT_FILES[style])
+
+
+def _find_fallback_font_files():
+    paths = os.environ.get(FALLBACK_FONT_ENV)
+    if paths:
+        return [path for path in paths.split(os.pathsep) if path and os.path.exists(path)]
+    return [path for path in map(_find_in_font_dirs, FALLBACK_FONT_FILES) if path]
+
+
+# --- Font Metrics ---
+class FontMetrics:
+    """Parsed metrics of one font style plus a cache of measured word widths."""
+
+    def __init__(self, fontkey, font_dict, ttffile=None):
+        self.fontkey = fontkey
+        self.font_dict = font_dict
+        self.ttffile = ttffile
+        widths = font_dict['cw']
+        if ttffile:
+            missing = font_dict['desc'].get('MissingWidth') or 500
+            # fpdf stores 0 for characters the font lacks (drawn at the default
+            # width) and 65535 for glyphs without advance, such as combining marks
+            table = [missing if w == 0 else 0 if w == 65535 else w for w in widths]
+            self._char_width = lambda char: table[ord(char)] if ord(char) < len(table) else missing
+            self._has_glyph = lambda char: ord(char) < len(widths) and widths[ord(char)] != 0
+        else:
+            self._char_width = lambda char: widths.get(char, 0)
+            self._has_glyph = lambda char: ord(char) < 256
+        self._word_widths = {}
+        # Characters known to have a glyph, so missing() only looks up new ones
+        self._drawable = set()
+        self.space_width = self._char_width(' ')
+
+    def missing(self, text):
+        """Set of the characters in text the font has no glyph for (whitespace aside)."""
+        missing = set()
+        for char in set(text) - self._drawable:
+            if char.isspace() or self._has_glyph(char):
+                self._drawable.add(char)
+            else:
+                missing.add(char)
+        return missing
+
+    def width(self, word):
+        """Width of word in 1/1000 of the font size."""
+        cached = self._word_widths.get(word)
+        if cached is None:
+            if len(self._word_widths) > MAX_CACHED_WORDS:
+                self._word_widths.clear()
+            cached = self._word_widths[word] = sum(map(self._char_width, word))
+        return cached
+
+    def wrap(self, text, max_width, font_size):
+        """Split text into lines no wider than max_width; font_size is in the same units."""
+        limit = max_width * 1000.0 / font_size
+        lines = []
+        for paragraph in text.split('\n'):
+            line, line_width = [], 0
+            for word in paragraph.split():
+                word_width = self.width(word)
+                extra = word_width + (self.space_width if line else 0)
+                if line and line_width + extra > limit:
+                    lines.append(' '.join(line))
+                    line, line_width = [], 0
+                    extra = word_width
+                if word_width > limit:
+                    # A single word wider than the line is broken by characters
+                    for piece in self._break_word(word, limit):
+                        lines.append(piece)
+                    continue
+                line.append(word)
+                line_width += extra
+            if line or not lines:
+                lines.append(' '.join(line))
+        return lines
+
+    def _break_word(self, word, limit):
+        piece, piece_width = '', 0
+        for char in word:
+            char_width = self._char_width(char)
+            if piece and piece_width + char_width > limit:
+                yield piece
+                piece, piece_width = '', 0
+            piece += char
+            piece_width += char_width
+        if piece:
+            yield piece
+
+
+def _parse_ttf(path):
+    """Read the metrics fpdf needs from a TTF file (the slow part of add_font)."""
+    ttf = TTFontFile()
+    ttf.getMetrics(path)
+    return {
+        'name': ttf.fullName.replace(' ', '').replace('(', '').replace(')', ''),
+        'type': 'TTF',
+        'desc': {
+            'Ascent': int(round(ttf.ascent, 0)),
+            'Descent': int(round(ttf.descent, 0)),
+            'CapHeight': int(round(ttf.capHeight, 0)),
+            'Flags': ttf.flags,
+            'FontBBox': "[%s %s %s %s]" % tuple(int(round(b, 0)) for b in ttf.bbox),
+            'ItalicAngle': int(ttf.italicAngle),
+            'StemV': int(round(ttf.stemV, 0)),
+            'MissingWidth': int(round(ttf.defaultWidth, 0)),
+        },
+        'up': round(ttf.underlinePosition),
+        'ut': round(ttf.underlineThickness),
+        'originalsize': os.stat(path).st_size,
+        'cw': ttf.charWidths,
+    }
+
+
+class _FontCache:
+    """Process-wide font metrics, loaded on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fonts = None
+        self._fallbacks = None
+
+    def get(self):
+        """Return {style: FontMetrics}; all core-font metrics if no TTF font is available."""
+        with self._lock:
+            if self._fonts is None:
+                self._fonts = self._load()
+            return self._fonts
+
+    def fallbacks(self):
+        """FontMetrics of the fallback fonts, parsed the first time a paper needs one."""
+        with self._lock:
+            if self._fallbacks is None:
+                self._fallbacks = self._load_fallbacks()
+            return self._fallbacks
+
+    def _load_fallbacks(self):
+        fallbacks = []
+        for path in _find_fallback_font_files():
+            try:
+                fallbacks.append(FontMetrics(f"{FAMILY}fb{len(fallbacks)}", _parse_ttf(path), ttffile=path))
+            except Exception as e:
+                print(f"Could not load fallback font {path}: {str(e)}")
+        return fallbacks
+
+    def _load(self):
+        regular = _find_font_file('')
+        if regular is None:
+            print("No TrueType font found; PDF export falls back to Latin-1 text")
+            return {
+                style: FontMetrics(FALLBACK_FAMILY + style, {'cw': fpdf_charwidths[FALLBACK_FAMILY + style]})
+                for style in ('', 'B', 'I')
+            }
+
+        fonts = {}
+        for style in ('', 'B', 'I'):
+            # Missing bold or italic variants are drawn with the regular face
+            path = _find_font_file(style) or regular
+            fontkey = FAMILY + style
+            try:
+                fonts[style] = FontMetrics(fontkey, _parse_ttf(path), ttffile=path)
+            except Exception as e:
+                print(f"Could not load font {path}: {str(e)}")
+                if style == '':
+                    raise
+                fonts[style] = FontMetrics(fontkey, fonts[''].font_dict, ttffile=fonts[''].ttffile)
+        return fonts
+
+
+font_cache = _FontCache()
+
+
+# --- Documents ---
+class _GlyphSubset(list):
+    """Glyph subset of a TTF font without duplicates and with set-speed membership tests.
+
+    fpdf appends every drawn character to the subset and, when writing the
+    font, tests each of the font's code points against it; on a plain list
+    that test dominates rendering time for long papers.
+    """
+
+    def __init__(self, items=()):
+        super().__init__()
+        self._members = set()
+        for item in items:
+            self.append(item)
+
+    def append(self, item):
+        if item not in self._members:
+            self._members.add(item)
+            super().append(item)
+
+    def __contains__(self, item):
+        return item in self._members
+
+
+class PaperPdf(FPDF):
+    """FPDF document with the shared fonts installed and width-based wrapping."""
+
+    def __init__(self, fonts=None):
+        super().__init__()
+        self.metrics = fonts or font_cache.get()
+        self.unicode = self.metrics[''].ttffile is not None
+        self.body_family = FAMILY if self.unicode else FALLBACK_FAMILY
+        # Characters no installed font could draw, reported when the PDF is written
+        self.unsupported = set()
+        self._fallback_for = {}
+        if self.unicode:
+            for style, metrics in self.metrics.items():
+                self._install_font(FAMILY + style, metrics)
+        self.set_auto_page_break(True, margin=15)
+
+    def _install_font(self, fontkey, metrics):
+        """Register pre-parsed TTF metrics, as add_font(uni=True) would after parsing."""
+        font_dict = metrics.font_dict
+        self.fonts[fontkey] = {
+            'i': len(self.fonts) + 1, 'type': 'TTF',
+            'name': font_dict['name'], 'desc': font_dict['desc'],
+            'up': font_dict['up'], 'ut': font_dict['ut'],
+            'cw': font_dict['cw'],
+            'ttffile': metrics.ttffile, 'fontkey': fontkey,
+            'subset': _GlyphSubset(range(0, 32)), 'unifilename': None,
+        }
+        self.font_files[fontkey] = {'length1': font_dict['originalsize'], 'type': 'TTF', 'ttffile': metrics.ttffile}
+        self.font_files[metrics.ttffile] = {'type': 'TTF'}
+
+    def text_for_font(self, text):
+        """Text as the current fonts can draw it."""
+        text = '' if text is None else str(text)
+        return text if self.unicode else to_latin1(text)
+
+    def use_font(self, text, style='', size=10):
+        """Select the font to draw text with and return its metrics.
+
+        Text with characters the main font lacks is drawn with the fallback
+        font that lacks the fewest of them (in its regular face).
+        """
+        metrics = self.metrics[style]
+        missing = metrics.missing(text) if self.unicode else None
+        if not missing:
+            self.set_font(self.body_family, style, size)
+            return metrics
+
+        # Chosen by the characters the main font lacks, which repeat across a paper
+        key = frozenset(missing)
+        if key not in self._fallback_for:
+            best, best_missing = None, len(key)
+            for fallback in font_cache.fallbacks():
+                fallback_missing = len(fallback.missing(key))
+                if fallback_missing < best_missing:
+                    best, best_missing = fallback, fallback_missing
+            self._fallback_for[key] = best
+        best = self._fallback_for[key]
+        if best is None:
+            self.unsupported.update(missing)
+            self.set_font(self.body_family, style, size)
+            return metrics
+        self.unsupported.update(best.missing(text))
+        if best.fontkey not in self.fonts:
+            self._install_font(best.fontkey, best)
+        self.set_font(best.fontkey, '', size)
+        return best
+
+    def text_line(self, text, height=8, style='', size=10, align='L'):
+        """Write one line of text without wrapping."""
+        text = self.text_for_font(text)
+        self.use_font(text, style, size)
+        self.cell(0, height, text, 0, 1, align)
+
+    def paragraph(self, text, height=8, style='', size=10, indent=0):
+        """Write text wrapped to the page width by measured glyph widths."""
+        text = self.text_for_font(text)
+        metrics = self.use_font(text, style, size)
+        width = self.w - self.r_margin - self.l_margin - indent
+        for text_line in metrics.wrap(text, width, size / self.k):
+            if indent:
+                self.set_x(self.l_margin + indent)
+            self.cell(width, height, text_line, 0, 1)
+
+    def to_bytes(self):
+        """Render the document and return the PDF bytes."""
+        if self.unsupported:
+            sample = ''.join(sorted(self.unsupported)[:10])
+            print(f"PDF export: no installed font has {len(self.unsupported)} characters ({sample}); "
+                  f"they print as empty boxes. Add a font that covers them with {FALLBACK_FONT_ENV}.")
+        return self.output(dest='S').encode('latin-1')
+
+
+# --- Benchmark ---
+def _benchmark_questions(count):
+    samples = [
+        "Explain the “happened-before” relation and show how Lamport clocks implement it — with an example.",
+        "प्रश्न: वितरित प्रणाली में पारस्परिक बहिष्करण को समझाइए।",
+        "If f(x) = ∑ xᵢ² for i ∈ {1…n}, show that ∇f = 2x and that f ≥ 0.",
+        "Compare the Ricart-Agrawala and token-ring algorithms for distributed mutual exclusion in terms of message complexity, synchronisation delay and fault tolerance.",
+    ]
+    questions = []
+    for i in range(count):
+        questions.append({
+            "text": samples[i % len(samples)],
+            "options": ["O(n)", "O(2(n-1))", "O(log n)", "O(1) — constant"] if i % 2 == 0 else [],
+            "correct_answer": "O(2(n-1)) messages per critical-section entry",
+            "explanation": samples[(i + 1) % len(samples)],
+            "topic": f"Topic {i % 7}",
+            "type": "MCQ" if i % 2 == 0 else "Short Answer",
+        })
+    return questions
+
+
+def benchmark(num_questions=1000, runs=3):
+    """Render a num_questions paper runs times and return pages per second."""
+    import time
+
+    questions = _benchmark_questions(num_questions)
+    font_cache.get()  # exclude the one-off font parsing
+    pages = 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        pdf = PaperPdf()
+        pdf.add_page()
+        pdf.text_line("Benchmark Paper", height=10, style='B', size=16, align='C')
+        for i, q in enumerate(questions):
+            pdf.text_line(f"Question {i + 1}", style='B', size=11)
+            pdf.paragraph(q['text'])
+            for j, option in enumerate(q['options']):
+                pdf.paragraph(f"{chr(65 + j)}. {option}", indent=5)
+            pdf.paragraph(q['correct_answer'], style='B')
+            pdf.paragraph(q['explanation'], style='I')
+        pdf.to_bytes()
+        pages += pdf.page_no()
+    elapsed = time.perf_counter() - start
+    return {
+        "questions": num_questions,
+        "runs": runs,
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1),
+        "unicode": font_cache.get()[''].ttffile is not None,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark PDF rendering throughput")
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    print(benchmark(args.questions, args.runs))
@@ -0,0 +1,131 @@
+"""Local checks for generated questions.
+
+validate_questions() runs schema and semantic checks over a batch of
+questions.  Problems that can be fixed without the model (type spelled
+'mcq', answer given as the letter 'B', difficulty in lower case) are fixed
+in place; everything else is reported so that only the broken items need
+to be sent back to the model for repair.
+"""
+import re
+
+QUESTION_TYPES = ('MCQ', 'Short Answer', 'Essay')
+DIFFICULTIES = ('Easy', 'Medium', 'Hard')
+
+MIN_OPTIONS = 2
+
+_TYPE_ALIASES = {
+    'mcq': 'MCQ',
+    'multiple choice': 'MCQ',
+    'multiple-choice': 'MCQ',
+    'multiple choice question': 'MCQ',
+    'short answer': 'Short Answer',
+    'short-answer': 'Short Answer',
+    'short': 'Short Answer',
+    'essay': 'Essay',
+    'long answer': 'Essay',
+}
+
+# 'B', 'B.', 'B)', '(B)', 'Option B'
+_OPTION_LETTER_RE = re.compile(r'^\(?(?:option\s+)?([A-Z])[.)]?$', re.IGNORECASE)
+
+
+def _clean(value):
+    """Return value as a stripped string ('' for None)."""
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _text_key(text):
+    return ' '.join(text.lower().split())
+
+
+def _fix_correct_answer(answer, options):
+    """Map an answer given as a letter or with different spacing/case onto its option."""
+    if answer in options:
+        return answer
+    by_key = {_text_key(option): option for option in options}
+    if _text_key(answer) in by_key:
+        return by_key[_text_key(answer)]
+    match = _OPTION_LETTER_RE.match(answer)
+    if match:
+        index = ord(match.group(1).upper()) - ord('A')
+        if 0 <= index < len(options):
+            return options[index]
+    # 'B. Some option text'
+    match = re.match(r'^\(?([A-Z])[.)]\s+(.+)$', answer, re.IGNORECASE)
+    if match and _text_key(match.group(2)) in by_key:
+        return by_key[_text_key(match.group(2))]
+    return answer
+
+
+def check_question(q, allowed_types=None, default_difficulty='Medium'):
+    """Normalize q in place and return the list of problems left on it."""
+    if not isinstance(q, dict):
+        return ["question is not an object"]
+
+    problems = []
+    allowed_types = allowed_types or QUESTION_TYPES
+
+    q['text'] = _clean(q.get('text'))
+    if not q['text']:
+        problems.append("question text is empty")
+
+    q_type = _clean(q.get('type'))
+    q_type = _TYPE_ALIASES.get(q_type.lower(), q_type)
+    q['type'] = q_type
+    if q_type not in allowed_types:
+        problems.append(f"type '{q_type}' is not one of: {', '.join(allowed_types)}")
+
+    difficulty = _clean(q.get('difficulty')).capitalize()
+    q['difficulty'] = difficulty if difficulty in DIFFICULTIES else default_difficulty
+
+    answer = _clean(q.get('correct_answer'))
+
+    if q_type == 'MCQ':
+        options = q.get('options')
+        if not isinstance(options, list):
+            problems.append("MCQ has no options list")
+            options = []
+        options = [_clean(option) for option in options]
+        q['options'] = options
+
+        if len(options) < MIN_OPTIONS:
+            problems.append(f"MCQ needs at least {MIN_OPTIONS} options")
+        if any(not option for option in options):
+            problems.append("MCQ has an empty option")
+        keys = [_text_key(option) for option in options if option]
+        if len(set(keys)) != len(keys):
+            problems.append("MCQ has duplicate options")
+
+        answer = _fix_correct_answer(answer, options)
+        if not answer:
+            problems.append("MCQ has no correct_answer")
+        elif answer not in options:
+            problems.append("MCQ correct_answer is not one of its options")
+    elif not answer and not _clean(q.get('explanation')):
+        problems.append("question has neither an answer nor an explanation")
+
+    q['correct_answer'] = answer
+    return problems
+
+
+def validate_questions(questions, allowed_types=None, default_difficulty='Medium'):
+    """Check a batch of questions.
+
+    Returns a list of (index, problems) for the questions that failed. Later
+    questions repeating the text of an earlier one are reported as
+    duplicates.
+    """
+    failures = []
+    seen_texts = set()
+    for i, q in enumerate(questions):
+        problems = check_question(q, allowed_types, default_difficulty)
+        if isinstance(q, dict) and q['text']:
+            key = _text_key(q['text'])
+            if key in seen_texts:
+                problems.append("question duplicates another question in the paper")
+            seen_texts.add(key)
+        if problems:
+            failures.append((i, problems))
+    return failures
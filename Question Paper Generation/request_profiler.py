@@ -0,0 +1,261 @@
+"""Opt-in cProfile profiling of single requests, for admins.
+
+A request to a wrapped endpoint is profiled when it carries X-Profile: 1
+(or ?profile=1) together with a valid X-Admin-Token.  The handler runs
+under cProfile; the raw stats are saved as <request id>.prof (loadable
+with pstats or snakeviz) next to a JSON summary with the request details
+and the hottest functions.  Requests without both headers run untouched,
+so the hook costs nothing unless an admin asks for a profile.
+
+Only one request is profiled at a time: the interpreter allows a single
+active profiler, and overlapping profiles would skew each other.  A
+request asking for a profile while another is running is served normally
+and answered with X-Profile: busy.
+
+cProfile only records the thread that enabled it (up to Python 3.11).
+Work a request hands to a thread pool, such as the topic analysis batches
+and their model calls, is included by submitting it through bind(): the
+task runs under its own profiler and its stats are merged into the
+request's profile.  From Python 3.12 the request's profiler records every
+thread on its own, including those of other requests served meanwhile.
+"""
+import cProfile
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+
+from flask import make_response, request
+
+PROFILE_HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Admin-Token'
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def function_label(key, root=None):
+    """'file.py:123(name)' for a pstats function key, with paths shortened."""
+    filename, line, name = key
+    if filename == '~':  # built-in functions
+        return name
+    if root and filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    elif os.sep in filename:
+        parts = filename.split(os.sep)
+        filename = os.path.join(*parts[-2:])
+    return f"{filename}:{line}({name})"
+
+
+def hot_functions(stats, limit=15, sort='tottime', root=None):
+    """Top functions of a pstats.Stats, sorted by own time ('tottime') or cumulative time ('cumtime')."""
+    index = 2 if sort == 'tottime' else 3
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+    return [
+        {
+            'function': function_label(key, root),
+            'calls': nc,
+            'tottime': round(tt, 4),
+            'cumtime': round(ct, 4),
+        }
+        for key, (cc, nc, tt, ct, callers) in rows
+    ]
+
+
+class RequestProfiler:
+    """Profiles flagged requests of wrapped Flask views and keeps the most recent profiles."""
+
+    def __init__(self, folder, admin_token='', keep=50, top=15):
+        self.folder = folder
+        self.admin_token = admin_token
+        self.keep = keep
+        self.top = top
+        self.root = os.path.dirname(os.path.abspath(__file__))
+        self._busy = threading.Lock()
+        # Profilers of tasks bound to the request being profiled on this thread
+        self._local = threading.local()
+        if self.enabled:
+            os.makedirs(folder, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.admin_token)
+
+    def is_admin(self):
+        """True if the current request carries the admin token."""
+        token = request.headers.get(TOKEN_HEADER, '')
+        return self.enabled and bool(token) and hmac.compare_digest(token.encode('utf-8'), self.admin_token.encode('utf-8'))
+
+    def wants_profile(self):
+        flag = request.headers.get(PROFILE_HEADER) or request.args.get('profile') or ''
+        return flag.lower() in _TRUE_VALUES and self.is_admin()
+
+    @staticmethod
+    def request_id():
+        """The caller's X-Request-Id if it is usable as a file name, else a new id."""
+        given = request.headers.get(REQUEST_ID_HEADER, '')
+        if _REQUEST_ID_RE.match(given):
+            return given
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    # --- Wrapping ---
+    def profiled(self, view):
+        """Decorator for a view function; place it below @app.route."""
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.wants_profile():
+                return view(*args, **kwargs)
+            if not self._busy.acquire(blocking=False):
+                response = make_response(view(*args, **kwargs))
+                response.headers[PROFILE_HEADER] = 'busy'
+                return response
+            try:
+                return self._profile(view, args, kwargs)
+            finally:
+                self._busy.release()
+
+        return wrapper
+
+    def bind(self, task):
+        """Wrap a task for a worker thread so it counts towards the request being profiled.
+
+        Returns task unchanged unless the calling thread is profiling a request.
+        """
+        workers = getattr(self._local, 'workers', None)
+        if workers is None:
+            return task
+
+        @functools.wraps(task)
+        def profiled_task(*args, **kwargs):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+: the request's profiler already records this thread
+                return task(*args, **kwargs)
+            try:
+                return task(*args, **kwargs)
+            finally:
+                profiler.disable()
+                workers.append(profiler)
+
+        return profiled_task
+
+    def _profile(self, view, args, kwargs):
+        request_id = self.request_id()
+        profiler = cProfile.Profile()
+        workers = self._local.workers = []
+        started = time.time()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            self._local.workers = None
+
+        summary = {
+            'request_id': request_id,
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'started': started,
+            'seconds': round(elapsed, 4),
+            'status': response.status_code,
+            'request_bytes': request.content_length,
+            'response_bytes': response.calculate_content_length(),
+            # Thread pool tasks whose stats are merged in (see bind())
+            'worker_tasks': len(workers),
+        }
+        try:
+            stats = pstats.Stats(profiler)
+            for worker in workers:
+                stats.add(worker)
+            self._save(request_id, stats, summary)
+        except Exception as e:
+            print(f"Error saving profile {request_id}: {str(e)}")
+        else:
+            print(f"Profiled {request.method} {request.path} as {request_id} ({elapsed:.2f}s)")
+            response.headers[PROFILE_HEADER] = request_id
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    # --- Storage ---
+    def _path(self, request_id, extension):
+        return os.path.join(self.folder, f"{request_id}.{extension}")
+
+    def _save(self, request_id, stats, summary):
+        stats.dump_stats(self._path(request_id, 'prof'))
+        summary['function_calls'] = stats.total_calls
+        summary['top_self'] = hot_functions(stats, self.top, 'tottime', self.root)
+        summary['top_cumulative'] = hot_functions(stats, self.top, 'cumtime', self.root)
+        with open(self._path(request_id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        self._prune()
+
+    def _prune(self):
+        """Delete all but the most recent `keep` profiles."""
+        for summary in self.recent(limit=None)[self.keep:]:
+            for extension in ('json', 'prof'):
+                try:
+                    os.remove(self._path(summary['request_id'], extension))
+                except OSError:
+                    pass
+
+    def recent(self, limit=20, top=5):
+        """Summaries of saved profiles, newest first, with their top `top` functions by own time."""
+        summaries = []
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.folder, name), 'r', encoding='utf-8') as f:
+                    summaries.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue
+        summaries.sort(key=lambda s: s.get('started', 0), reverse=True)
+        if limit is not None:
+            summaries = summaries[:limit]
+            for summary in summaries:
+                summary['top_self'] = summary.get('top_self', [])[:top]
+                summary.pop('top_cumulative', None)
+        return summaries
+
+    def get(self, request_id):
+        """Full summary of one profile, or None."""
+        if not _REQUEST_ID_RE.match(request_id or ''):
+            return None
+        try:
+            with open(self._path(request_id, 'json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def stats_path(self, request_id):
+        """Path of the raw .prof file for a profile, or None."""
+        if not _REQUEST_ID_RE.match(request_id or ''):
+            return None
+        path = self._path(request_id, 'prof')
+        return path if os.path.exists(path) else None
+
+    def stats_text(self, request_id, sort='cumulative', limit=40):
+        """pstats printout of one profile, or None."""
+        path = self.stats_path(request_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
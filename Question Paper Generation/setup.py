@@ -28,11 +28,10 @@ requests==2.31.0
 pdf2image==1.16.3
 pytesseract==0.3.10
 PyPDF2==3.0.1
-pandas==2.1.0
-fpdf==1.7.2
-markdown==3.4.4
+fpdf==1.7.2  # exact: pdf_engine.py relies on fpdf's internal font tables
 pdfkit==1.0.0
-beautifulsoup4==4.12.2
+numpy==1.25.2
+scipy==1.11.2
 """)
 
 def create_directories():
@@ -8,7 +8,8 @@ document.addEventListener('DOMContentLoaded', function() {
         topics: [],
         selectedTopics: [],
         generatedQuestions: [],
-        questionBank: []  // This would be populated from an external source in a real app
+        paperId: null,      // Server-side id of the generated paper
+        paperVersion: null  // Version of the paper the displayed questions belong to
     };
 
     // DOM Elements
@@ -32,6 +33,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const exportPdfBtn = document.getElementById('export-pdf');
     const exportHtmlBtn = document.getElementById('export-html');
     const exportMdBtn = document.getElementById('export-md');
+    const exportZipBtn = document.getElementById('export-zip');
     const regenerateBtn = document.getElementById('regenerate-btn');
     const progressBar = document.getElementById('progress-bar');
 
@@ -69,13 +71,14 @@ document.addEventListener('DOMContentLoaded', function() {
     deselectAllTopicsBtn.addEventListener('click', deselectAllTopics);
     
     // Event Listeners for Question Generation
-    generateQuestionsBtn.addEventListener('click', handleGenerateQuestions);
-    regenerateBtn.addEventListener('click', handleGenerateQuestions);
+    generateQuestionsBtn.addEventListener('click', () => handleGenerateQuestions(false));
+    regenerateBtn.addEventListener('click', () => handleGenerateQuestions(true));
     
     // Event Listeners for Export
     exportPdfBtn.addEventListener('click', () => exportPaper('pdf'));
     exportHtmlBtn.addEventListener('click', () => exportPaper('html'));
     exportMdBtn.addEventListener('click', () => exportPaper('md'));
+    exportZipBtn.addEventListener('click', () => exportPaper('zip'));
     
     // File Upload Handlers
     function handleFileSelect(e) {
@@ -249,7 +252,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Question Generation
-    async function handleGenerateQuestions() {
+    async function handleGenerateQuestions(regenerate) {
         // Validate inputs
         const numQuestions = parseInt(document.getElementById('num-questions').value);
         
@@ -286,9 +289,15 @@ document.addEventListener('DOMContentLoaded', function() {
                 difficulty: difficulty,
                 question_types: questionTypes,
                 num_questions: numQuestions,
-                question_bank: state.questionBank
+                fill_gaps: document.getElementById('fill-gaps-check').checked
             };
             
+            // Regenerating makes a new version of the same paper on the server
+            if (regenerate && state.paperId) {
+                requestData.paper_id = state.paperId;
+                requestData.base_version = state.paperVersion;
+            }
+            
             console.log("Sending request with data:", requestData);
             
             const response = await fetch('/api/generate-questions', {
@@ -312,6 +321,12 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Update state
             state.generatedQuestions = data.questions;
+            state.paperId = data.paper_id;
+            state.paperVersion = data.version;
+            
+            if (data.coverage && data.coverage.sections) {
+                console.log(`Coverage: ${data.coverage.covered_sections}/${data.coverage.sections} sections`, data.coverage);
+            }
             
             // Populate default exam title if empty
             if (!examTitleInput.value) {
@@ -434,6 +449,20 @@ document.addEventListener('DOMContentLoaded', function() {
         infoContainer.appendChild(questionType);
         infoContainer.appendChild(difficultyBadge);
         
+        // Edits are applied to the saved paper on the server
+        const replaceBtn = document.createElement('button');
+        replaceBtn.className = 'btn btn-sm btn-outline-primary ms-2';
+        replaceBtn.textContent = 'Replace';
+        replaceBtn.addEventListener('click', () => replaceQuestion(question.id));
+        
+        const deleteBtn = document.createElement('button');
+        deleteBtn.className = 'btn btn-sm btn-outline-danger ms-1';
+        deleteBtn.textContent = 'Delete';
+        deleteBtn.addEventListener('click', () => deleteQuestion(question.id));
+        
+        infoContainer.appendChild(replaceBtn);
+        infoContainer.appendChild(deleteBtn);
+        
         header.appendChild(questionNumber);
         header.appendChild(infoContainer);
         
@@ -507,6 +536,62 @@ document.addEventListener('DOMContentLoaded', function() {
         return card;
     }
     
+    // Paper Edits
+    async function applyPaperEdits(edits) {
+        const response = await fetch(`/api/papers/${state.paperId}/edits`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ base_version: state.paperVersion, edits: edits })
+        });
+        const data = await response.json();
+        
+        if (!response.ok || !data.success) {
+            throw new Error(data.error || 'Failed to update the paper');
+        }
+        state.paperVersion = data.version;
+    }
+    
+    async function deleteQuestion(questionId) {
+        showProgress();
+        try {
+            await applyPaperEdits([{ op: 'delete', id: questionId }]);
+            state.generatedQuestions = state.generatedQuestions.filter(q => String(q.id) !== String(questionId));
+            renderQuestions();
+        } catch (error) {
+            showToast('Error', error.message);
+        } finally {
+            hideProgress();
+        }
+    }
+    
+    async function replaceQuestion(questionId) {
+        showProgress();
+        try {
+            const response = await fetch(`/api/papers/${state.paperId}/questions/${encodeURIComponent(questionId)}/regenerate`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ base_version: state.paperVersion })
+            });
+            const data = await response.json();
+            
+            if (!response.ok || !data.success) {
+                throw new Error(data.error || 'Failed to replace the question');
+            }
+            
+            state.paperVersion = data.version;
+            state.generatedQuestions = state.generatedQuestions.map(q => String(q.id) === String(questionId) ? data.question : q);
+            renderQuestions();
+        } catch (error) {
+            showToast('Error', error.message);
+        } finally {
+            hideProgress();
+        }
+    }
+    
     // Exporting
     async function exportPaper(format) {
         if (state.generatedQuestions.length === 0) {
@@ -520,20 +605,19 @@ document.addEventListener('DOMContentLoaded', function() {
         showProgress();
         
         try {
-            // Create a Blob object for the file download
-            const questionsData = JSON.stringify(state.generatedQuestions);
-            
-            // Create form data for multipart/form-data submission
-            const formData = new FormData();
-            formData.append('questions', questionsData);
-            formData.append('format', format);
-            formData.append('title', title);
-            formData.append('include_answers', includeAnswers.toString());
-            
-            // Use fetch with normal POST request
+            // The paper is saved on the server, so only its id and version are sent
             const response = await fetch('/api/export', {
                 method: 'POST',
-                body: formData
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({
+                    paper_id: state.paperId,
+                    version: state.paperVersion,
+                    format: format,
+                    title: title,
+                    include_answers: includeAnswers
+                })
             });
             
             if (!response.ok) {
@@ -0,0 +1,89 @@
+import pytest
+
+from corpus_store import CorpusStore, page_separator
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CorpusStore(str(tmp_path), chunk_bytes=16)
+
+
+def joined(pages):
+    """The text put() stores for pages."""
+    text, previous = '', None
+    for i, (source, page) in enumerate(pages):
+        text += (page_separator(previous, source) if i else '') + page
+        previous = source
+    return text
+
+
+PAGES = [
+    ('a.pdf', 'First page of a.\nSecond line.'),
+    ('a.pdf', 'Page two हिन्दी text.'),
+    ('b.pdf', 'Another document\nwith several\nshort lines.'),
+]
+
+
+def test_round_trip(store):
+    doc = store.put('notes.json', PAGES)
+
+    assert str(doc) == joined(PAGES)
+    assert len(doc) == len(joined(PAGES))
+    assert list(doc.iter_pages()) == PAGES
+    assert list(doc.splitlines()) == joined(PAGES).splitlines()
+    assert doc.preview(10) == joined(PAGES)[:10]
+    assert store.get('missing.json') is None
+
+
+def test_chunks_end_on_line_breaks(store):
+    doc = store.put('notes.json', PAGES)
+
+    chunks = [doc.chunk(i).tobytes() for i in range(len(doc.chunks))]
+    assert len(chunks) > 1
+    assert b''.join(chunks) == joined(PAGES).encode('utf-8')
+    assert all(chunk.endswith(b'\n') for chunk in chunks[:-1])
+
+
+def test_empty_pages_keep_page_numbers(store):
+    pages = [('scan.pdf', 'Cover'), ('scan.pdf', ''), ('scan.pdf', 'Page three'), ('other.pdf', ''), ('other.pdf', 'End')]
+    doc = store.put('scan.json', pages)
+
+    assert len(doc.pages) == len(pages)
+    assert list(doc.iter_pages()) == pages
+    assert doc.page(2)[0] == 'scan.pdf'
+    assert doc.page(2)[1].tobytes() == b'Page three'
+    assert str(doc) == joined(pages)
+
+
+def test_same_text_is_stored_once(store, tmp_path):
+    store.put('first.json', PAGES)
+    size = (tmp_path / 'corpus.dat').stat().st_size
+
+    store.put('first.json', PAGES)
+    doc = store.put('copy.json', PAGES)
+
+    assert (tmp_path / 'corpus.dat').stat().st_size == size
+    assert list(doc.iter_pages()) == PAGES
+    assert store.info('copy.json')['sha256'] == store.info('first.json')['sha256']
+
+
+def test_reupload_repoints_the_index(store, tmp_path):
+    store.put('notes.json', PAGES)
+    doc = store.put('notes.json', [('a.pdf', 'Replaced text.')])
+
+    assert str(doc) == 'Replaced text.'
+    # A second store over the same folder, as another worker would have
+    assert str(CorpusStore(str(tmp_path)).get('notes.json')) == 'Replaced text.'
+    assert not list(tmp_path.glob('staging-*'))
+
+
+def test_failed_extraction_stores_nothing(store, tmp_path):
+    def pages():
+        yield 'a.pdf', 'partial'
+        raise RuntimeError('OCR failed')
+
+    with pytest.raises(RuntimeError):
+        store.put('broken.json', pages())
+
+    assert store.get('broken.json') is None
+    assert not list(tmp_path.glob('staging-*'))
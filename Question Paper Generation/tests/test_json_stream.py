@@ -0,0 +1,90 @@
+import io
+import json
+
+import pytest
+
+from json_stream import iter_events, iter_json_text
+
+
+def write_json(tmp_path, text):
+    path = tmp_path / 'corpus.json'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def build(events):
+    """Rebuild a value from iter_events() output, to compare against json.loads."""
+    stack, key = [], None
+    root = None
+    for event, value in events:
+        if event == 'map_key':
+            key = value
+            continue
+        if event in ('end_map', 'end_array'):
+            done = stack.pop()
+            if not stack:
+                root = done
+            continue
+        item = {} if event == 'start_map' else [] if event == 'start_array' else value
+        if stack:
+            if isinstance(stack[-1], dict):
+                stack[-1][key] = item
+            else:
+                stack[-1].append(item)
+        else:
+            root = item
+        if event in ('start_map', 'start_array'):
+            stack.append(item)
+    return root
+
+
+DOCUMENT = {
+    'a.pdf': {'text': ['page "one"', 'back\\slash\\', 'tab\tand\nnewline', 'unicode हिन्दी \U0001F600']},
+    'b.pdf': {'text': [], 'meta': {'pages': 0, 'ok': True, 'ratio': -1.5e3, 'none': None}},
+    'c.txt': 'plain text entry',
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64 * 1024])
+def test_events_match_json_at_any_chunk_size(chunk_size):
+    text = json.dumps(DOCUMENT)
+    assert build(iter_events(io.StringIO(text), chunk_size)) == DOCUMENT
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 64 * 1024])
+def test_pages_per_source(tmp_path, chunk_size):
+    path = write_json(tmp_path, json.dumps(DOCUMENT, ensure_ascii=False))
+    assert list(iter_json_text(path, chunk_size)) == [
+        ('a.pdf', 'page "one"'),
+        ('a.pdf', 'back\\slash\\'),
+        ('a.pdf', 'tab\tand\nnewline'),
+        ('a.pdf', 'unicode हिन्दी \U0001F600'),
+        ('c.txt', 'plain text entry'),
+    ]
+
+
+def test_long_string_across_chunks(tmp_path):
+    page = 'x' * 100000 + '\\"' + 'y' * 100000
+    path = write_json(tmp_path, json.dumps({'big.pdf': {'text': [page]}}))
+    assert list(iter_json_text(path, chunk_size=4096)) == [('big.pdf', page)]
+
+
+def test_top_level_list_and_scalar(tmp_path):
+    path = write_json(tmp_path, json.dumps(['first', {'nested': 1}, 3]))
+    assert list(iter_json_text(path, chunk_size=2)) == [(0, 'first'), (1, "{'nested': 1}"), (2, '3')]
+
+    path = write_json(tmp_path, json.dumps('only text'))
+    assert list(iter_json_text(path)) == [(None, 'only text')]
+
+
+@pytest.mark.parametrize('text, message', [
+    ('', 'Empty JSON document'),
+    ('{"a.pdf": {"text": ["unterminated', 'Unterminated string'),
+    ('{"a.pdf": {"text": ["page"]}', 'Unexpected end'),
+    ('{"a.pdf": "text"} []', 'Extra data'),
+    ('{"a.pdf": {"text": [nope]}}', 'Invalid JSON token'),
+])
+def test_malformed_documents(tmp_path, text, message):
+    path = write_json(tmp_path, text)
+    with pytest.raises(ValueError, match=message):
+        list(iter_json_text(path, chunk_size=4))
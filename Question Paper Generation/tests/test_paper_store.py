@@ -0,0 +1,113 @@
+import pytest
+
+from paper_store import PaperConflict, PaperEditError, PaperStore, apply_edit, parse_version
+
+
+def question(question_id, text=None):
+    return {'id': question_id, 'text': text or f"Question {question_id}?"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PaperStore(str(tmp_path), keep_versions=3)
+
+
+@pytest.fixture
+def paper(store):
+    return store.create([question('q1'), question('q2'), question('q3')], meta={'subject': 'DOS'})
+
+
+def ids(paper):
+    return [q['id'] for q in paper['questions']]
+
+
+def test_edits_bump_the_version(store, paper):
+    updated = store.update(paper['paper_id'], [{'op': 'delete', 'id': 'q2'}], base_version=1)
+
+    assert updated['version'] == 2
+    assert ids(updated) == ['q1', 'q3']
+    assert store.get(paper['paper_id']) == updated
+    assert ids(store.get(paper['paper_id'], version=1)) == ['q1', 'q2', 'q3']
+
+
+def test_stale_version_is_refused(store, paper):
+    store.update(paper['paper_id'], [{'op': 'delete', 'id': 'q1'}], base_version=1)
+
+    with pytest.raises(PaperConflict, match='version 2'):
+        store.update(paper['paper_id'], [{'op': 'delete', 'id': 'q3'}], base_version=1)
+
+    current = store.get(paper['paper_id'])
+    assert current['version'] == 2
+    assert ids(current) == ['q2', 'q3']
+
+
+def test_edits_without_base_version_apply_to_current(store, paper):
+    store.update(paper['paper_id'], [{'op': 'delete', 'id': 'q1'}])
+    updated = store.update(paper['paper_id'], [{'op': 'add', 'question': question('q4'), 'index': 0}])
+
+    assert updated['version'] == 3
+    assert ids(updated) == ['q4', 'q2', 'q3']
+
+
+def test_invalid_edit_list_saves_nothing(store, paper):
+    with pytest.raises(PaperEditError):
+        store.update(paper['paper_id'], [{'op': 'delete', 'id': 'q1'}, {'op': 'delete', 'id': 'nope'}])
+
+    current = store.get(paper['paper_id'])
+    assert current['version'] == 1
+    assert ids(current) == ['q1', 'q2', 'q3']
+
+
+def test_old_versions_are_folded(store, paper):
+    for n in range(4, 9):
+        store.update(paper['paper_id'], [{'op': 'add', 'question': question(f"q{n}")}])
+
+    assert store.get(paper['paper_id'])['version'] == 6
+    assert ids(store.get(paper['paper_id'], version=3)) == ['q1', 'q2', 'q3', 'q4', 'q5']
+    # Only the last keep_versions edits are kept
+    assert store.get(paper['paper_id'], version=2) is None
+    assert store.get(paper['paper_id'], version=7) is None
+
+
+def test_unknown_papers(store):
+    assert store.get('p_000000000000') is None
+    assert store.get('../../etc/passwd') is None
+    assert store.update('p_000000000000', [{'op': 'delete', 'id': 'q1'}]) is None
+
+
+@pytest.mark.parametrize('value, version', [(None, None), (3, 3), ('3', 3), (2.0, 2)])
+def test_parse_version(value, version):
+    assert parse_version(value) == version
+
+
+@pytest.mark.parametrize('value', [0, -1, 'two', 1.5, True, [], ''])
+def test_parse_version_rejects(value):
+    with pytest.raises(PaperEditError):
+        parse_version(value)
+
+
+def test_invalid_versions_are_edit_errors(store, paper):
+    with pytest.raises(PaperEditError):
+        store.get(paper['paper_id'], version='latest')
+    with pytest.raises(PaperEditError):
+        store.update(paper['paper_id'], [{'op': 'delete', 'id': 'q1'}], base_version='1.5')
+
+
+@pytest.mark.parametrize('edit', [
+    {'op': 'rename'},
+    {'op': 'reorder', 'order': ['q1', 'q1']},
+    {'op': 'replace', 'id': 'q1'},
+    {'op': 'add', 'question': question('q1')},
+    {'op': 'set', 'questions': 'q1'},
+])
+def test_apply_edit_rejects(edit):
+    with pytest.raises(PaperEditError):
+        apply_edit([question('q1'), question('q2')], edit)
+
+
+def test_apply_edit_reorder_and_replace():
+    questions = [question('q1'), question('q2')]
+
+    assert ids({'questions': apply_edit(questions, {'op': 'reorder', 'order': ['q2', 'q1']})}) == ['q2', 'q1']
+    replaced = apply_edit(questions, {'op': 'replace', 'id': 'q2', 'question': question('q9', 'New?')})
+    assert replaced == [question('q1'), question('q9', 'New?')]
@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+from past_papers import (
+    _FOOTER_RE, _LABEL_RUN_RE, _SECTION_RE, _parse_marks, _plausible_marks,
+    is_past_paper, parse_past_paper,
+)
+
+SAMPLE_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'uploads', 'combined_extracted_text_34.json')
+
+# What the bundled sample papers must parse to: exam title, minimum number
+# of questions and question numbers that have to be found
+SAMPLE_EXPECTATIONS = {
+    '2019 (2) (4).pdf': {'exam': 'Spring Mid-Semester Examination-2019', 'questions': 11, 'numbers': [1, 2, 3, 4]},
+    '2019 (3) (3).pdf': {'exam': 'Spring End Semester Examination-2019', 'questions': 20, 'numbers': [1, 2, 3, 8]},
+    '2020 (4).pdf': {'exam': 'Spring Mid Semester Examination-2020', 'questions': 9, 'numbers': [1, 2, 3]},
+    '2024 (2) (4).pdf': {'exam': 'Autumn Mid Semester Examination-2024', 'questions': 13, 'numbers': [1, 2, 3, 4, 5]},
+    '2024 (3) (2).pdf': {'exam': 'Autumn End Semester Examination-2024', 'questions': 20, 'numbers': [1, 7]},
+}
+
+SYNTHETIC_PAPER = """Spring End Semester Examination-2023
+Distributed Operating Systems
+Full Marks: 50 Time: 3 hours
+Answer any five questions.
+Ql. (a) What is a distributed operating system? Explain its goals. [2.5 Marks]
+(b) Explain Lamport's logical clocks with an example. [2.5 Marks]
+SECTION-B
+Q2. Describe the bully algorithm for leader election in detail. [5 Marks]
+Q3. Explain the two phase commit protocol and its failure cases. [5 Marks]
+"""
+
+
+@pytest.fixture(scope='module')
+def sample_papers():
+    with open(SAMPLE_CORPUS, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    papers = {}
+    for source, pages in corpus.items():
+        if isinstance(pages, dict):
+            pages = pages.get('text', '')
+        text = '\n'.join(pages) if isinstance(pages, list) else str(pages)
+        papers[source] = parse_past_paper(text, source)
+    return papers
+
+
+def test_sample_corpus_is_covered(sample_papers):
+    assert set(SAMPLE_EXPECTATIONS) <= set(sample_papers)
+
+
+@pytest.mark.parametrize('source', sorted(SAMPLE_EXPECTATIONS))
+def test_sample_paper(sample_papers, source):
+    result = sample_papers[source]
+    expected = SAMPLE_EXPECTATIONS[source]
+    questions = result['questions']
+    numbers = [q['question_number'] for q in questions if q['question_number'] is not None]
+
+    assert result['is_past_paper']
+    assert result['exam'] == expected['exam']
+    assert len(questions) >= expected['questions']
+    assert set(expected['numbers']) <= set(numbers)
+    assert numbers == sorted(numbers)
+
+
+@pytest.mark.parametrize('source', sorted(SAMPLE_EXPECTATIONS))
+def test_sample_paper_layout_is_removed(sample_papers, source):
+    for q in sample_papers[source]['questions']:
+        label = f"Q{q['question_number']}{q['part'] or ''}"
+        assert q['marks'] is None or _plausible_marks(q['marks']), f"{label}: implausible marks {q['marks']}"
+        for pattern in (_SECTION_RE, _LABEL_RUN_RE, _FOOTER_RE):
+            assert not pattern.search(q['text']), f"{label}: paper layout left in the text: {q['text'][:80]}"
+
+
+def test_plain_text_is_not_a_past_paper():
+    text = "Lamport clocks order events in a distributed system."
+    assert not is_past_paper(text)
+    result = parse_past_paper(text)
+    assert result == {"is_past_paper": False, "exam": None, "questions": [], "leftover": text}
+
+
+def test_parts_sections_and_marks():
+    result = parse_past_paper(SYNTHETIC_PAPER, 'synthetic.pdf')
+
+    assert result['exam'] == 'Spring End Semester Examination-2023'
+    assert [(q['question_number'], q['part'], q['marks']) for q in result['questions']] == [
+        (1, 'a', 2.5), (1, 'b', 2.5), (2, None, 5), (3, None, 5),
+    ]
+    assert result['questions'][2]['text'] == 'Describe the bully algorithm for leader election in detail.'
+    assert all(q['source'] == 'synthetic.pdf' for q in result['questions'])
+    assert result['leftover'] == ''
+
+
+@pytest.mark.parametrize('token, marks', [
+    ('2.5', [2.5]),
+    (' 2.5 Marks ', [2.5]),
+    ('1x5', [1.0] * 5),
+    ('2.5+2.5', [2.5, 2.5]),
+])
+def test_parse_marks(token, marks):
+    assert _parse_marks(token) == marks
+
+
+def test_ocr_marks_are_implausible():
+    assert _plausible_marks(2.5)
+    assert not _plausible_marks(25)
+    assert not _plausible_marks(2.3)
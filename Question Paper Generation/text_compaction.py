@@ -0,0 +1,234 @@
+"""Prompt compaction for extracted course text.
+
+Extracted text carries a lot of tokens the model does not need: runs of
+whitespace, page headers and footers repeated on every page, exam
+instructions repeated in every past paper, and OCR noise.  compact_text()
+strips those and then fills a token budget with what is left, reporting
+how many tokens the cleanup saved.
+"""
+import re
+import unicodedata
+
+# Rough characters-per-token ratio for English text on Gemini models
+CHARS_PER_TOKEN = 4
+
+# Segments shorter than this many key words are never treated as boilerplate
+MIN_BOILERPLATE_WORDS = 4
+
+# Characters that make up operator tokens worth keeping ('=', '<=', '->', '!=', ...)
+_OPERATOR_CHARS = set('-&+=/<>%*!|^~:')
+# Operator tokens longer than this ('=====', '-------') are rules drawn with keys
+MAX_OPERATOR_LENGTH = 3
+
+
+
+def _mark_class():
+    """Regex class body of the combining marks (category M) in the Basic Multilingual Plane."""
+    ranges = []
+    for code in range(0x300, 0x10000):
+        if unicodedata.category(chr(code)).startswith('M'):
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    return ''.join(f"\\u{start:04x}-\\u{end:04x}" for start, end in ranges)
+
+
+# A word: letters and digits plus the combining marks that belong to them.  Python's \w leaves
+# out marks such as Devanagari vowel signs and the virama, which would split 'कंप्यूटर' into pieces.
+WORD_PATTERN = rf'[^\W_](?:[^\W_]|[{_mark_class()}])*'
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.?!])\s+')
+_SPACES_RE = re.compile(r'[ \t\f\v ]+')
+_ALNUM_RE = re.compile(r'[^\W_]', re.UNICODE)
+_KEY_WORD_RE = re.compile(WORD_PATTERN)
+# Page numbers in running headers and footers ('Page 3', 'page 3 of 10')
+_PAGE_NUMBER_RE = re.compile(r'\bpage\s+\d+(\s+of\s+\d+)?\b')
+# Runs like 'eee' or 'ooo' (but not roman numerals such as 'iii')
+_REPEATED_CHAR_RE = re.compile(r'^([^\W\divxlc])\1{2,}$', re.IGNORECASE | re.UNICODE)
+_COMMON_PUNCTUATION = set('\'".,;:!?()[]{}+-*/=<>%&#$^_~|\\')
+
+
+def estimate_tokens(text):
+    """Estimate the number of model tokens in text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _is_math_symbol(c):
+    """Math symbols and arrows (Unicode category Sm, e.g. '→', '≤', '∑')."""
+    return unicodedata.category(c) == 'Sm' or '\u2190' <= c <= '\u21ff'
+
+
+def _is_mark(c):
+    """Combining marks (category M), e.g. Devanagari vowel signs and the virama."""
+    return unicodedata.category(c).startswith('M')
+
+
+def _is_operator(token):
+    """True for operator tokens such as '=', '<=', '->', '→' or '∑'."""
+    return 0 < len(token) <= MAX_OPERATOR_LENGTH and all(c in _OPERATOR_CHARS or _is_math_symbol(c) for c in token)
+
+
+def _is_garbage_token(token):
+    """Return True for OCR debris such as '°', '=====', 'eee' or '©-'."""
+    if _is_operator(token):
+        return False
+    alnum = len(_ALNUM_RE.findall(token))
+    if alnum == 0:
+        return True
+    core = token.strip('\'".,;:!?()[]{}')
+    if _REPEATED_CHAR_RE.match(core):
+        return True
+    # Stray glyphs that are neither letters (with their combining marks), digits, math symbols nor ordinary punctuation
+    unusual = sum(1 for c in token
+                  if c not in _COMMON_PUNCTUATION and not c.isalnum() and not _is_mark(c) and not _is_math_symbol(c))
+    return unusual / len(token) > 0.3
+
+
+def _clean_segment(segment):
+    """Drop garbage tokens from a segment. Returns '' if nothing useful remains."""
+    tokens = [t for t in segment.split(' ') if t and not _is_garbage_token(t)]
+    if not tokens:
+        return ''
+    # A segment made of one- and two-letter fragments is OCR noise, unless it
+    # is a formula, a line of code or a statement with a value ('x = y + 1',
+    # 'if a < b', 'x is 5')
+    if (len(tokens) >= 3 and all(len(t.strip('\'".,;:!?()[]{}')) <= 2 for t in tokens)
+            and not any(_is_operator(t) or any(c.isdigit() for c in t) for t in tokens)):
+        return ''
+    return ' '.join(tokens)
+
+
+def _boilerplate_key(segment):
+    """Key used to recognise a segment repeated across pages or papers.
+
+    Numbers are part of the key ('x is 5' and 'x is 7' differ), except page
+    numbers, so a running footer still matches on every page.
+    """
+    words = _KEY_WORD_RE.findall(_PAGE_NUMBER_RE.sub('page', segment.lower()))
+    # Only words of three or more letters count towards the minimum
+    if sum(1 for w in words if len(w) >= 3 and not w.isdigit()) < MIN_BOILERPLATE_WORDS:
+        return None
+    return ' '.join(words)
+
+
+class _LineCompactor:
+    """Cleans lines one at a time, remembering boilerplate already seen."""
+
+    def __init__(self):
+        self.seen = set()
+
+    def compact(self, line):
+        """Return the cleaned line, or '' if nothing is left of it.
+
+        The line is split into sentence-like segments; a segment whose key
+        words were already seen (a page header, exam instructions, a footer
+        with a different page number) is kept only the first time.
+        """
+        # NFC only: compatibility folding (NFKC) turns 'n²' into 'n2' and '3½' into '31⁄2'
+        line = unicodedata.normalize('NFC', line).rstrip()
+        text = line.lstrip()
+        if not text:
+            return ''
+        # Indentation carries meaning in code blocks; only whitespace runs inside the line are collapsed
+        indent = line[:len(line) - len(text)]
+        line = _SPACES_RE.sub(' ', text)
+
+        kept = []
+        for segment in _SENTENCE_SPLIT_RE.split(line):
+            segment = _clean_segment(segment)
+            if not segment:
+                continue
+            key = _boilerplate_key(segment)
+            if key is not None:
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+            kept.append(segment)
+        return f"{indent}{' '.join(kept)}" if kept else ''
+
+
+def strip_repeated_segments(text, min_repeats=2):
+    """Remove every occurrence of sentence-like segments repeated min_repeats or more times.
+
+    Unlike compaction, which keeps the first copy, this drops page headers
+    and footers entirely, e.g. before splitting a document into questions.
+    """
+    lines = [_SENTENCE_SPLIT_RE.split(_SPACES_RE.sub(' ', line).strip()) for line in text.splitlines()]
+    # Key segments on their cleaned form so OCR tails ('ns', 'eee') do not hide repeats
+    keys = [[_boilerplate_key(_clean_segment(s)) for s in segments] for segments in lines]
+    counts = {}
+    for line_keys in keys:
+        for key in line_keys:
+            if key is not None:
+                counts[key] = counts.get(key, 0) + 1
+
+    kept_lines = []
+    for segments, line_keys in zip(lines, keys):
+        kept = [s for s, key in zip(segments, line_keys) if counts.get(key, 0) < min_repeats]
+        kept_lines.append(' '.join(kept))
+    return '\n'.join(kept_lines)
+
+
+def iter_compacted_lines(text):
+    """Yield the non-empty cleaned lines of text with repeated boilerplate removed."""
+    compactor = _LineCompactor()
+    for raw_line in text.splitlines():
+        line = compactor.compact(raw_line)
+        if line:
+            yield line
+
+
+def compact_text(text, token_budget, count_tokens=estimate_tokens):
+    """Compact text and fill at most token_budget tokens with it.
+
+    text may also be any object with len() and splitlines(keepends), such
+    as a document in the corpus store, which is then read lazily.
+
+    Returns (compacted_text, stats).  stats reports the tokens the included
+    source text would have cost raw ('source_tokens'), what it costs after
+    compaction ('prompt_tokens'), the difference ('tokens_saved') and whether
+    the budget cut the text short ('truncated').
+    """
+    compactor = _LineCompactor()
+    lines = []
+    used = 0
+    consumed_chars = 0
+    truncated = False
+
+    for raw_line in text.splitlines(keepends=True):
+        line = compactor.compact(raw_line)
+        if not line:
+            consumed_chars += len(raw_line)
+            continue
+
+        cost = count_tokens(line) + 1  # +1 for the joining newline
+        if used + cost > token_budget:
+            # Fill what is left of the budget with the head of this line
+            remaining_chars = (token_budget - used - 1) * CHARS_PER_TOKEN
+            if remaining_chars > 0:
+                head = line[:remaining_chars].rsplit(' ', 1)[0]
+                if head:
+                    lines.append(head)
+                    # Count only the share of the raw line that made it in
+                    consumed_chars += len(raw_line) * len(head) // len(line)
+            truncated = True
+            break
+        lines.append(line)
+        used += cost
+        consumed_chars += len(raw_line)
+
+    compacted = '\n'.join(lines)
+    total_tokens = (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    source_tokens = (consumed_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if truncated else total_tokens
+    prompt_tokens = count_tokens(compacted)
+
+    stats = {
+        'token_budget': token_budget,
+        'total_tokens': total_tokens,
+        'source_tokens': source_tokens,
+        'prompt_tokens': prompt_tokens,
+        'tokens_saved': max(source_tokens - prompt_tokens, 0),
+        'truncated': truncated,
+    }
+    return compacted, stats
@@ -0,0 +1,174 @@
+"""Topic coverage of a generated paper over its source material.
+
+Source chunks and questions are embedded as hashed TF-IDF vectors (sparse,
+CPU only) and compared in one chunk x question similarity product.  The
+report says which parts of the material no question touches, so a
+follow-up generation pass can target just those gaps.
+"""
+import re
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+from text_compaction import WORD_PATTERN
+
+N_FEATURES = 2 ** 18
+
+# Minimum cosine similarity for a question to count as covering a chunk
+COVERAGE_THRESHOLD = 0.1
+
+# Words of any script, two characters or longer (a Hindi chunk must have features too)
+_TOKEN_RE = re.compile(WORD_PATTERN)
+_STOP_WORDS = frozenset("""
+    the and for are with that this from what which when where why how who its their there these those
+    into than then them they was were will would can could should may might been being have has had not
+    but all any each other such only also more most some very explain describe discuss write give list
+    state define following between using used use example examples question answer
+""".split())
+
+
+def _features(text):
+    """Hashed unigram and bigram feature ids of text."""
+    words = [w for w in _TOKEN_RE.findall(text.lower()) if len(w) >= 2 and w not in _STOP_WORDS]
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return [zlib.crc32(g.encode('utf-8')) % N_FEATURES for g in grams]
+
+
+def hashed_term_counts(texts):
+    """Return a (len(texts) x N_FEATURES) CSR matrix of term counts."""
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        features = _features(text)
+        rows.extend([i] * len(features))
+        cols.extend(features)
+    data = np.ones(len(cols), dtype=np.float32)
+    counts = sparse.csr_matrix(
+        (data, (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))),
+        shape=(len(texts), N_FEATURES)
+    )
+    counts.sum_duplicates()
+    return counts
+
+
+def _tfidf(counts, idf):
+    """Sublinear TF times IDF, L2-normalised per row."""
+    weighted = counts.copy()
+    weighted.data = 1.0 + np.log(weighted.data)
+    weighted = weighted.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(weighted).tocsr()
+
+
+def question_text(q):
+    """Text of a question used for matching: statement, answer and explanation."""
+    parts = [q.get('text'), q.get('correct_answer'), q.get('explanation')]
+    return ' '.join(str(p) for p in parts if p)
+
+
+def coverage_matrix(chunks, questions):
+    """Return the (chunks x questions) cosine similarity matrix as a CSR matrix.
+
+    IDF weights come from the source chunks, so terms that appear all over
+    the material count for little.
+    """
+    chunk_counts = hashed_term_counts(chunks)
+    question_counts = hashed_term_counts([question_text(q) for q in questions])
+
+    document_frequency = np.bincount(chunk_counts.indices, minlength=N_FEATURES)
+    idf = (np.log((1 + len(chunks)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+
+    chunk_vectors = _tfidf(chunk_counts, idf)
+    question_vectors = _tfidf(question_counts, idf)
+    return chunk_vectors.dot(question_vectors.T).tocsr()
+
+
+def coverage_report(chunks, questions, num_sections=None, threshold=COVERAGE_THRESHOLD):
+    """Score how evenly questions cover the source chunks.
+
+    Chunks are grouped into num_sections contiguous sections (by default
+    one per question, so a paper can in principle cover every section).
+    Returns a dict with per-chunk best similarity, the uncovered chunk and
+    section indices, and how many questions fall on each section.
+    """
+    if not chunks:
+        return {"chunks": 0, "sections": 0, "covered_sections": 0, "coverage": 1.0,
+                "uncovered_sections": [], "uncovered_chunks": [], "questions_per_section": [],
+                "question_sections": []}
+
+    num_sections = max(1, min(num_sections or len(questions) or 1, len(chunks)))
+    # Section index of every chunk, in document order
+    chunk_section = (np.arange(len(chunks)) * num_sections) // len(chunks)
+
+    if questions:
+        similarity = coverage_matrix(chunks, questions)
+        best_per_chunk = np.asarray(similarity.max(axis=1).todense()).ravel()
+        best_chunk = np.asarray(similarity.argmax(axis=0)).ravel()
+        best_per_question = np.asarray(similarity.max(axis=0).todense()).ravel()
+        # A question that matches nothing is not counted against any section
+        question_sections = np.where(best_per_question >= threshold, chunk_section[best_chunk], -1)
+    else:
+        best_per_chunk = np.zeros(len(chunks))
+        question_sections = np.array([], dtype=int)
+
+    chunk_covered = best_per_chunk >= threshold
+    section_covered = np.zeros(num_sections, dtype=bool)
+    np.logical_or.at(section_covered, chunk_section, chunk_covered)
+    questions_per_section = np.bincount(question_sections[question_sections >= 0], minlength=num_sections)
+
+    return {
+        "chunks": len(chunks),
+        "sections": num_sections,
+        "covered_sections": int(section_covered.sum()),
+        "coverage": round(float(section_covered.mean()), 3),
+        "uncovered_sections": np.flatnonzero(~section_covered).tolist(),
+        "uncovered_chunks": np.flatnonzero(~chunk_covered).tolist(),
+        "questions_per_section": questions_per_section.tolist(),
+        "question_sections": question_sections.tolist(),
+        "chunk_section": chunk_section.tolist(),
+        "best_similarity": np.round(best_per_chunk, 3).tolist(),
+    }
+
+
+def gap_chunks(report, limit):
+    """Pick up to limit uncovered chunks, one per uncovered section, spread over the material."""
+    sections = report['uncovered_sections']
+    if not sections or limit <= 0:
+        return []
+    if len(sections) > limit:
+        picks = np.linspace(0, len(sections) - 1, limit).round().astype(int)
+        sections = [sections[i] for i in picks]
+
+    chunk_section = report['chunk_section']
+    similarity = report['best_similarity']
+    chosen = []
+    for section in sections:
+        members = [i for i in report['uncovered_chunks'] if chunk_section[i] == section]
+        if members:
+            # The least covered chunk is the one the paper misses most
+            chosen.append(min(members, key=lambda i: similarity[i]))
+    return chosen
+
+
+def redundant_questions(report, count):
+    """Indices of up to count questions from the most over-represented sections."""
+    per_section = list(report['questions_per_section'])
+    question_sections = report['question_sections']
+    chosen = []
+    for _ in range(count):
+        if not per_section or max(per_section) <= 1:
+            break
+        section = int(np.argmax(per_section))
+        candidates = [i for i, s in enumerate(question_sections) if s == section and i not in chosen]
+        if not candidates:
+            break
+        chosen.append(candidates[-1])
+        per_section[section] -= 1
+    return chosen
+
+
+def summarize(report):
+    """Report without the per-chunk arrays, for API responses."""
+    keys = ("chunks", "sections", "covered_sections", "coverage", "uncovered_sections", "questions_per_section")
+    return {key: report[key] for key in keys}